@@ -1,6 +1,26 @@
 #!/usr/bin/env python3
 
+import argparse
+import functools
+import glob
 import json
+import os
+import shutil
+import tempfile
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+CHUNK_SIZE = 1 << 20
+PART_BYTES = 32 << 20
+# history encodings: pasted into every later user turn, referenced by prefix, or references expanded
+INLINE = "inline"
+REFERENCE = "ref"
+MATERIALIZE = "materialize"
+DEFAULT_TOKENIZER = "cl100k_base"
+APPROX_TOKENIZER = "approx"
+_decoder = json.JSONDecoder()
+_encoder = json.JSONEncoder(indent=2)
+
 
 def extract_assistant_response(turn):
     try:
@@ -12,51 +32,452 @@ def extract_assistant_response(turn):
         pass
     return ""
 
-def add_conversation_history(input_file, output_file):
-    with open(input_file, 'r') as f:
-        data = json.load(f)
-    
-    for conversation in data["conversations"]:
-        user_indices = []
-        for i, turn in enumerate(conversation):
-            if turn["role"] == "user":
-                user_indices.append(i)
-        
-        if len(user_indices) <= 1:
+
+def _answers(conversation):
+    """
+    user turn positions, and for each the position of the first assistant turn after it with a
+    RespondToUserTool response (None if there is none), found in one backward pass
+    """
+    user_indices = [i for i, turn in enumerate(conversation) if turn["role"] == "user"]
+    answered_by = {}
+    responses = {}
+    answer = None
+    for i in range(len(conversation) - 1, user_indices[0] - 1 if user_indices else 0, -1):
+        turn = conversation[i]
+        if turn["role"] == "user":
+            answered_by[i] = answer
+        elif turn["role"] == "assistant":
+            response = extract_assistant_response(turn)
+            if response:
+                answer = i
+                responses[i] = response
+    return user_indices, answered_by, responses
+
+
+@functools.lru_cache(maxsize=None)
+def token_counter(tokenizer=DEFAULT_TOKENIZER):
+    """
+    count_tokens(text) for `tokenizer`: a tiktoken encoding name, a Hugging Face tokenizer.json path,
+    or "approx" (4 characters a token, no dependency). counts are memoized, so a history line
+    repeated across turns and conversations is tokenized once per process.
+    """
+    if tokenizer == APPROX_TOKENIZER:
+        def count(text):
+            return (len(text) + 3) // 4
+    elif tokenizer.endswith(".json"):
+        try:
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise ImportError("tokenizer.json files require tokenizers: pip install tokenizers") from e
+        hf_tokenizer = Tokenizer.from_file(tokenizer)
+
+        def count(text):
+            return len(hf_tokenizer.encode(text, add_special_tokens=False).ids)
+    else:
+        try:
+            import tiktoken
+        except ImportError as e:
+            raise ImportError("tiktoken encodings require tiktoken: pip install tiktoken") from e
+        encoding = tiktoken.get_encoding(tokenizer)
+
+        def count(text):
+            return len(encoding.encode(text, disallowed_special=()))
+    return functools.lru_cache(maxsize=1 << 18)(count)
+
+
+class _History:
+    """
+    the exchanges of one conversation joined into one growing string. with a token budget, the
+    window later user turns see drops its oldest exchanges until the rest fits; an exchange costs
+    its memoized User: and Assistant: line counts plus one token for each newline.
+    """
+
+    def __init__(self, budget=None):
+        self.text = ""
+        self.bounds = []  # (start, end) of each exchange in text
+        self.start = 0    # first exchange in the window
+        self.max_tokens = budget[0] if budget else None
+        self.count_tokens = token_counter(budget[1]) if budget else None
+        self.tokens = []
+        self.window_tokens = 0
+
+    def add(self, user_msg, response):
+        user_line = f"User: {user_msg}"
+        assistant_line = f"Assistant: {response}"
+        begin = len(self.text) + 1 if self.text else 0
+        self.text = f"{self.text}\n{user_line}\n{assistant_line}" if self.text else f"{user_line}\n{assistant_line}"
+        self.bounds.append((begin, len(self.text)))
+        if self.max_tokens is not None:
+            tokens = self.count_tokens(user_line) + self.count_tokens(assistant_line) + 2
+            self.tokens.append(tokens)
+            self.window_tokens += tokens
+            while self.window_tokens > self.max_tokens:
+                self.window_tokens -= self.tokens[self.start]
+                self.start += 1
+
+    def window(self, start=None, end=None):
+        """the exchanges [start, end) joined, by default the current window"""
+        start = self.start if start is None else start
+        end = len(self.bounds) if end is None else end
+        if start >= end:
+            return ""
+        return self.text[self.bounds[start][0]:self.bounds[end - 1][1]]
+
+
+def _with_history(history, user_msg):
+    return f"<conversation_history>\n{history}\n</conversation_history> {user_msg}"
+
+
+def add_history(conversation, budget=None, stats=None):
+    """
+    prefixes every user turn after the first with the User/Assistant exchanges before it, in place.
+    each user message is paired with the first RespondToUserTool response after it; _answers finds
+    those and one forward pass grows the history, so the work is linear in the turns.
+    args:
+        budget: (max_tokens, tokenizer) to keep only the latest exchanges that fit, or None
+        stats: Counter that gets "truncated" += turns whose history lost exchanges to the budget
+    """
+    user_indices, answered_by, responses = _answers(conversation)
+    if len(user_indices) <= 1:
+        return conversation
+
+    history = _History(budget)
+    for n, user_idx in enumerate(user_indices):
+        user_msg = conversation[user_idx]["content"]
+        if n:
+            conversation[user_idx]["content"] = _with_history(history.window(), user_msg)
+            if stats is not None and history.start:
+                stats["truncated"] += 1
+        if answered_by[user_idx] is not None:
+            history.add(user_msg, responses[answered_by[user_idx]])
+    return conversation
+
+
+def _escaped_size(text, ensure_ascii):
+    """bytes `text` takes inside an encoded JSON string; additive over concatenation"""
+    return len(json.dumps(text, ensure_ascii=ensure_ascii).encode("utf-8")) - 2
+
+
+def reference_history(conversation, budget=None, stats=None, ensure_ascii=True):
+    """
+    the reference form of add_history, in place: user turns keep their message, each one after the
+    first gets `"history": k` (its history is the first k exchanges, from `"history_start"` on
+    when a budget dropped the oldest ones) and each answered one gets `"answered_by": j` (the
+    assistant turn holding its response), so every exchange is stored once. materialize_history
+    turns it back into the add_history form.
+    args:
+        budget, stats: as for add_history; stats also gets "inline_bytes" += bytes the inline
+            form would add to the encoded user messages
+        ensure_ascii: whether the output escapes non-ASCII, for the byte count
+    """
+    user_indices, answered_by, responses = _answers(conversation)
+    if len(user_indices) <= 1:
+        return conversation
+
+    wrapper_size = _escaped_size(_with_history("", ""), ensure_ascii)
+    newline_size = _escaped_size("\n", ensure_ascii)
+    history = _History(budget)
+    # escaped size of the exchanges before each one
+    size_before = [0]
+    for n, user_idx in enumerate(user_indices):
+        turn = conversation[user_idx]
+        if n:
+            turn["history"] = len(history.bounds)
+            if history.start:
+                turn["history_start"] = history.start
+            if stats is not None:
+                window = len(history.bounds) - history.start
+                window_size = size_before[-1] - size_before[history.start] + newline_size * max(window - 1, 0)
+                stats["inline_bytes"] += wrapper_size + window_size
+                stats["truncated"] += bool(history.start)
+        if answered_by[user_idx] is not None:
+            turn["answered_by"] = answered_by[user_idx]
+            history.add(turn["content"], responses[answered_by[user_idx]])
+            begin, end = history.bounds[-1]
+            size_before.append(size_before[-1] + _escaped_size(history.text[begin:end], ensure_ascii))
+    return conversation
+
+
+def materialize_history(conversation):
+    """
+    expands a reference_history conversation into the add_history form, in place, for export or
+    training time; conversations without references pass through unchanged
+    """
+    history = _History()
+    for turn in conversation:
+        if turn["role"] != "user" or ("history" not in turn and "answered_by" not in turn):
+            continue
+        user_msg = turn["content"]
+        if "history" in turn:
+            turn["content"] = _with_history(history.window(turn.pop("history_start", 0), turn.pop("history")), user_msg)
+        if "answered_by" in turn:
+            history.add(user_msg, extract_assistant_response(conversation[turn.pop("answered_by")]))
+    return conversation
+
+
+def iter_materialized(path):
+    """yields the conversations of a reference-encoded .json or .jsonl output with their history inlined"""
+    with open(path, 'r') as f:
+        conversations = iter_jsonl_conversations(f) if path.endswith(".jsonl") else iter_json_conversations(f)
+        for conversation in conversations:
+            yield materialize_history(conversation)
+
+
+class _Stream:
+    """a text file read in chunks, with a cursor into the part not consumed yet"""
+
+    def __init__(self, f):
+        self.f = f
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        chunk = self.f.read(CHUNK_SIZE)
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        self.eof = not chunk
+
+    def peek(self):
+        """next non-whitespace character, or "" at the end of the file"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos].isspace():
+                self.pos += 1
+            if self.pos < len(self.buffer) or self.eof:
+                return self.buffer[self.pos:self.pos + 1]
+            self.fill()
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"expected {char!r} at offset {self.pos} of the current chunk")
+        self.pos += 1
+
+    def value(self):
+        """decodes the next JSON value, reading more chunks until it is complete"""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+                # a number cut off at the end of the chunk decodes too early
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill()
+
+
+def _iter_array(stream):
+    stream.expect("[")
+    if stream.peek() == "]":
+        stream.pos += 1
+        return
+    while True:
+        yield stream.value()
+        if stream.peek() == ",":
+            stream.pos += 1
+            continue
+        stream.expect("]")
+        return
+
+
+def iter_json_conversations(f):
+    """
+    yields the conversations of a `{"conversations": [...]}` (or bare list) JSON file one at a time,
+    holding a single chunk and the conversation being decoded in memory
+    """
+    stream = _Stream(f)
+    if stream.peek() == "[":
+        yield from _iter_array(stream)
+        return
+    stream.expect("{")
+    while stream.peek() != "}":
+        key = stream.value()
+        stream.expect(":")
+        if key == "conversations":
+            yield from _iter_array(stream)
+        else:
+            stream.value()
+        if stream.peek() == ",":
+            stream.pos += 1
+    stream.pos += 1
+
+
+def iter_jsonl_conversations(f):
+    for line in f:
+        if line.strip():
+            yield json.loads(line)
+
+
+def _encoded_size(conversation, jsonl):
+    if jsonl:
+        return len(json.dumps(conversation, ensure_ascii=False).encode("utf-8")) + 1
+    return sum(len(chunk) + 4 * chunk.count("\n") for chunk in _encoder.iterencode(conversation))
+
+
+def _write_conversations(out, conversations, jsonl, history=INLINE, budget=None, after_earlier=False):
+    """
+    adds history to each conversation the `history` way and writes it: one line each for JSONL,
+    otherwise the "\n    "-indented items of the json.dump(..., indent=2) layout, comma separated.
+    with `after_earlier` even the first item is preceded by a comma, so parts written apart can be
+    concatenated.
+    returns: Counter of "conversations", "truncated" turns and, for references, "inline_bytes"
+        the inline history would take and "reference_bytes" the references take
+    """
+    stats = Counter()
+    for conversation in conversations:
+        if history == REFERENCE:
+            base_size = _encoded_size(conversation, jsonl)
+            reference_history(conversation, budget, stats, ensure_ascii=not jsonl)
+            stats["reference_bytes"] += _encoded_size(conversation, jsonl) - base_size
+        elif history == MATERIALIZE:
+            materialize_history(conversation)
+        else:
+            add_history(conversation, budget, stats)
+        if jsonl:
+            out.write(json.dumps(conversation, ensure_ascii=False) + "\n")
+        else:
+            out.write(",\n    " if stats["conversations"] or after_earlier else "\n    ")
+            for chunk in _encoder.iterencode(conversation):
+                out.write(chunk.replace("\n", "\n    "))
+        stats["conversations"] += 1
+    return stats
+
+
+def _report(output_file, stats, history, budget):
+    if budget and history != MATERIALIZE:
+        print(f"History cut to {budget[0]} tokens in {stats['truncated']} user turns")
+    if history == REFERENCE:
+        # how much smaller the file is than the inline form would be
+        size = os.path.getsize(output_file)
+        inline_total = size - stats["reference_bytes"] + stats["inline_bytes"]
+        saved = 1 - size / inline_total if inline_total else 0
+        print(f"History by reference: {size / 1e6:.1f} MB written, {inline_total / 1e6:.1f} MB inline ({saved:.0%} saved)")
+
+
+def add_conversation_history(input_file, output_file, history=INLINE, max_history_tokens=None, tokenizer=DEFAULT_TOKENIZER):
+    """
+    streams conversations from a `{"conversations": [...]}` JSON file or a JSONL file through
+    add_history (or, per `history`, reference_history / materialize_history) and writes each one as
+    soon as it is done, in the same format as the input. with `max_history_tokens`, each history
+    keeps only the latest exchanges that fit, counted with token_counter(tokenizer).
+    """
+    budget = (max_history_tokens, tokenizer) if max_history_tokens is not None else None
+    jsonl = input_file.endswith(".jsonl")
+    with open(input_file, 'r') as src, open(output_file, 'w') as out:
+        if jsonl:
+            stats = _write_conversations(out, iter_jsonl_conversations(src), jsonl, history, budget)
+        else:
+            # same bytes json.dump(..., indent=2) would produce for the whole file
+            out.write('{\n  "conversations": [')
+            stats = _write_conversations(out, iter_json_conversations(src), jsonl, history, budget)
+            out.write("\n  ]\n}" if stats["conversations"] else "]\n}")
+
+    print(f"Processed {stats['conversations']} conversations")
+    _report(output_file, stats, history, budget)
+    return stats["conversations"]
+
+
+def expand_inputs(patterns):
+    """input paths matching any of the glob patterns, sorted within each pattern, without repeats"""
+    paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern))
+        if not matches:
+            raise FileNotFoundError(f"no input matches {pattern}")
+        paths.extend(path for path in matches if path not in paths)
+    return paths
+
+
+def plan_parts(paths, part_bytes):
+    """
+    splits the inputs into (path, start, end) parts in a fixed order: JSONL files into byte ranges
+    of about `part_bytes`, JSON files whole (end None), since their items cannot be found without
+    parsing from the top
+    """
+    parts = []
+    for path in paths:
+        size = os.path.getsize(path)
+        if not path.endswith(".jsonl") or size <= part_bytes:
+            parts.append((path, 0, None))
             continue
-        
-        conversation_history = []
-        
-        for i, user_idx in enumerate(user_indices):
-            if i == 0:
-                user_msg = conversation[user_idx]["content"]
-                
-                for j in range(user_idx + 1, len(conversation)):
-                    if conversation[j]["role"] == "assistant":
-                        response = extract_assistant_response(conversation[j])
-                        if response:
-                            conversation_history.append(f"User: {user_msg}")
-                            conversation_history.append(f"Assistant: {response}")
-                            break
-            else:
-                original_content = conversation[user_idx]["content"]
-                history_text = "\n".join(conversation_history)
-                
-                conversation[user_idx]["content"] = f"<conversation_history>\n{history_text}\n</conversation_history> {original_content}"
-                
-                user_msg = original_content
-                for j in range(user_idx + 1, len(conversation)):
-                    if conversation[j]["role"] == "assistant":
-                        response = extract_assistant_response(conversation[j])
-                        if response:
-                            conversation_history.append(f"User: {user_msg}")
-                            conversation_history.append(f"Assistant: {response}")
-                            break
-    
-    with open(output_file, 'w') as f:
-        json.dump(data, f, indent=2)
-    
-    print(f"Processed {len(data['conversations'])} conversations")
+        parts.extend((path, start, min(start + part_bytes, size)) for start in range(0, size, part_bytes))
+    return parts
+
+
+def _iter_jsonl_range(f, start, end):
+    """conversations on the lines of a binary JSONL file that begin in [start, end)"""
+    if start:
+        # the line running across `start` belongs to the previous range
+        f.seek(start - 1)
+        f.readline()
+    while end is None or f.tell() < end:
+        line = f.readline()
+        if not line:
+            break
+        if line.strip():
+            yield json.loads(line)
+
+
+def _process_part(task):
+    path, start, end, part_file, jsonl, history, budget = task
+    with open(part_file, 'w') as out:
+        if path.endswith(".jsonl"):
+            with open(path, 'rb') as src:
+                return _write_conversations(out, _iter_jsonl_range(src, start, end), jsonl, history, budget, after_earlier=True)
+        with open(path, 'r') as src:
+            return _write_conversations(out, iter_json_conversations(src), jsonl, history, budget, after_earlier=True)
+
+
+def add_conversation_history_parallel(input_patterns, output_file, workers=None, part_bytes=PART_BYTES, history=INLINE, max_history_tokens=None, tokenizer=DEFAULT_TOKENIZER):
+    """
+    add_conversation_history over many inputs on a process pool. inputs (globs of .json / .jsonl
+    shards) are cut into parts by plan_parts, each worker writes its part to a temporary file, and
+    the parts are appended to `output_file` in plan order as they finish, so the output is the same
+    for any number of workers. the output format follows its extension (.jsonl or JSON); `history`,
+    `max_history_tokens` and `tokenizer` are as for add_conversation_history.
+    returns: number of conversations processed
+    """
+    paths = expand_inputs(input_patterns)
+    budget = (max_history_tokens, tokenizer) if max_history_tokens is not None else None
+    jsonl = output_file.endswith(".jsonl")
+    parts = plan_parts(paths, part_bytes)
+    part_dir = tempfile.mkdtemp(prefix=".history-parts-", dir=os.path.dirname(os.path.abspath(output_file)))
+    tasks = [(path, start, end, os.path.join(part_dir, f"{n:06d}.part"), jsonl, history, budget) for n, (path, start, end) in enumerate(parts)]
+
+    stats = Counter()
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor, open(output_file, 'w') as out:
+            if not jsonl:
+                out.write('{\n  "conversations": [')
+            # map yields in submission order, whichever part finishes first
+            for task, part_stats in zip(tasks, executor.map(_process_part, tasks)):
+                part_file = task[3]
+                with open(part_file, 'r') as part:
+                    if part_stats["conversations"] and not stats["conversations"] and not jsonl:
+                        part.read(1)  # the comma in front of the very first item
+                    shutil.copyfileobj(part, out)
+                os.remove(part_file)
+                stats.update(part_stats)
+            if not jsonl:
+                out.write("\n  ]\n}" if stats["conversations"] else "]\n}")
+    finally:
+        shutil.rmtree(part_dir, ignore_errors=True)
+
+    print(f"Processed {stats['conversations']} conversations from {len(paths)} files in {len(parts)} parts")
+    _report(output_file, stats, history, budget)
+    return stats["conversations"]
+
 
 if __name__ == "__main__":
-    add_conversation_history("/Users/ishaankumar/Documents/syn-data/data/sft_data_100.json", "/Users/ishaankumar/Documents/syn-data/data/sft_data_100_with_history.json") 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Prefix later user turns with the conversation so far")
+    parser.add_argument("inputs", nargs="*", default=["data/sft_data_100.json"], help="Input .json or .jsonl files or globs of shards")
+    parser.add_argument("--output", default="data/sft_data_100_with_history.json", help="Output file; .jsonl for JSONL, JSON otherwise")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: one per core)")
+    parser.add_argument("--part-mb", type=int, default=PART_BYTES >> 20, help="Size of the byte ranges JSONL inputs are split into")
+    parser.add_argument("--history", choices=[INLINE, REFERENCE, MATERIALIZE], default=INLINE, help="Paste the history into each user turn, refer to it by prefix (see reference_history), or expand a referenced file")
+    parser.add_argument("--max-history-tokens", type=int, default=None, help="Keep only the latest exchanges that fit in this many tokens")
+    parser.add_argument("--tokenizer", default=DEFAULT_TOKENIZER, help=f"tiktoken encoding, tokenizer.json path, or '{APPROX_TOKENIZER}' for 4 characters a token")
+    args = parser.parse_args()
+    add_conversation_history_parallel(args.inputs, args.output, workers=args.workers, part_bytes=args.part_mb << 20, history=args.history, max_history_tokens=args.max_history_tokens, tokenizer=args.tokenizer)
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+micro-benchmarks for the local, per-conversation hot paths of the generation pipeline.
+
+stages:
+- prompt:   generator.prompt() for every edge-case generator, round-robin over taxonomy seeds
+- parse:    generator.parse() on a FullConversation response
+- validate: load_conversation() + is_valid_conversation() on parsed rows, as in the retry loop
+- schema:   validate_assistant_turns() on parsed conversations, reported per conversation
+- write:    ConversationWriter.write() of accepted conversations to JSONL
+- export:   export_json() of that JSONL into the {"conversations": [...]} file
+- history:  data/add_conversation_history.py over a {"conversations": [...]} file
+
+every (stage, size) pair runs in its own subprocess so the reported peak RSS belongs to that
+stage alone. results are compared with benchmarks/baselines.json; --save-baseline adds or
+refreshes entries. the committed baselines come from one single-core machine, so against them the
+comparison is advisory and the run exits 0. --strict fails on a slowdown beyond --tolerance or a
+missing entry; only use it with a baseline recorded on the same machine, e.g. from the base commit
+in the same job:
+
+    cd syn-data
+    python benchmarks/bench_hot_paths.py --sizes 1000,100000,1000000
+    git stash && python benchmarks/bench_hot_paths.py --baseline /tmp/base.json --save-baseline
+    git stash pop && python benchmarks/bench_hot_paths.py --baseline /tmp/base.json --strict
+"""
+import argparse
+import importlib.util
+import itertools
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+SYN_DATA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [SYN_DATA_DIR, os.path.join(SYN_DATA_DIR, "edge_cases")]
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+HISTORY_SCRIPT = os.path.join(SYN_DATA_DIR, "..", "data", "add_conversation_history.py")
+STAGES = ["prompt", "parse", "validate", "schema", "write", "export", "history"]
+GENERATOR_MODULES = [
+    ("single_turn", "CategoryAGenerator"),
+    ("multi_turn", "CategoryBGenerator"),
+    ("ambiguity_clarification", "AmbiguityClarificationGenerator"),
+    ("tool_failure_retry", "ToolFailureRetryGenerator"),
+    ("json_error", "InvalidJSONSelfRepairGenerator"),
+]
+# distinct synthetic conversations per generator; larger sizes cycle through them
+POOL_SIZE = 200
+# stages that finish in milliseconds are timer and scheduler noise in one run: repeat them, keep the best
+MIN_SECONDS = 2.0
+MAX_REPEATS = 7
+
+
+def _generators() -> List[Tuple[Any, Any]]:
+    """(module, generator instance) pairs; instances skip curator.LLM.__init__, prompt/parse do not need it"""
+    pairs = []
+    for module_name, class_name in GENERATOR_MODULES:
+        module = importlib.import_module(module_name)
+        generator_cls = getattr(module, class_name)
+        pairs.append((module, generator_cls.__new__(generator_cls)))
+    return pairs
+
+
+def _seeds() -> List[str]:
+    from utils.taxonomy import taxonomy_index
+    return taxonomy_index().seeds
+
+
+def _conversation_pool() -> List[Tuple[Any, Any, Dict[str, Any], List[Dict[str, Any]]]]:
+    """(module, generator, input row, conversation) tuples built from the stub backend's answers"""
+    import random
+    from utils.stub_server import build_conversation
+
+    rng = random.Random(0)
+    pool = []
+    seeds = _seeds()
+    for module, generator in _generators():
+        for i in range(POOL_SIZE):
+            row = {"seed_question": seeds[i % len(seeds)], "sample_index": i}
+            pool.append((module, generator, row, build_conversation(generator.prompt(row), rng)))
+    return pool
+
+
+def bench_prompt(size: int, _: str) -> Callable[[], None]:
+    rows = [{"seed_question": seed, "sample_index": 0} for seed in _seeds()]
+    calls = [(generator, row) for _, generator in _generators() for row in rows]
+
+    def run():
+        for generator, row in itertools.islice(itertools.cycle(calls), size):
+            generator.prompt(row)
+    return run
+
+
+def _parse_inputs() -> List[Tuple[Any, Any, Dict[str, Any], Any]]:
+    """(module, generator, input row, FullConversation response) tuples"""
+    return [
+        (module, generator, row, module.FullConversation.model_validate({"conversation": conversation}))
+        for module, generator, row, conversation in _conversation_pool()
+    ]
+
+
+def bench_parse(size: int, _: str) -> Callable[[], None]:
+    inputs = _parse_inputs()
+
+    def run():
+        for _, generator, row, response in itertools.islice(itertools.cycle(inputs), size):
+            generator.parse(row, response)
+    return run
+
+
+def bench_validate(size: int, _: str) -> Callable[[], None]:
+    from utils.generation import load_conversation
+
+    rows = [(module.is_valid_conversation, generator.parse(row, response)) for module, generator, row, response in _parse_inputs()]
+
+    def run():
+        for is_valid, result in itertools.islice(itertools.cycle(rows), size):
+            conversation = load_conversation(result)
+            if conversation is not None:
+                is_valid(conversation)
+    return run
+
+
+def bench_schema(size: int, _: str) -> Callable[[], None]:
+    from utils.validation import validate_assistant_turns
+
+    conversations = [(getattr(type(generator), "string_turns", ()), conversation) for _, generator, _, conversation in _conversation_pool()]
+
+    def run():
+        for string_turns, conversation in itertools.islice(itertools.cycle(conversations), size):
+            validate_assistant_turns(conversation, string_turns)
+    return run
+
+
+def _write_jsonl(conversations: List[List[Dict[str, Any]]], size: int, path: str) -> None:
+    from utils.writer import ConversationWriter
+
+    with ConversationWriter(path) as writer:
+        for conversation in itertools.islice(itertools.cycle(conversations), size):
+            writer.write(conversation)
+
+
+def bench_write(size: int, workdir: str) -> Callable[[], None]:
+    conversations = [conversation for *_, conversation in _conversation_pool()]
+    return lambda: _write_jsonl(conversations, size, os.path.join(workdir, "bench.jsonl"))
+
+
+def bench_export(size: int, workdir: str) -> Callable[[], None]:
+    from utils.writer import export_json
+
+    jsonl_path = os.path.join(workdir, "bench.jsonl")
+    _write_jsonl([conversation for *_, conversation in _conversation_pool()], size, jsonl_path)
+    return lambda: export_json(jsonl_path, os.path.join(workdir, "bench.json"))
+
+
+def bench_history(size: int, workdir: str) -> Callable[[], None]:
+    from utils.writer import export_json
+
+    spec = importlib.util.spec_from_file_location("add_conversation_history", HISTORY_SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    jsonl_path = os.path.join(workdir, "bench.jsonl")
+    json_path = os.path.join(workdir, "bench.json")
+    _write_jsonl([conversation for *_, conversation in _conversation_pool()], size, jsonl_path)
+    export_json(jsonl_path, json_path)
+    return lambda: module.add_conversation_history(json_path, os.path.join(workdir, "bench_with_history.json"))
+
+
+BENCHES = {
+    "prompt": bench_prompt,
+    "parse": bench_parse,
+    "validate": bench_validate,
+    "schema": bench_schema,
+    "write": bench_write,
+    "export": bench_export,
+    "history": bench_history,
+}
+
+
+def run_child(stage: str, size: int) -> Dict[str, float]:
+    """runs one stage in this process; setup is excluded from the timing but not from peak RSS"""
+    with tempfile.TemporaryDirectory() as workdir:
+        run = BENCHES[stage](size, workdir)
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_mb = peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    return {"ops_per_sec": size / elapsed if elapsed else float("inf"), "seconds": elapsed, "peak_rss_mb": peak_mb}
+
+
+def run_isolated(stage: str, size: int) -> Dict[str, float]:
+    """the fastest of up to MAX_REPEATS child runs, repeating while they add up to under MIN_SECONDS"""
+    best = None
+    total = 0.0
+    for _ in range(MAX_REPEATS):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", stage, "--sizes", str(size)],
+            check=True, capture_output=True, text=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        if best is None or result["ops_per_sec"] > best["ops_per_sec"]:
+            best = result
+        total += result["seconds"]
+        if total >= MIN_SECONDS:
+            break
+    return best
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark prompt build, parse, validate, write and history stages")
+    parser.add_argument("--stages", default=",".join(STAGES), help="Comma separated stages to run")
+    parser.add_argument("--sizes", default="1000,100000,1000000", help="Comma separated conversation counts")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="Baseline file to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative slowdown / RSS growth before flagging a stage")
+    parser.add_argument("--strict", action="store_true", help="Fail on flagged stages and missing baseline entries; for baselines recorded on this machine")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    if args.child:
+        print(json.dumps(run_child(args.child, sizes[0])))
+        return 0
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    elif not args.save_baseline:
+        print(f"No baseline at {args.baseline}; run with --save-baseline to record one")
+        if args.strict:
+            return 2
+
+    results = {}
+    regressions = []
+    unmeasured = []
+    print(f"{'stage':<10}{'size':>10}{'ops/sec':>14}{'peak RSS MB':>14}{'vs baseline':>14}")
+    for stage in args.stages.split(","):
+        for size in sizes:
+            key = f"{stage}@{size}"
+            result = run_isolated(stage, size)
+            results[key] = result
+
+            comparison = "no baseline"
+            if key in baseline:
+                speed = result["ops_per_sec"] / baseline[key]["ops_per_sec"]
+                comparison = f"{speed:.2f}x"
+                if speed < 1 - args.tolerance or result["peak_rss_mb"] > baseline[key]["peak_rss_mb"] * (1 + args.tolerance):
+                    regressions.append(key)
+                    comparison += " !"
+            elif not args.save_baseline:
+                unmeasured.append(key)
+            print(f"{stage:<10}{size:>10}{result['ops_per_sec']:>14,.0f}{result['peak_rss_mb']:>14.1f}{comparison:>14}")
+
+    if args.save_baseline:
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"Baseline saved to {args.baseline}")
+
+    if regressions:
+        print(f"Regressions beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+    if unmeasured:
+        print(f"No baseline for {', '.join(unmeasured)} in {args.baseline}; run with --save-baseline to add them")
+    if not args.strict:
+        if regressions or unmeasured:
+            print("Advisory only: timings depend on the machine; use --strict with a baseline recorded here to gate on them")
+        return 0
+    if regressions:
+        return 1
+    if unmeasured:
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,27 +9,48 @@ This script generates different types of edge case conversations with specified
 - 10% tool failure retry
 - 10% JSON error handling
 
-All conversations are combined into a single JSON file.
+All conversations are streamed into a single JSONL file and, optionally, exported
+to a single JSON file.
+
+With --concurrent the five categories run at the same time and share a single
+request/token budget, so the run takes about as long as the slowest category.
 """
 
-import json
 import argparse
 import os
-import tempfile
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
 import math
 
-from single_turn import generate_sample_data as generate_single_turn
-from multi_turn import generate_sample_data as generate_multi_turn
-from ambiguity_clarification import generate_sample_data as generate_ambiguity
-from tool_failure_retry import generate_sample_data as generate_tool_failure
-from json_error import generate_sample_data as generate_json_error
+from single_turn import generate_sample_data as generate_single_turn, MAX_COMPLETION_TOKENS as SINGLE_TURN_TOKENS
+from multi_turn import generate_sample_data as generate_multi_turn, MAX_COMPLETION_TOKENS as MULTI_TURN_TOKENS
+from ambiguity_clarification import generate_sample_data as generate_ambiguity, MAX_COMPLETION_TOKENS as AMBIGUITY_TOKENS
+from tool_failure_retry import generate_sample_data as generate_tool_failure, MAX_COMPLETION_TOKENS as TOOL_FAILURE_TOKENS
+from json_error import generate_sample_data as generate_json_error, MAX_COMPLETION_TOKENS as JSON_ERROR_TOKENS
+from utils.fingerprints import FINGERPRINT_DIR, FingerprintStore
+from utils.prompt_templates import INLINE_LAYOUT, PROMPT_LAYOUTS
+from utils.rate_budget import BudgetShare, RateBudget
+from utils.writer import ConversationWriter, export_output, iter_conversations, jsonl_path_for
 
 
 def generate_combined_dataset(
     total_conversations: int,
     output_file: str,
-    api_key: Optional[str] = None
+    api_key: Optional[str] = None,
+    concurrent: bool = False,
+    max_requests_per_minute: int = 300,
+    max_tokens_per_minute: int = 500000,
+    write_json: bool = True,
+    run_dir: Optional[str] = None,
+    resume: bool = True,
+    confidence: float = 0.9,
+    base_url: Optional[str] = None,
+    seed_file: Optional[str] = None,
+    shard_index: int = 0,
+    num_shards: int = 1,
+    prompt_layout: str = INLINE_LAYOUT,
+    batch: bool = False,
+    batch_check_interval: int = 60
 ):
     """
     Generate a combined dataset with different edge case types.
@@ -38,6 +59,20 @@ def generate_combined_dataset(
         total_conversations: Total number of conversations to generate
         output_file: Path to save the combined dataset
         api_key: OpenAI API key for generation
+        concurrent: Run all categories at once, sharing one request/token budget
+        max_requests_per_minute: Global request budget split across categories in concurrent mode
+        max_tokens_per_minute: Global token budget split across categories in concurrent mode
+        write_json: Also export the combined JSONL file to the `{"conversations": [...]}` JSON layout
+        run_dir: Directory holding per-category checkpoints (defaults to `<output>_run`)
+        resume: Continue from the checkpoints in `run_dir` instead of starting over
+        confidence: Probability with which each generator batch should reach its target in one round
+        base_url: OpenAI-compatible endpoint used instead of api.openai.com, e.g. utils/stub_server.py
+        seed_file: Seed questions as a .yaml taxonomy, .jsonl or .parquet file (defaults to taxonomy.yaml)
+        shard_index: Shard of `seed_file` every category draws from
+        num_shards: Number of shards `seed_file` is split into
+        prompt_layout: "inline", or "prefix" to order every prompt for provider-side prompt caching
+        batch: Submit every category through the provider's batch API instead of the chat endpoint
+        batch_check_interval: Seconds between batch status polls
     """
     
     single_turn_count = math.ceil(total_conversations * 0.3)
@@ -58,58 +93,105 @@ def generate_combined_dataset(
     print(f"  - JSON error (10%): {json_error_count}")
     print()
     
-    with tempfile.TemporaryDirectory() as temp_dir:
-        temp_files = {}
-        all_conversations = []
-        
-        generators = [
-            ("single_turn", generate_single_turn, single_turn_count),
-            ("multi_turn", generate_multi_turn, multi_turn_count),
-            ("ambiguity", generate_ambiguity, ambiguity_count),
-            ("tool_failure", generate_tool_failure, tool_failure_count),
-            ("json_error", generate_json_error, json_error_count)
-        ]
-        
-        for edge_case_type, generator_func, count in generators:
-            if count > 0:
-                temp_file = os.path.join(temp_dir, f"{edge_case_type}.json")
-                temp_files[edge_case_type] = temp_file
-                
-                print(f"Generating {count} {edge_case_type} conversations...")
-                try:
-                    print(f"  → Calling generator for {edge_case_type}...")
-                    generator_func(temp_file, count, api_key)
-                    
-                    print(f"  → Generator completed, checking file: {temp_file}")
-                    if not os.path.exists(temp_file):
-                        print(f"  ✗ Output file was not created: {temp_file}")
-                        continue
-                        
-                    with open(temp_file, 'r') as f:
-                        data = json.load(f)
-                        conversations = data.get('conversations', [])
-                        
-                        for conv in conversations:
-                            all_conversations.append(conv)
-                        
-                        print(f"  ✓ Generated {len(conversations)} {edge_case_type} conversations")
-                        
-                except Exception as e:
-                    import traceback
-                    print(f"  ✗ Error generating {edge_case_type}: {e}")
-                    print(f"  ✗ Full traceback: {traceback.format_exc()}")
-                    continue
+    generators = [
+        ("single_turn", generate_single_turn, single_turn_count, SINGLE_TURN_TOKENS),
+        ("multi_turn", generate_multi_turn, multi_turn_count, MULTI_TURN_TOKENS),
+        ("ambiguity", generate_ambiguity, ambiguity_count, AMBIGUITY_TOKENS),
+        ("tool_failure", generate_tool_failure, tool_failure_count, TOOL_FAILURE_TOKENS),
+        ("json_error", generate_json_error, json_error_count, JSON_ERROR_TOKENS)
+    ]
+    generators = [entry for entry in generators if entry[2] > 0]
+    
+    # every category checkpoints into the run directory, so a crash in one category does not
+    # throw away the others and re-running the command only generates what is still missing
+    run_dir = run_dir or os.path.splitext(output_file)[0] + "_run"
+    os.makedirs(run_dir, exist_ok=True)
+    print(f"Checkpointing into {run_dir}")
+    
+    generated = {}
+    run_options = {"seed_file": seed_file, "shard_index": shard_index, "num_shards": num_shards, "prompt_layout": prompt_layout, "batch": batch, "batch_check_interval": batch_check_interval}
+    
+    if concurrent:
+        budget = RateBudget(max_requests_per_minute, max_tokens_per_minute)
+        shares = {}
+        for edge_case_type, _, count, tokens_per_request in generators:
+            # register every category up front so the first batches already see the full split
+            shares[edge_case_type] = budget.share(edge_case_type)
+            shares[edge_case_type].update(count, count * tokens_per_request)
         
-        combined_dataset = {
-            "conversations": all_conversations
-        }
+        print(f"Running {len(generators)} generators concurrently within {max_requests_per_minute} req/min, {max_tokens_per_minute} tok/min")
+        with ThreadPoolExecutor(max_workers=len(generators)) as executor:
+            futures = {
+                edge_case_type: executor.submit(
+                    _run_generator, edge_case_type, generator_func, count, run_dir, api_key, resume, confidence, base_url, run_options, shares[edge_case_type]
+                )
+                for edge_case_type, generator_func, count, _ in generators
+            }
+            for edge_case_type, future in futures.items():
+                generated[edge_case_type] = future.result()
+    else:
+        for edge_case_type, generator_func, count, _ in generators:
+            generated[edge_case_type] = _run_generator(edge_case_type, generator_func, count, run_dir, api_key, resume, confidence, base_url, run_options)
+    
+    # merge in the fixed category order so concurrent and sequential runs produce the same layout
+    jsonl_file = jsonl_path_for(output_file)
+    category_files = [generated[edge_case_type] for edge_case_type, _, _, _ in generators if generated.get(edge_case_type)]
+    fingerprints = FingerprintStore(FINGERPRINT_DIR)
+    # the combined file takes over the category files' fingerprints, so its conversations stay
+    # known to later runs even after the run directory is rewritten; the old combined file is replaced
+    fingerprints.discard(jsonl_file)
+    for category_file in category_files:
+        fingerprints.discard(category_file)
+    skipped = 0
+    with ConversationWriter(jsonl_file, fingerprints=fingerprints) as writer:
+        for category_file in category_files:
+            for conv in iter_conversations(category_file):
+                if not writer.write(conv):
+                    skipped += 1
+    if skipped:
+        print(f"Skipped {skipped} conversations already written elsewhere")
+    
+    print(f"Combined dataset saved to: {jsonl_file}")
+    if write_json:
+        export_output(jsonl_file, output_file)
+        print(f"Combined dataset exported to: {output_file}")
+    print(f"Total conversations generated: {writer.count}")
+
+
+def _run_generator(
+    edge_case_type: str,
+    generator_func: Callable,
+    count: int,
+    run_dir: str,
+    api_key: Optional[str],
+    resume: bool,
+    confidence: float,
+    base_url: Optional[str],
+    run_options: Dict[str, Any],
+    rate_budget: Optional[BudgetShare] = None
+) -> Optional[str]:
+    """runs one category and returns the path of its JSONL output, or None if it failed"""
+    category_output = os.path.join(run_dir, f"{edge_case_type}.json")
+    category_file = jsonl_path_for(category_output)
+    
+    print(f"Generating {count} {edge_case_type} conversations...")
+    try:
+        print(f"  → Calling generator for {edge_case_type}...")
+        generator_func(category_output, count, api_key, rate_budget=rate_budget, write_json=False, resume=resume, confidence=confidence, base_url=base_url, **run_options)
         
-        os.makedirs(os.path.dirname(output_file), exist_ok=True)
-        with open(output_file, 'w') as f:
-            json.dump(combined_dataset, f, indent=2)
+        print(f"  → Generator completed, checking file: {category_file}")
+        if not os.path.exists(category_file):
+            print(f"  ✗ Output file was not created: {category_file}")
+            return None
         
-        print(f"Combined dataset saved to: {output_file}")
-        print(f"Total conversations generated: {len(all_conversations)}")
+        print(f"  ✓ Finished {edge_case_type} conversations")
+        return category_file
+            
+    except Exception as e:
+        import traceback
+        print(f"  ✗ Error generating {edge_case_type}: {e}")
+        print(f"  ✗ Full traceback: {traceback.format_exc()}")
+        return None
 
 
 def main():
@@ -131,6 +213,80 @@ def main():
         "--api-key", 
         help="OpenAI API key for generation"
     )
+    parser.add_argument(
+        "--concurrent",
+        action="store_true",
+        help="Run all edge case generators at once under one shared rate budget"
+    )
+    parser.add_argument(
+        "--max-requests-per-minute",
+        type=int,
+        default=300,
+        help="Global request budget shared by all generators in concurrent mode"
+    )
+    parser.add_argument(
+        "--max-tokens-per-minute",
+        type=int,
+        default=500000,
+        help="Global token budget shared by all generators in concurrent mode"
+    )
+    parser.add_argument(
+        "--run-dir",
+        help="Directory for per-category checkpoints (default: <output>_run)"
+    )
+    parser.add_argument(
+        "--base-url",
+        help="OpenAI-compatible endpoint, e.g. utils/stub_server.py for offline runs"
+    )
+    parser.add_argument(
+        "--confidence",
+        type=float,
+        default=0.9,
+        help="Probability with which each generator batch should reach its target in one round"
+    )
+    parser.add_argument(
+        "--seeds",
+        help="Seed file (.yaml taxonomy, .jsonl or .parquet); defaults to taxonomy.yaml"
+    )
+    parser.add_argument(
+        "--shard-index",
+        type=int,
+        default=0,
+        help="Shard of the seed file to draw from"
+    )
+    parser.add_argument(
+        "--num-shards",
+        type=int,
+        default=1,
+        help="Number of shards the seed file is split into"
+    )
+    parser.add_argument(
+        "--prompt-layout",
+        choices=PROMPT_LAYOUTS,
+        default=INLINE_LAYOUT,
+        help="'prefix' puts the shared instructions first and the seed last, for provider-side prompt caching"
+    )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="Submit through the batch API and poll, instead of the per-minute limited chat endpoint"
+    )
+    parser.add_argument(
+        "--batch-check-interval",
+        type=int,
+        default=60,
+        help="Seconds between batch status polls"
+    )
+    parser.add_argument(
+        "--fresh",
+        action="store_true",
+        help="Ignore existing checkpoints in the run directory and start over"
+    )
+    parser.add_argument(
+        "--jsonl-only",
+        action="store_true",
+        help="Only write the combined .jsonl file, skip the final JSON export"
+    )
     
     args = parser.parse_args()
     
@@ -142,7 +298,21 @@ def main():
         generate_combined_dataset(
             total_conversations=args.total,
             output_file=args.output,
-            api_key=args.api_key
+            api_key=args.api_key,
+            concurrent=args.concurrent,
+            max_requests_per_minute=args.max_requests_per_minute,
+            max_tokens_per_minute=args.max_tokens_per_minute,
+            write_json=not args.jsonl_only,
+            run_dir=args.run_dir,
+            resume=not args.fresh,
+            confidence=args.confidence,
+            base_url=args.base_url,
+            seed_file=args.seeds,
+            shard_index=args.shard_index,
+            num_shards=args.num_shards,
+            prompt_layout=args.prompt_layout,
+            batch=args.batch,
+            batch_check_interval=args.batch_check_interval
         )
         return 0
     except Exception as e:
@@ -12,17 +12,34 @@ the conversation will be generated in the following format:
         {"role": "assistant", "content": "faulty json"},
         {"role": "user", "content": "validation error message"},
 """
-import json
-import random
+import functools
+import itertools
 import argparse
-import yaml
 import os
 from typing import Dict, List, Any, Optional
 from pydantic import BaseModel, Field
-from datasets import Dataset
 from bespokelabs import curator
 
 from tool_response_formats import TOOL_RESPONSE_FORMATS, AVAILABLE_TOOLS
+from utils.generation import dump_conversation, generate_conversations, unpack_response
+from utils.prompt_templates import INLINE_LAYOUT, PROMPT_LAYOUTS, SEED_SLOT, PromptTemplate, choose_variant, layout_template
+from utils.request_types import REQUEST_TYPES, request_type_of
+from utils.rate_budget import BudgetShare
+from utils.seed_scheduler import scheduler_for
+from utils.checkpoint import open_run
+from utils.writer import export_output, jsonl_path_for
+
+MAX_COMPLETION_TOKENS = 4096
+
+JSON_ERROR_TYPES = [
+    "missing_required_field",
+    "non_utf8_chars",
+    "trailing_commas",
+    "malformed_structure"
+]
+
+TEMPLATE_KEYS = list(itertools.product(REQUEST_TYPES, JSON_ERROR_TYPES))
+
 
 class ConversationTurn(BaseModel):
     role: str = Field(description="Role: user or assistant")
@@ -33,42 +50,30 @@ class FullConversation(BaseModel):
     conversation: List[ConversationTurn] = Field(description="Complete conversation")
 
 
-def load_taxonomy(file_path: str = "taxonomy.yaml") -> List[Dict[str, Any]]:
-    with open(file_path, 'r') as f:
-        return yaml.safe_load(f)
-
-
 class InvalidJSONSelfRepairGenerator(curator.LLM):
-    response_format = FullConversation
+    # requested as structured output and validated in parse(); as curator's response_format it would
+    # be checked against the whole completion object, which parse() needs for the usage block
+    completion_format = FullConversation
+    return_completions_object = True
+    # turn 2 is the faulty JSON the assistant goes on to repair, a string on purpose
+    string_turns = (1,)
 
     def prompt(self, input_data: Dict) -> str:
-        seed_question = input_data["seed_question"]
-        
-        # Determine request type based on seed question keywords
-        request_type = "general"
-        if any(word in seed_question.lower() for word in ["laptop", "computer", "hardware", "equipment", "docking"]):
-            request_type = "hardware"
-        elif any(word in seed_question.lower() for word in ["software", "license", "application", "tool"]):
-            request_type = "software"
-        elif any(word in seed_question.lower() for word in ["access", "permission", "login", "account", "vpn"]):
-            request_type = "access"
-        elif any(word in seed_question.lower() for word in ["policy", "procedure", "rule", "guideline"]):
-            request_type = "policy"
-        elif any(word in seed_question.lower() for word in ["incident", "problem", "issue", "error", "bug"]):
-            request_type = "incident"
-        elif any(word in seed_question.lower() for word in ["benefit", "hr", "payroll", "vacation", "leave", "parental"]):
-            request_type = "hr"
-        elif any(word in seed_question.lower() for word in ["expense", "reimburse", "cost", "budget", "travel"]):
-            request_type = "expense"
+        return self.template(input_data).render(input_data["seed_question"])
+
+    @classmethod
+    def template(cls, input_data: Dict) -> PromptTemplate:
+        request_type = request_type_of(input_data)
         
-        json_error_types = [
-            "missing_required_field",
-            "non_utf8_chars", 
-            "trailing_commas",
-            "malformed_structure"
-        ]
+        error_type = choose_variant(input_data, "error_type", JSON_ERROR_TYPES)
         
-        error_type = random.choice(json_error_types)
+        key = (request_type, error_type)
+        return layout_template(cls._compiled_template, TEMPLATE_KEYS, key, input_data.get("prompt_layout", INLINE_LAYOUT))
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def _compiled_template(request_type: str, error_type: str) -> PromptTemplate:
+        seed_question = SEED_SLOT
         
         error_examples = {
             "missing_required_field": {
@@ -117,7 +122,7 @@ class InvalidJSONSelfRepairGenerator(curator.LLM):
             "general": "Comprehensive multi-tool approach using KnowledgeSearchTool, FindCatalogTool, and MyRequestsTool: I'll use a broad multi-faceted strategy to gather relevant information. Strategy: (1) KnowledgeSearchTool for broad knowledge base search for context, (2) FindCatalogTool for catalog search for relevant forms and services, (3) KnowledgeSearchTool for policy and procedure verification, (4) FindCatalogTool for support and contact information, (5) MyRequestsTool for historical request patterns."
         }
         
-        return f"""Generate a realistic JSON SELF-REPAIR conversation with EXACTLY 6 turns following this MANDATORY pattern:
+        return PromptTemplate(f"""Generate a realistic JSON SELF-REPAIR conversation with EXACTLY 6 turns following this MANDATORY pattern:
 
 SEED QUESTION: {seed_question}
 
@@ -246,116 +251,64 @@ ABSOLUTE REQUIREMENTS:
 - All JSON must be structurally valid after correction
 - Follow the exact error type: {error_type}
 
-Available tools: {', '.join(AVAILABLE_TOOLS)}"""
+Available tools: {', '.join(AVAILABLE_TOOLS)}""")
 
-    def parse(self, input_data: Dict, response: FullConversation) -> Dict:
+    def parse(self, input_data: Dict, response: Any) -> Dict:
+        response, usage = unpack_response(response, FullConversation)
         return {
             "seed_question": input_data["seed_question"],
-            "full_conversation": json.dumps([
-                {
-                    "role": turn.role,
-                    "content": turn.content
-                } for turn in response.conversation
-            ])
+            "sample_index": input_data["sample_index"],
+            "template_hash": self.template(input_data).hash,
+            "prompt_tokens": usage.get("prompt_tokens"),
+            "cached_prompt_tokens": usage.get("cached_prompt_tokens"),
+            "full_conversation": dump_conversation(response.conversation)
         }
 
 
-def generate_sample_data(output_file: str, num_conversations: int = 500, api_key: Optional[str] = None):
+def is_valid_conversation(conversation: List[Dict[str, Any]]) -> bool:
+    return len(conversation) == 6
+
+
+def generate_sample_data(output_file: str, num_conversations: int = 500, api_key: Optional[str] = None, rate_budget: Optional[BudgetShare] = None, write_json: bool = True, resume: bool = True, confidence: float = 0.9, base_url: Optional[str] = None, seed_file: Optional[str] = None, shard_index: int = 0, num_shards: int = 1, prompt_layout: str = INLINE_LAYOUT, batch: bool = False, batch_check_interval: int = 60):
     
-    os.environ["CURATOR_VIEWER"] = "1"
+    if not base_url:
+        # the viewer uploads to curator's hosted service; offline runs against a local endpoint skip it
+        os.environ["CURATOR_VIEWER"] = "1"
     if api_key:
         os.environ["OPENAI_API_KEY"] = api_key
     
-    taxonomy = load_taxonomy()
-    all_seeds = []
-    for intent in taxonomy:
-        for seed in intent["seed_questions"]:
-            all_seeds.append(seed)
-    
-    random.shuffle(all_seeds)
-    
-    generator = InvalidJSONSelfRepairGenerator(
-        model_name="o3-2025-04-16",
-        backend="openai",
-        backend_params={
-            "max_retries": 3,
-            "max_requests_per_minute": 60,
-            "max_tokens_per_minute": 100000
-        },
-        generation_params={"max_completion_tokens": 4096}
-    )
-    
-    conversations = []
-    max_retries = 3
-    retry_count = 0
-    
-    while len(conversations) < num_conversations and retry_count < max_retries:
-        remaining_count = num_conversations - len(conversations)
-        
-        # Generate a few extra to account for filtering
-        generation_count = min(remaining_count + max(5, remaining_count // 2), remaining_count * 2)
-        
-        print(f"Generating {generation_count} Invalid JSON Self-repair conversations (attempt {retry_count + 1}, need {remaining_count} more)...")
-        
-        dataset_items = []
-        for i in range(generation_count):
-            seed_question = all_seeds[i % len(all_seeds)]
-            dataset_items.append({
-                "seed_question": seed_question
-            })
-        
-        input_dataset = Dataset.from_list(dataset_items)
-        results = generator(input_dataset)
-        
-        if hasattr(results, 'dataset') and results.dataset is not None:
-            result_dataset = results.dataset
-            if hasattr(result_dataset, 'to_list'):
-                result_list = result_dataset.to_list()
-            elif hasattr(result_dataset, '__iter__'):
-                result_list = list(result_dataset)
-            else:
-                result_list = []
-        else:
-            result_list = []
-        
-        valid_conversations = []
-        for result in result_list:
-            if isinstance(result, dict) and "full_conversation" in result:
-                try:
-                    conversation = json.loads(result["full_conversation"])
-                    if len(conversation) == 6:
-                        valid_conversations.append(conversation)
-                except (json.JSONDecodeError, TypeError):
-                    if isinstance(result["full_conversation"], list) and len(result["full_conversation"]) == 6:
-                        valid_conversations.append(result["full_conversation"])
-        
-        conversations.extend(valid_conversations[:remaining_count])
-        retry_count += 1
-        
-        print(f"  → Generated {len(valid_conversations)} valid conversations, total: {len(conversations)}/{num_conversations}")
-        
-        if len(conversations) >= num_conversations:
-            break
-    
-    # Trim to exact count if we got more than requested
-    conversations = conversations[:num_conversations]
-    
-    dataset = {
-        "conversations": conversations,
-    }
+    scheduler = scheduler_for(seed_file, shard_index, num_shards)
+    backend_params = {"base_url": base_url} if base_url else {}
+    if batch:
+        backend_params["batch_check_interval"] = batch_check_interval
     
-    output_dir = os.path.dirname(output_file)
-    if output_dir and not os.path.exists(output_dir):
-        os.makedirs(output_dir)
+    jsonl_file = jsonl_path_for(output_file)
+    manifest, writer = open_run(output_file, resume=resume)
+    with manifest, writer:
+        generate_conversations(
+            InvalidJSONSelfRepairGenerator,
+            "Invalid JSON Self-repair",
+            scheduler,
+            num_conversations,
+            is_valid_conversation,
+            generation_params={"max_completion_tokens": MAX_COMPLETION_TOKENS},
+            writer=writer,
+            manifest=manifest,
+            rate_budget=rate_budget,
+            confidence=confidence,
+            backend_params=backend_params,
+            prompt_layout=prompt_layout,
+            batch=batch
+        )
     
-    with open(output_file, 'w') as f:
-        json.dump(dataset, f, indent=2)
+    print(f"Generated {writer.count} Invalid JSON Self-repair conversations and saved to {jsonl_file}")
     
-    print(f"Generated {len(conversations)} Invalid JSON Self-repair conversations and saved to {output_file}")
+    if write_json:
+        export_output(jsonl_file, output_file)
+        print(f"Exported {writer.count} Invalid JSON Self-repair conversations to {output_file}")
     
-    if conversations:
-        total_turns = sum(len(conv) for conv in conversations)
-        avg_turns = total_turns / len(conversations)
+    if writer.count:
+        avg_turns = writer.total_turns / writer.count
         print(f"Average turns per conversation: {avg_turns:.1f}")
 
 
@@ -364,7 +317,17 @@ if __name__ == "__main__":
     parser.add_argument("--output", default="data/json_error/conversations.json", help="Output file")
     parser.add_argument("--num", type=int, default=2, help="Number of conversations to generate")
     parser.add_argument("--api-key", help="OpenAI API key")
+    parser.add_argument("--base-url", help="OpenAI-compatible endpoint, e.g. utils/stub_server.py for offline runs")
+    parser.add_argument("--confidence", type=float, default=0.9, help="Probability with which each batch should reach the target in one round")
+    parser.add_argument("--seeds", help="Seed file (.yaml taxonomy, .jsonl or .parquet); defaults to taxonomy.yaml")
+    parser.add_argument("--shard-index", type=int, default=0, help="Shard of the seed file to draw from")
+    parser.add_argument("--num-shards", type=int, default=1, help="Number of shards the seed file is split into")
+    parser.add_argument("--prompt-layout", choices=PROMPT_LAYOUTS, default=INLINE_LAYOUT, help="'prefix' puts the shared instructions first and the seed last, for provider-side prompt caching")
+    parser.add_argument("--batch", action="store_true", help="Submit through the batch API and poll, instead of the per-minute limited chat endpoint")
+    parser.add_argument("--batch-check-interval", type=int, default=60, help="Seconds between batch status polls")
+    parser.add_argument("--fresh", action="store_true", help="Ignore the checkpoint next to --output and start over")
+    parser.add_argument("--jsonl-only", action="store_true", help="Only write the incremental .jsonl file, skip the final JSON export")
     
     args = parser.parse_args()
     
-    generate_sample_data(args.output, args.num, args.api_key) 
\ No newline at end of file
+    generate_sample_data(args.output, args.num, args.api_key, write_json=not args.jsonl_only, resume=not args.fresh, confidence=args.confidence, base_url=args.base_url, seed_file=args.seeds, shard_index=args.shard_index, num_shards=args.num_shards, prompt_layout=args.prompt_layout, batch=args.batch, batch_check_interval=args.batch_check_interval) 
\ No newline at end of file
@@ -2,13 +2,18 @@ import json
 import random
 import logging
 from typing import List, Dict, Any
-import yaml
 from pydantic import BaseModel, Field
 from datasets import Dataset
 
 from bespokelabs import curator
 from config import TOOLS, MAX_TURNS
+from utils.dedup import NearDuplicateFilter
+from utils.fingerprints import FingerprintStore
+from utils.generation import dump_conversation, load_conversation
 from utils.schema import RESPONSE_SCHEMA
+from utils.seed_sources import open_seed_source, reservoir_sample
+from utils.validation import validate_assistant_turns
+from utils.writer import ConversationWriter, export_json
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -32,10 +37,6 @@ class ConversationTurn(BaseModel):
 class MultiTurnConversation(BaseModel):
     conversation: List[ConversationTurn] = Field(description="Complete conversation")
 
-def load_taxonomy() -> List[Dict[str, Any]]:
-    with open('syn-data/taxonomy.yaml', 'r') as f:
-        return yaml.safe_load(f)
-
 def get_failure_scenarios() -> List[str]:
     return [
         "That didn't work, no results found.",
@@ -202,12 +203,7 @@ Generate a complete conversation in this format:
     def parse(self, input_data: Dict, response: MultiTurnConversation) -> List[Dict]:
         return [{
             "seed_question": input_data["seed_question"],
-            "full_conversation": json.dumps([
-                {
-                    "role": turn.role,
-                    "content": turn.content
-                } for turn in response.conversation
-            ])
+            "full_conversation": dump_conversation(response.conversation)
         }]
 
 def main():
@@ -215,13 +211,8 @@ def main():
     os.environ["CURATOR_VIEWER"]="1"
     os.environ["OPENAI_API_KEY"] = ""
     
-    taxonomy = load_taxonomy()
-    all_seeds = []
-    for intent in taxonomy:
-        for seed in intent["seed_questions"]:
-            all_seeds.append(seed)
-    
-    random.shuffle(all_seeds)
+    # uniform sample without materialising or shuffling the whole seed list
+    sampled_seeds = reservoir_sample(open_seed_source(), 10, random.Random())
     
     generator = MultiTurnGenerator(
         model_name="gpt-4.1-nano-2025-04-14",
@@ -234,58 +225,64 @@ def main():
         generation_params={"temperature": 0.9, "max_tokens": 2048}
     )
     
-    input_data = [{"seed_question": seed} for seed in all_seeds[:10]]
+    input_data = [{"seed_question": record.seed_question} for record in sampled_seeds]
     input_dataset = Dataset.from_list(input_data)
     
     logger.info(f"Generating conversations for {len(input_data)} seed questions...")
     
     results = generator(input_dataset)
     
-    conversations = []
-    
-    try:
-        if hasattr(results, 'dataset') and results.dataset is not None:
-            dataset = results.dataset
-            if hasattr(dataset, 'to_list'):
-                result_list = dataset.to_list()
-            elif hasattr(dataset, '__iter__'):
-                result_list = list(dataset)
+    # Stream accepted conversations to JSONL as they are read back
+    fingerprints = FingerprintStore()
+    # sample.jsonl is rewritten, so what it held before no longer counts as written
+    fingerprints.discard('data/sample.jsonl')
+    with ConversationWriter('data/sample.jsonl', fingerprints=fingerprints) as writer:
+        try:
+            if hasattr(results, 'dataset') and results.dataset is not None:
+                dataset = results.dataset
+                if hasattr(dataset, '__iter__'):
+                    result_rows = iter(dataset)
+                elif hasattr(dataset, 'to_list'):
+                    result_rows = iter(dataset.to_list())
+                else:
+                    logger.warning("Dataset doesn't have expected methods")
+                    result_rows = iter([])
             else:
-                logger.warning("Dataset doesn't have expected methods")
-                result_list = []
-        else:
-            logger.warning("Results doesn't have dataset attribute")
-            result_list = []
-        
-        for result in result_list:
-            if isinstance(result, dict) and "full_conversation" in result:
-                try:
-                    # Parse the JSON string back to a list
-                    conversation = json.loads(result["full_conversation"])
-                    if len(conversation) >= 3:
-                        conversations.append(conversation)
-                except (json.JSONDecodeError, TypeError):
-                    # If it's already a list, use it directly
-                    if isinstance(result["full_conversation"], list) and len(result["full_conversation"]) >= 3:
-                        conversations.append(result["full_conversation"])
-                
-    except Exception as e:
-        logger.error(f"Error processing results: {e}")
-        logger.error(f"Results type: {type(results)}")
-        if hasattr(results, '__dict__'):
-            logger.error(f"Results attributes: {list(results.__dict__.keys())}")
+                logger.warning("Results doesn't have dataset attribute")
+                result_rows = iter([])
+            
+            # near copies of an earlier conversation are dropped instead of written
+            dedup = NearDuplicateFilter()
+            for position, result in enumerate(result_rows):
+                conversation = load_conversation(result)
+                if conversation is None or len(conversation) < 3:
+                    continue
+                if validate_assistant_turns(conversation):
+                    continue
+                if dedup.check(position, conversation, result.get("seed_question")) is not None:
+                    continue
+                # skipped by the writer if an earlier run already wrote it
+                if writer.write(conversation, result["full_conversation"] if isinstance(result["full_conversation"], str) else None):
+                    dedup.accept(position)
+            if dedup.duplicates:
+                logger.info(f"Dropped {sum(dedup.duplicates.values())} near-duplicate conversations ({dedup.duplicate_rate():.0%})")
+                    
+        except Exception as e:
+            logger.error(f"Error processing results: {e}")
+            logger.error(f"Results type: {type(results)}")
+            if hasattr(results, '__dict__'):
+                logger.error(f"Results attributes: {list(results.__dict__.keys())}")
     
     # Save to JSON
-    with open('data/sample.json', 'w') as f:
-        json.dump(conversations, f, indent=2)
+    export_json('data/sample.jsonl', 'data/sample.json', key=None)
     
-    logger.info(f"Generated {len(conversations)} conversations and saved to sample.json")
+    logger.info(f"Generated {writer.count} conversations and saved to sample.json")
     
     print(f"\n{'='*50}")
     print(f"SAMPLE GENERATION COMPLETE")
     print(f"{'='*50}")
-    print(f"Generated: {len(conversations)} conversations")
-    print(f"Saved to: sample.json")
+    print(f"Generated: {writer.count} conversations")
+    print(f"Saved to: sample.jsonl, sample.json")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
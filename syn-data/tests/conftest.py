@@ -0,0 +1,6 @@
+import os
+import sys
+
+# the generators import each other as top-level modules from syn-data and syn-data/edge_cases
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "edge_cases")]
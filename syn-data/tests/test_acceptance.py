@@ -0,0 +1,27 @@
+import json
+import multiprocessing
+
+from utils.acceptance import AcceptanceTracker, stats_key
+
+
+def _record_rounds(stats_path, rounds):
+    tracker = AcceptanceTracker(stats_key("CategoryAGenerator", "o3"), stats_path)
+    for _ in range(rounds):
+        tracker.record(10, 7)
+
+
+def test_stats_are_kept_per_endpoint(tmp_path):
+    stats_path = str(tmp_path / "acceptance_stats.json")
+    AcceptanceTracker(stats_key("CategoryAGenerator", "o3", "http://127.0.0.1:8765/v1"), stats_path).record(10, 10)
+    assert AcceptanceTracker(stats_key("CategoryAGenerator", "o3"), stats_path).rate is None
+
+
+def test_concurrent_processes_add_up(tmp_path):
+    stats_path = str(tmp_path / "acceptance_stats.json")
+    processes = [multiprocessing.Process(target=_record_rounds, args=(stats_path, 25)) for _ in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    with open(stats_path) as f:
+        assert json.load(f)[stats_key("CategoryAGenerator", "o3")] == {"submitted": 1000, "valid": 700}
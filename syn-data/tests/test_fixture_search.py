@@ -0,0 +1,27 @@
+from utils.fixture_search import fixture_index, normalize_query
+
+
+def _names(items, key):
+    return [item[key] for item in items]
+
+
+def test_queries_find_their_items():
+    index = fixture_index()
+    assert _names(index.search_catalog("I need VPN credentials for the staging environment."), "item_name")[0] == "VPN Access"
+    assert _names(index.search_knowledge("How do I request parental leave?"), "title")[0] == "Parental Leave Benefits"
+    assert _names(index.search_catalog("The printer is not working, can you help?"), "item_name") == ["Printer and Scanner Support"]
+
+
+def test_generic_request_words_match_nothing():
+    index = fixture_index()
+    assert index.search_catalog("How do I request parental leave?") == []
+    assert index.search_catalog("expense report for travel") == []
+    assert index.search_catalog("I need access, please help with the request form") == []
+
+
+def test_lookups_are_cached_per_normalized_query():
+    index = fixture_index()
+    assert normalize_query("Laptops for new hires?") == normalize_query("new hire laptop")
+    before = index._lookup.cache_info().hits
+    index.search_catalog("new hire laptop")
+    assert index._lookup.cache_info().hits == before + 1
@@ -0,0 +1,42 @@
+import importlib
+from collections import Counter
+
+import pytest
+
+from utils.prompt_templates import PREFIX_LAYOUT, SEED_REFERENCE, SEED_SLOT, SEED_TRAILER, PromptTemplate, _sections, layout_template, split_prefix
+
+GENERATORS = [
+    ("single_turn", "CategoryAGenerator"),
+    ("multi_turn", "CategoryBGenerator"),
+    ("ambiguity_clarification", "AmbiguityClarificationGenerator"),
+    ("tool_failure_retry", "ToolFailureRetryGenerator"),
+    ("json_error", "InvalidJSONSelfRepairGenerator"),
+]
+
+
+@pytest.mark.parametrize("module_name,class_name", GENERATORS)
+def test_prefix_layout_moves_shared_sections_first(module_name, class_name):
+    module = importlib.import_module(module_name)
+    compile_template = getattr(module, class_name)._compiled_template
+    keys = tuple(module.TEMPLATE_KEYS)
+    shared, variants = split_prefix(compile_template, keys)
+    # every prompt spends most of its static text on sections all keys share
+    assert len(shared) > 1000
+    for key in keys:
+        inline = SEED_REFERENCE.join(compile_template(*key).parts)
+        prompt = layout_template(compile_template, list(keys), key, PREFIX_LAYOUT).render("How do I reset my password?")
+        assert prompt.startswith(shared + "\n\n" + variants[key])
+        assert prompt.endswith(f"\n\n{SEED_TRAILER}How do I reset my password?")
+        # the same sections, only regrouped
+        regrouped = _sections(shared + "\n\n" + variants[key])
+        assert Counter(map(str.strip, regrouped)) == Counter(map(str.strip, _sections(inline)))
+
+
+def test_variant_sections_follow_the_shared_ones():
+    text = "INTRO:\n" + SEED_SLOT + "\n\nPATTERN B (10 turns - 3 User Questions):\nTURN 1 - USER: {}\nTURN 2 - ASSISTANT: tools\n\nTYPE: {}\n\nRULES:\n- one"
+    compile_template = lambda pattern, kind: PromptTemplate(text.format(pattern, kind))
+    keys = (("a", "x"), ("b", "x"), ("a", "y"), ("b", "y"), ("c", "y"))
+    shared, variants = split_prefix(compile_template, keys)
+    assert shared == f"INTRO:\n{SEED_REFERENCE}\n\nRULES:\n- one"
+    # the turn list stays under its heading, and the section with fewer versions comes first
+    assert variants[("b", "x")] == "TYPE: x\n\nPATTERN B (10 turns - 3 User Questions):\nTURN 1 - USER: b\nTURN 2 - ASSISTANT: tools"
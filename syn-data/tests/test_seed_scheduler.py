@@ -0,0 +1,61 @@
+import json
+
+from utils.checkpoint import IN_FLIGHT, RunManifest
+from utils.request_types import classify_request
+from utils.seed_scheduler import StreamingSeedScheduler, scheduler_for
+from utils.seed_sources import DEFAULT_INTENT
+
+GENERATOR = "CategoryAGenerator"
+
+
+def _write_seeds(path, count):
+    with open(path, 'w') as f:
+        for n in range(count):
+            f.write(json.dumps({"seed_question": f"question {n} about my laptop", "intent": f"intent_{n % 3}", "request_type": "policy"}) + "\n")
+
+
+def _submit(manifest, scheduler, count):
+    batch = scheduler.next_batch(count)
+    for seed in batch:
+        labels = (scheduler.intent_of[seed], scheduler.request_type_of[seed])
+        manifest.record(GENERATOR, seed, manifest.next_sample_index(GENERATOR, seed), IN_FLIGHT, labels=labels)
+    return batch
+
+
+def test_resume_restores_labels_of_in_flight_seeds(tmp_path):
+    seeds = tmp_path / "seeds.jsonl"
+    _write_seeds(seeds, 50)
+    manifest_path = str(tmp_path / "run.manifest.jsonl")
+
+    with RunManifest(manifest_path) as manifest:
+        scheduler = scheduler_for(str(seeds))
+        assert isinstance(scheduler, StreamingSeedScheduler)
+        submitted = _submit(manifest, scheduler, 5)
+
+    with RunManifest(manifest_path) as manifest:
+        resumed = scheduler_for(str(seeds))
+        resumed.restore(manifest.seed_history(GENERATOR), manifest.seed_labels(GENERATOR))
+        in_flight = manifest.in_flight(GENERATOR)
+
+    assert [seed for seed, _ in in_flight] == submitted
+    for seed, _ in in_flight:
+        assert resumed.request_type_of[seed] == "policy"
+        assert resumed.intent_of[seed] == scheduler.intent_of[seed]
+        assert resumed.submitted[seed] == 1
+
+
+def test_resume_without_labels_classifies_seeds(tmp_path):
+    seed = "The VPN keeps disconnecting every 5 minutes."
+    manifest_path = str(tmp_path / "run.manifest.jsonl")
+    with RunManifest(manifest_path) as manifest:
+        # manifests written before labels were recorded
+        manifest.record(GENERATOR, seed, 0, IN_FLIGHT)
+
+    with RunManifest(manifest_path) as manifest:
+        seeds = tmp_path / "seeds.jsonl"
+        _write_seeds(seeds, 3)
+        resumed = scheduler_for(str(seeds))
+        resumed.restore(manifest.seed_history(GENERATOR), manifest.seed_labels(GENERATOR))
+
+    assert resumed.request_type_of[seed] == classify_request(seed)
+    assert resumed.intent_of[seed] == DEFAULT_INTENT
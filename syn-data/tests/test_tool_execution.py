@@ -0,0 +1,66 @@
+import json
+import os
+import random
+from collections import Counter
+
+from utils.tool_execution import execute_tool_calls
+
+SAMPLES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "edge_cases", "data", "multi_turn", "multi-turn.json")
+
+
+def _conversation(result):
+    return [
+        {"role": "user", "content": "How do I set up the VPN?"},
+        {"role": "assistant", "content": {"tool_calls": [{"tool": "KnowledgeSearchTool", "args": {"queries": ["vpn setup"]}}]}},
+        {"role": "tool", "content": [{"tool_name": "KnowledgeSearchTool", "tool_args": {"queries": ["vpn setup"]}, "tool_result": result}]},
+        {"role": "assistant", "content": {"tool_calls": [{"tool": "RespondToUserTool", "args": {"response": "Follow the Zephyrgate guide."}}]}},
+    ]
+
+
+def test_written_results_are_kept_by_default():
+    with open(SAMPLES) as f:
+        conversations = json.load(f)["conversations"]
+    stats = Counter()
+    for conversation in conversations:
+        assert execute_tool_calls(conversation, random.Random(0), stats=stats) == conversation
+    assert stats["kept_written"] and not stats["simulated"]
+
+    uncited = _conversation({"results": {"topic_responses": [{"answer": {"summary": "Install Blorptastic first."}}]}})
+    assert execute_tool_calls(uncited, random.Random(0)) == uncited
+
+
+def test_missing_tool_turn_is_filled_in():
+    conversation = _conversation({})
+    del conversation[2]
+    stats = Counter()
+    executed = execute_tool_calls(conversation, random.Random(0), stats=stats)
+    assert stats == Counter(simulated=1)
+    assert [turn["role"] for turn in executed] == ["user", "assistant", "tool", "assistant"]
+    assert executed[2]["content"][0]["tool_name"] == "KnowledgeSearchTool"
+
+
+def test_results_cited_by_later_turns_are_kept():
+    with open(SAMPLES) as f:
+        conversations = json.load(f)["conversations"]
+    stats = Counter()
+    for conversation in conversations:
+        assert execute_tool_calls(conversation, random.Random(0), replace_uncited=True, stats=stats) == conversation
+    assert stats["kept_cited"] and not stats["simulated"]
+
+
+def test_uncited_results_are_simulated():
+    cited = _conversation({"results": {"topic_responses": [{"answer": {"summary": "Use the Zephyrgate client."}}]}})
+    assert execute_tool_calls(cited, random.Random(0), replace_uncited=True) == cited
+
+    uncited = _conversation({"results": {"topic_responses": [{"answer": {"summary": "Install Blorptastic first."}}]}})
+    stats = Counter()
+    executed = execute_tool_calls(uncited, random.Random(0), replace_uncited=True, stats=stats)
+    assert stats == Counter(simulated=1)
+    assert "VPN" in executed[2]["content"][0]["tool_result"]["results"]["topic_responses"][0]["answer"]["title"]
+
+
+def test_failures_are_kept():
+    failed = _conversation({"execution_status": "failed", "error": "Knowledge base timed out after 30s"})
+    stats = Counter()
+    assert execute_tool_calls(failed, random.Random(0), replace_uncited=True, stats=stats) == failed
+    assert stats == Counter(kept_failed=1)
@@ -0,0 +1,46 @@
+from utils.dedup import NearDuplicateFilter
+from utils.fingerprints import FingerprintStore
+from utils.writer import ConversationWriter, iter_conversations
+
+ANSWER = " ".join(f"step {n}: open the portal, pick the laptop model and confirm the delivery address" for n in range(12))
+
+
+def _conversation(question, answer=ANSWER):
+    return [
+        {"role": "user", "content": question},
+        {"role": "assistant", "content": {"tool_calls": [{"tool": "RespondToUserTool", "args": {"response": answer}}]}},
+    ]
+
+
+def _writer(tmp_path, name):
+    store = FingerprintStore(str(tmp_path / "fingerprints"), capacity=1000)
+    return ConversationWriter(str(tmp_path / name), fingerprints=store)
+
+
+def test_writer_round_trip_and_cross_run_copies(tmp_path):
+    conversations = [_conversation(f"How do I get laptop number {n}?") for n in range(3)]
+    with _writer(tmp_path, "first.jsonl") as writer:
+        assert all(writer.write(conversation) for conversation in conversations)
+    assert list(iter_conversations(str(tmp_path / "first.jsonl"))) == conversations
+
+    with _writer(tmp_path, "second.jsonl") as writer:
+        assert not writer.write(conversations[0])
+        assert writer.count == 0
+
+
+def test_only_written_conversations_enter_the_near_duplicate_index(tmp_path):
+    seen = _conversation("How do I get a new laptop?")
+    with _writer(tmp_path, "first.jsonl") as writer:
+        writer.write(seen)
+
+    dedup = NearDuplicateFilter(threshold=0.8)
+    near_copy = _conversation("How do I get a new laptop?", ANSWER + " today")
+    with _writer(tmp_path, "second.jsonl") as writer:
+        # the writer rejects the exact copy, so it must not shadow its near copy
+        assert dedup.check("seen", seen) is None
+        assert not writer.write(seen)
+        assert dedup.check("near", near_copy) is None
+        assert writer.write(near_copy)
+        dedup.accept("near")
+        # once written, the near copy does shadow the next one
+        assert dedup.check("again", _conversation("How do I get a new laptop?", ANSWER + " now")) == "near"
@@ -2,10 +2,11 @@ from typing import Dict, List, Any
 import random
 
 class ToolResponseFormats:
-    """Defines realistic response formats for each tool based on actual implementations"""
+    """Defines realistic response formats for each tool based on actual implementations.
+    Each format takes an optional `rng` (a random.Random) for its random fields, the random module by default."""
     
     @staticmethod
-    def knowledge_search_tool_response() -> Dict[str, Any]:
+    def knowledge_search_tool_response(rng=random) -> Dict[str, Any]:
         """Format for KnowledgeSearchTool based on kb_tool.py"""
         return {
             "results": {
@@ -17,7 +18,7 @@ class ToolResponseFormats:
                         },
                         "chunks": [
                             {
-                                "title": f"IT_FAQ_{random.randint(1, 100)}.pdf",
+                                "title": f"IT_FAQ_{rng.randint(1, 100)}.pdf",
                                 "url": ""
                             }
                         ]
@@ -30,10 +31,10 @@ class ToolResponseFormats:
         }
     
     @staticmethod
-    def find_catalog_tool_response() -> Dict[str, Any]:
+    def find_catalog_tool_response(rng=random) -> Dict[str, Any]:
         """Format for FindCatalogTool based on find_catalog_tool.py"""
-        item_id = str(random.randint(100, 1200))
-        item_name = random.choice(["VPN Setup", "Laptop Request", "Software License", "Access Request"])
+        item_id = str(rng.randint(100, 1200))
+        item_name = rng.choice(["VPN Setup", "Laptop Request", "Software License", "Access Request"])
         
         return {
             "results": [
@@ -52,7 +53,7 @@ class ToolResponseFormats:
         }
     
     @staticmethod
-    def my_requests_tool_response() -> Dict[str, Any]:
+    def my_requests_tool_response(rng=random) -> Dict[str, Any]:
         """Format for MyRequestsTool based on esd_tools/request_status/base_req.py"""
         return {
             "success": True,
@@ -64,9 +65,9 @@ class ToolResponseFormats:
                 "next_page_token": None,
                 "data": [
                     {
-                        "id": f"REQ-{random.randint(1000, 9999)}",
+                        "id": f"REQ-{rng.randint(1000, 9999)}",
                         "subject": "VPN Access Request",
-                        "display_id": f"DISP-{random.randint(100, 999)}",
+                        "display_id": f"DISP-{rng.randint(100, 999)}",
                         "approval_task_title": "VPN Access Approval",
                         "entity_type": "service_request",
                         "request_type": "access",
@@ -83,7 +84,7 @@ class ToolResponseFormats:
         }
     
     @staticmethod
-    def my_pending_approvals_tool_response() -> Dict[str, Any]:
+    def my_pending_approvals_tool_response(rng=random) -> Dict[str, Any]:
         """Format for MyPendingApprovalsTool based on esd_tools/request_status/base_req.py"""
         return {
             "success": True,
@@ -95,9 +96,9 @@ class ToolResponseFormats:
                 "next_page_token": None,
                 "data": [
                     {
-                        "id": f"APP-{random.randint(1000, 9999)}",
+                        "id": f"APP-{rng.randint(1000, 9999)}",
                         "subject": "Software License Request",
-                        "display_id": f"DISP-{random.randint(100, 999)}",
+                        "display_id": f"DISP-{rng.randint(100, 999)}",
                         "approval_task_title": "Software License Approval",
                         "entity_type": "service_request",
                         "request_type": "license",
@@ -114,7 +115,7 @@ class ToolResponseFormats:
         }
     
     @staticmethod
-    def respond_to_user_tool_response() -> Dict[str, Any]:
+    def respond_to_user_tool_response(rng=random) -> Dict[str, Any]:
         """Format for RespondToUserTool based on finish_tool/atom_finish_tool.py"""
         return {
             "execution_status": "success",
@@ -125,7 +126,7 @@ class ToolResponseFormats:
         }
     
     @staticmethod
-    def system_diagnostic_tool_response() -> Dict[str, Any]:
+    def system_diagnostic_tool_response(rng=random) -> Dict[str, Any]:
         """Format for SystemDiagnosticTool based on mac_diagnosis_tools/system_diagnostic_tool.py"""
         return {
             "status": "healthy",
@@ -133,15 +134,15 @@ class ToolResponseFormats:
                 "diagnostic_results": {
                     "cpu": {
                         "status": "normal",
-                        "details": {"cpu_usage": f"{random.randint(20, 60)}%"}
+                        "details": {"cpu_usage": f"{rng.randint(20, 60)}%"}
                     },
                     "memory": {
                         "status": "normal", 
-                        "details": {"memory_usage": f"{random.randint(30, 70)}%"}
+                        "details": {"memory_usage": f"{rng.randint(30, 70)}%"}
                     },
                     "disk": {
                         "status": "normal",
-                        "details": {"disk_usage": f"{random.randint(40, 80)}%"}
+                        "details": {"disk_usage": f"{rng.randint(40, 80)}%"}
                     }
                 },
                 "critical_issues": []
@@ -149,7 +150,7 @@ class ToolResponseFormats:
         }
     
     @staticmethod
-    def browser_tool_response() -> Dict[str, Any]:
+    def browser_tool_response(rng=random) -> Dict[str, Any]:
         """Format for BrowserTool based on browser_tool/browser_tool.py"""
         return {
             "execution_status": "success",
@@ -157,7 +158,7 @@ class ToolResponseFormats:
         }
     
     @staticmethod
-    def tavily_tool_response() -> Dict[str, Any]:
+    def tavily_tool_response(rng=random) -> Dict[str, Any]:
         """Format for TavilyTool based on tavily_tool/tavily_tool.py"""
         return {
             "execution_status": "success",
@@ -0,0 +1,120 @@
+import contextlib
+import json
+import math
+import os
+import threading
+from statistics import NormalDist
+from typing import Dict, Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:
+    # no cross-process locking where fcntl is missing (Windows); threads still take _file_lock
+    fcntl = None
+
+ACCEPTANCE_STATS_FILE = os.path.join(os.path.expanduser("~"), ".cache", "syn-data", "acceptance_stats.json")
+# endpoint recorded for runs without a base_url
+DEFAULT_ENDPOINT = "https://api.openai.com/v1"
+
+_file_lock = threading.Lock()
+
+
+def _read_stats(path: str) -> Dict[str, Dict[str, float]]:
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (json.JSONDecodeError, OSError):
+        return {}
+
+
+@contextlib.contextmanager
+def _locked(path: str) -> Iterator[None]:
+    """holds an exclusive lock on `path`.lock, so shard processes sharing the stats file merge into it in turn"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with _file_lock, open(f"{path}.lock", 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+
+def stats_key(generator: str, model: str, endpoint: Optional[str] = None) -> str:
+    """
+    key of a generator's counts in the stats file: acceptance depends on the model and on the
+    endpoint serving it, e.g. utils/stub_server.py accepts nearly everything
+    """
+    return f"{generator} {model} {endpoint or DEFAULT_ENDPOINT}"
+
+
+class AcceptanceTracker:
+    """
+    tracks the share of submitted items that come back as valid conversations for one generator on
+    one model and endpoint (see stats_key).
+    counts from earlier runs are loaded from `stats_path` (capped at `max_history` observations so a
+    prompt change shows up quickly) and every finished round is added back to the file.
+    """
+
+    def __init__(self, key: str, stats_path: str = ACCEPTANCE_STATS_FILE, max_history: int = 500):
+        self.key = key
+        self.stats_path = stats_path
+        self.submitted = 0.0
+        self.valid = 0.0
+
+        past = _read_stats(stats_path).get(key)
+        if past and past.get("submitted"):
+            scale = min(1.0, max_history / past["submitted"])
+            self.submitted = past["submitted"] * scale
+            self.valid = past["valid"] * scale
+
+    @property
+    def rate(self) -> Optional[float]:
+        """observed acceptance rate, or None before the first observation"""
+        if not self.submitted:
+            return None
+        return self.valid / self.submitted
+
+    def batch_size(self, remaining: int, confidence: float = 0.9, max_factor: float = 4.0) -> int:
+        """
+        smallest batch expected to yield `remaining` valid conversations with probability `confidence`
+        args:
+            remaining: valid conversations still needed
+            confidence: target probability of reaching `remaining` in this round
+            max_factor: upper bound on the batch as a multiple of `remaining`
+        returns: number of items to submit
+        """
+        if self.rate is None:
+            # no history yet, fall back to the fixed over-generation margin
+            return min(remaining + max(5, remaining // 2), remaining * 2)
+
+        z = NormalDist().inv_cdf(confidence)
+        # Beta(valid + 1, rejected + 1) posterior; size against its lower bound so a short history
+        # does not make us overconfident
+        a, b = self.valid + 1, self.submitted - self.valid + 1
+        mean = a / (a + b)
+        sd = math.sqrt(a * b / ((a + b) ** 2 * (a + b + 1)))
+        p = min(max(mean - z * sd, 0.01), 1.0)
+
+        # smallest n with n*p - z*sqrt(n*p*(1-p)) >= remaining (normal approximation of the binomial)
+        root = (z * math.sqrt(p * (1 - p)) + math.sqrt(z * z * p * (1 - p) + 4 * p * remaining)) / (2 * p)
+        n = math.ceil(root * root)
+        return max(remaining, min(n, math.ceil(remaining * max_factor)))
+
+    def record(self, submitted: int, valid: int):
+        """adds one finished round to the in-memory estimate and to the stats file"""
+        if not submitted:
+            return
+        self.submitted += submitted
+        self.valid += valid
+
+        # read-modify-write under the lock, so concurrent rounds add up instead of overwriting each other
+        with _locked(self.stats_path):
+            stats = _read_stats(self.stats_path)
+            entry = stats.setdefault(self.key, {"submitted": 0, "valid": 0})
+            entry["submitted"] += submitted
+            entry["valid"] += valid
+
+            tmp_path = f"{self.stats_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(stats, f, indent=2)
+            os.replace(tmp_path, self.stats_path)
@@ -0,0 +1,202 @@
+import json
+import os
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from utils.fingerprints import FINGERPRINT_DIR, FingerprintStore, conversation_fingerprint
+from utils.writer import ConversationWriter, jsonl_path_for
+
+IN_FLIGHT = "in_flight"
+ACCEPTED = "accepted"
+REJECTED = "rejected"
+# rejection reasons that count against a seed when scheduling
+PENALIZED_REASONS = ("invalid", "schema", "duplicate")
+
+
+def manifest_path_for(output_file: str) -> str:
+    """path of the manifest that sits next to a run's JSONL output"""
+    return os.path.splitext(output_file)[0] + ".manifest.jsonl"
+
+
+class RunManifest:
+    """
+    append-only record of every (generator, seed_question, sample_index) item a run has submitted.
+    each line is one status change: in_flight when an item is sent to curator, then accepted or
+    rejected once its batch comes back. replaying the file gives the latest status per item, the
+    number of conversations already accepted and the batch that was in flight when the run died.
+    """
+
+    def __init__(self, path: str, resume: bool = True):
+        self.path = path
+        self.status: Dict[Tuple[str, str, int], str] = {}
+        self._in_flight: Dict[str, Dict[Tuple[str, int], None]] = defaultdict(dict)
+        self._accepted: Dict[str, int] = defaultdict(int)
+        self._next_index: Dict[Tuple[str, str], int] = defaultdict(int)
+        self._invalid: Dict[Tuple[str, str], int] = defaultdict(int)
+        self._labels: Dict[Tuple[str, str], Tuple[str, str]] = {}
+
+        if resume and os.path.exists(path):
+            self._replay()
+
+        output_dir = os.path.dirname(path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        self._file = open(path, 'a' if resume else 'w', encoding='utf-8')
+
+    def _replay(self):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    # torn last line after a crash
+                    continue
+                labels = (event["intent"], event["request_type"]) if "request_type" in event else None
+                self._apply(event["generator"], event["seed_question"], event["sample_index"], event["status"], event.get("reason"), labels)
+
+    def _apply(self, generator: str, seed_question: str, sample_index: int, status: str, reason: Optional[str] = None, labels: Optional[Tuple[str, str]] = None):
+        key = (generator, seed_question, sample_index)
+        previous = self.status.get(key)
+        self.status[key] = status
+
+        if previous == ACCEPTED:
+            self._accepted[generator] -= 1
+        if status == ACCEPTED:
+            self._accepted[generator] += 1
+
+        if status == IN_FLIGHT:
+            self._in_flight[generator][(seed_question, sample_index)] = None
+        elif previous == IN_FLIGHT:
+            self._in_flight[generator].pop((seed_question, sample_index), None)
+
+        seed_key = (generator, seed_question)
+        self._next_index[seed_key] = max(self._next_index[seed_key], sample_index + 1)
+        if status == REJECTED and reason in PENALIZED_REASONS:
+            self._invalid[seed_key] += 1
+        if labels:
+            self._labels[seed_key] = labels
+
+    def record(self, generator: str, seed_question: str, sample_index: int, status: str, reason: Optional[str] = None, labels: Optional[Tuple[str, str]] = None):
+        """
+        appends one status change
+        args:
+            reason: why a rejected item was rejected, see PENALIZED_REASONS
+            labels: (intent, request_type) of the seed, stored with in-flight items so a resumed run
+                renders them with the prompt they were first submitted with
+        """
+        event = {
+            "generator": generator,
+            "seed_question": seed_question,
+            "sample_index": sample_index,
+            "status": status
+        }
+        if reason:
+            event["reason"] = reason
+        if labels:
+            event["intent"], event["request_type"] = labels
+        self._file.write(json.dumps(event, ensure_ascii=False) + "\n")
+        self._apply(generator, seed_question, sample_index, status, reason, labels)
+
+    def next_sample_index(self, generator: str, seed_question: str) -> int:
+        """next unused sample index of a seed; recording the item as in flight claims it"""
+        return self._next_index[(generator, seed_question)]
+
+    def seed_history(self, generator: str) -> Dict[str, Tuple[int, int]]:
+        """seed question -> (times submitted, times its conversation failed validation or was a near duplicate)"""
+        return {
+            seed_question: (submitted, self._invalid[(name, seed_question)])
+            for (name, seed_question), submitted in self._next_index.items()
+            if name == generator
+        }
+
+    def seed_labels(self, generator: str) -> Dict[str, Tuple[str, str]]:
+        """seed question -> (intent, request_type) it was last submitted with, for seeds recorded with labels"""
+        return {seed_question: labels for (name, seed_question), labels in self._labels.items() if name == generator}
+
+    def accepted_count(self, generator: str) -> int:
+        return self._accepted[generator]
+
+    def total_accepted(self) -> int:
+        return sum(self._accepted.values())
+
+    def in_flight(self, generator: str) -> List[Tuple[str, int]]:
+        """items submitted by an interrupted batch, in their original order"""
+        return list(self._in_flight[generator])
+
+    def sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        if not self._file.closed:
+            self.sync()
+            self._file.close()
+
+    def __enter__(self) -> "RunManifest":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def _truncate_jsonl(path: str, keep: int) -> Tuple[int, int, List[list]]:
+    """
+    keeps the first `keep` complete lines of a JSONL file
+    returns: (kept lines, total turns of the kept conversations, conversations parsed from the dropped lines)
+    """
+    kept = 0
+    total_turns = 0
+    offset = 0
+    dropped = []
+    truncating = False
+    with open(path, 'rb') as f:
+        for line in f:
+            try:
+                conversation = json.loads(line)
+            except json.JSONDecodeError:
+                conversation = None
+            truncating = truncating or kept >= keep or conversation is None or not line.endswith(b"\n")
+            if truncating:
+                if conversation is not None:
+                    dropped.append(conversation)
+                continue
+            total_turns += len(conversation)
+            kept += 1
+            offset += len(line)
+    with open(path, 'r+b') as f:
+        f.truncate(offset)
+    return kept, total_turns, dropped
+
+
+def open_run(output_file: str, resume: bool = True, fingerprint_dir: Optional[str] = FINGERPRINT_DIR) -> Tuple[RunManifest, ConversationWriter]:
+    """
+    opens the manifest and JSONL writer of a checkpointed run
+    args:
+        output_file: the run's output JSON path; the JSONL file and manifest live next to it
+        resume: continue from an existing manifest instead of starting over
+        fingerprint_dir: FingerprintStore shared across runs that the writer checks every conversation
+            against, or None to write without cross-run duplicate suppression
+    returns: (manifest, writer) with the writer positioned after the last accepted conversation
+    """
+    jsonl_file = jsonl_path_for(output_file)
+    manifest = RunManifest(manifest_path_for(output_file), resume=resume)
+    fingerprints = FingerprintStore(fingerprint_dir) if fingerprint_dir else None
+
+    kept, total_turns = 0, 0
+    if resume and os.path.exists(jsonl_file):
+        # the writer is synced before the manifest, so any lines past the accepted count belong to
+        # a batch that never got recorded; that batch is resubmitted and served from curator's cache
+        kept, total_turns, dropped = _truncate_jsonl(jsonl_file, manifest.total_accepted())
+        if kept < manifest.total_accepted():
+            print(f"  ! {jsonl_file} holds {kept} conversations but the manifest accepted {manifest.total_accepted()}")
+        if fingerprints is not None and dropped:
+            # otherwise the resubmitted batch would be rejected as a copy of itself
+            fingerprints.discard(jsonl_file, map(conversation_fingerprint, dropped))
+    elif fingerprints is not None:
+        # the file is about to be overwritten, so what it held no longer counts as written
+        fingerprints.discard(jsonl_file)
+
+    writer = ConversationWriter(jsonl_file, append=resume, fingerprints=fingerprints)
+    writer.count = kept
+    writer.total_turns = total_turns
+    return manifest, writer
@@ -0,0 +1,157 @@
+import functools
+import re
+import zlib
+from collections import defaultdict
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# shingle hashes are 32 bit, so a * x + b stays below 2**64 for 32 bit a and b
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_WORD = re.compile(r"\w+")
+
+
+def conversation_text(conversation: List[Dict[str, Any]]) -> str:
+    """
+    the parts of a conversation that make it distinct from others of its kind: the user turns and the
+    RespondToUserTool responses. reasoning, tool plans and tool results are mostly dictated by the
+    prompt and would make every conversation of a generator look alike.
+    """
+    parts = []
+    for turn in conversation:
+        content = turn.get("content")
+        if turn.get("role") == "user" and isinstance(content, str):
+            parts.append(content)
+        elif turn.get("role") == "assistant" and isinstance(content, dict):
+            for call in content.get("tool_calls") or []:
+                if isinstance(call, dict) and call.get("tool") == "RespondToUserTool":
+                    response = (call.get("args") or {}).get("response")
+                    if isinstance(response, str):
+                        parts.append(response)
+    return "\n".join(parts)
+
+
+def shingles(text: str, size: int = 5) -> Iterable[int]:
+    """32 bit hashes of the lowercased word `size`-grams of `text`; short texts give one shingle"""
+    words = _WORD.findall(text.lower())
+    if len(words) <= size:
+        return {zlib.crc32(" ".join(words).encode("utf-8"))}
+    return {zlib.crc32(" ".join(words[i:i + size]).encode("utf-8")) for i in range(len(words) - size + 1)}
+
+
+def _area(f, lower: float, upper: float, steps: int = 100) -> float:
+    """trapezoid rule over [lower, upper]"""
+    x = np.linspace(lower, upper, steps + 1)
+    y = f(x)
+    return float((y[:-1] + y[1:]).sum() * (upper - lower) / (2 * steps))
+
+
+@functools.lru_cache(maxsize=None)
+def lsh_params(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """(bands, rows) with bands * rows <= num_perm minimising false positive + false negative area"""
+    best = None
+    for bands in range(1, num_perm + 1):
+        for rows in range(1, num_perm // bands + 1):
+            false_positive = _area(lambda x: 1 - (1 - x ** rows) ** bands, 0.0, threshold)
+            false_negative = _area(lambda x: (1 - x ** rows) ** bands, threshold, 1.0)
+            error = false_positive + false_negative
+            if best is None or error < best[0]:
+                best = (error, bands, rows)
+    return best[1], best[2]
+
+
+class MinHashLSH:
+    """
+    streaming near-duplicate index over MinHash signatures of shingle sets.
+    candidates come from banded LSH buckets and are confirmed with the signature's Jaccard estimate.
+    """
+
+    def __init__(self, threshold: float = 0.8, num_perm: int = 128, seed: int = 1):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+        self.bands, self.rows = lsh_params(threshold, num_perm)
+        self._buckets: List[Dict[bytes, List[Hashable]]] = [defaultdict(list) for _ in range(self.bands)]
+        self._signatures: Dict[Hashable, np.ndarray] = {}
+
+    def signature(self, shingle_hashes: Iterable[int]) -> np.ndarray:
+        values = np.fromiter(shingle_hashes, dtype=np.uint64)
+        if not len(values):
+            return np.full(self.num_perm, _MAX_HASH, dtype=np.uint32)
+        hashed = (values[:, None] * self._a + self._b) % _MERSENNE_PRIME & _MAX_HASH
+        return hashed.min(axis=0).astype(np.uint32)
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+    def query(self, signature: np.ndarray) -> Optional[Hashable]:
+        """key of an indexed item whose estimated Jaccard similarity reaches the threshold, or None"""
+        seen = set()
+        for bucket, band_key in zip(self._buckets, self._band_keys(signature)):
+            for key in bucket.get(band_key, ()):
+                if key in seen:
+                    continue
+                seen.add(key)
+                if np.count_nonzero(self._signatures[key] == signature) >= self.threshold * self.num_perm:
+                    return key
+        return None
+
+    def insert(self, key: Hashable, signature: np.ndarray):
+        self._signatures[key] = signature
+        for bucket, band_key in zip(self._buckets, self._band_keys(signature)):
+            bucket[band_key].append(key)
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+
+class NearDuplicateFilter:
+    """
+    rejects conversations whose user turns and final responses nearly repeat an accepted one,
+    and keeps per-seed counts of how often that happened
+    """
+
+    def __init__(self, threshold: float = 0.8, num_perm: int = 128, shingle_size: int = 5):
+        self.index = MinHashLSH(threshold, num_perm)
+        self.shingle_size = shingle_size
+        self.checked: Dict[str, int] = defaultdict(int)
+        self.duplicates: Dict[str, int] = defaultdict(int)
+        self._checked: Optional[Tuple[Hashable, np.ndarray]] = None
+
+    def check(self, key: Hashable, conversation: List[Dict[str, Any]], seed_question: Optional[str] = None) -> Optional[Hashable]:
+        """
+        looks `conversation` up without indexing it; call accept(key) once it is actually kept, so
+        conversations rejected later (e.g. by the writer) do not shadow later ones
+        returns: key of the conversation it duplicates, or None if it is new
+        """
+        signature = self.index.signature(shingles(conversation_text(conversation), self.shingle_size))
+        duplicate_of = self.index.query(signature)
+        if seed_question is not None:
+            self.checked[seed_question] += 1
+            if duplicate_of is not None:
+                self.duplicates[seed_question] += 1
+        self._checked = (key, signature) if duplicate_of is None else None
+        return duplicate_of
+
+    def accept(self, key: Hashable):
+        """indexes the conversation last passed to check() under `key`"""
+        if self._checked is None or self._checked[0] != key:
+            raise ValueError(f"{key!r} is not the last conversation checked as new")
+        self.index.insert(*self._checked)
+        self._checked = None
+
+    def add(self, key: Hashable, conversation: List[Dict[str, Any]]):
+        """indexes an already accepted conversation, e.g. from an earlier run, without counting it"""
+        self.index.insert(key, self.index.signature(shingles(conversation_text(conversation), self.shingle_size)))
+
+    def duplicate_rate(self) -> float:
+        checked = sum(self.checked.values())
+        return sum(self.duplicates.values()) / checked if checked else 0.0
+
+    def worst_seeds(self, limit: int = 5) -> List[Tuple[str, int, int]]:
+        """(seed question, duplicates, checked) for the seeds with the most duplicates"""
+        ranked = sorted(self.duplicates.items(), key=lambda item: (-item[1], item[0]))[:limit]
+        return [(seed, duplicates, self.checked[seed]) for seed, duplicates in ranked]
@@ -0,0 +1,184 @@
+import hashlib
+import json
+import math
+import mmap
+import os
+import sqlite3
+import struct
+from typing import Any, Dict, Iterable, List, Optional
+
+FINGERPRINT_DIR = os.path.join(os.path.expanduser("~"), ".cache", "syn-data", "fingerprints")
+
+_BLOOM_MAGIC = b"SDBLOOM1"
+# magic, number of bits, number of hash functions
+_BLOOM_HEADER = struct.Struct("<8sQQ")
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, str):
+        return " ".join(value.split()).casefold()
+    if isinstance(value, dict):
+        return {key: _normalize(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_normalize(item) for item in value]
+    return value
+
+
+def conversation_fingerprint(conversation: List[Dict[str, Any]]) -> bytes:
+    """
+    128 bit hash of a conversation with case, whitespace runs and key order normalized away,
+    so re-serialized or re-indented copies of the same conversation collide
+    """
+    text = json.dumps(_normalize(conversation), sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+class BloomFilter:
+    """
+    file-backed Bloom filter over 128 bit fingerprints, memory-mapped so opening it costs nothing
+    and processes sharing the file see each other's bits. the file is created sparse.
+    """
+
+    def __init__(self, path: str, capacity: int, error_rate: float):
+        if not os.path.exists(path):
+            num_bits = max(64, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+            num_hashes = max(1, round(num_bits / capacity * math.log(2)))
+            with open(path, "wb") as f:
+                f.write(_BLOOM_HEADER.pack(_BLOOM_MAGIC, num_bits, num_hashes))
+                f.truncate(_BLOOM_HEADER.size + (num_bits + 7) // 8)
+
+        self.path = path
+        self._file = open(path, "r+b")
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        magic, self.num_bits, self.num_hashes = _BLOOM_HEADER.unpack_from(self._map)
+        if magic != _BLOOM_MAGIC:
+            raise ValueError(f"{path} is not a fingerprint Bloom filter")
+        self.capacity = math.floor(self.num_bits * math.log(2) / self.num_hashes)
+
+    def _positions(self, fingerprint: bytes) -> Iterable[int]:
+        # double hashing over the two halves of the fingerprint
+        first = int.from_bytes(fingerprint[:8], "little")
+        step = int.from_bytes(fingerprint[8:16], "little") | 1
+        return ((first + i * step) % self.num_bits for i in range(self.num_hashes))
+
+    def __contains__(self, fingerprint: bytes) -> bool:
+        offset = _BLOOM_HEADER.size
+        return all(self._map[offset + (position >> 3)] >> (position & 7) & 1 for position in self._positions(fingerprint))
+
+    def add(self, fingerprint: bytes):
+        offset = _BLOOM_HEADER.size
+        for position in self._positions(fingerprint):
+            self._map[offset + (position >> 3)] |= 1 << (position & 7)
+
+    def close(self):
+        if not self._file.closed:
+            self._map.flush()
+            self._map.close()
+            self._file.close()
+
+
+class FingerprintStore:
+    """
+    on-disk set of conversation fingerprints shared by every run, so a conversation produced by an
+    earlier run (or another category) is not written again.
+    a Bloom filter answers most lookups without touching the disk; its positives, and every insert,
+    go through an sqlite table that is the exact record. each fingerprint remembers the JSONL file
+    it was written to, so a file that is truncated or rewritten can hand its fingerprints back.
+    inserts become durable on commit(), which ConversationWriter calls when it syncs.
+    """
+
+    def __init__(self, directory: str = FINGERPRINT_DIR, capacity: int = 20_000_000, error_rate: float = 0.001):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.error_rate = error_rate
+        self._db = sqlite3.connect(os.path.join(directory, "fingerprints.sqlite"), timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS sources (id INTEGER PRIMARY KEY, path TEXT UNIQUE NOT NULL);
+            CREATE TABLE IF NOT EXISTS fingerprints (fingerprint BLOB PRIMARY KEY, source_id INTEGER NOT NULL) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS fingerprints_source ON fingerprints (source_id);
+            CREATE TABLE IF NOT EXISTS stats (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            INSERT OR IGNORE INTO stats VALUES ('count', 0);
+        """)
+        self._source_ids: Dict[str, int] = {}
+        self._count_delta = 0
+
+        bloom_path = os.path.join(directory, "fingerprints.bloom")
+        self.bloom = BloomFilter(bloom_path, capacity, error_rate)
+        if len(self) > self.bloom.capacity:
+            self._rebuild_bloom(bloom_path, 2 * len(self))
+
+    def _rebuild_bloom(self, bloom_path: str, capacity: int):
+        """replaces an overfull filter with a larger one filled from the exact table"""
+        self.bloom.close()
+        staging_path = f"{bloom_path}.{os.getpid()}.tmp"
+        bloom = BloomFilter(staging_path, capacity, self.error_rate)
+        for (fingerprint,) in self._db.execute("SELECT fingerprint FROM fingerprints"):
+            bloom.add(fingerprint)
+        bloom.close()
+        os.replace(staging_path, bloom_path)
+        self.bloom = BloomFilter(bloom_path, capacity, self.error_rate)
+
+    def _source_id(self, source: str) -> int:
+        source = os.path.abspath(source)
+        if source not in self._source_ids:
+            self._db.execute("INSERT OR IGNORE INTO sources (path) VALUES (?)", (source,))
+            self._source_ids[source] = self._db.execute("SELECT id FROM sources WHERE path = ?", (source,)).fetchone()[0]
+        return self._source_ids[source]
+
+    def __contains__(self, fingerprint: bytes) -> bool:
+        if fingerprint not in self.bloom:
+            return False
+        return self._db.execute("SELECT 1 FROM fingerprints WHERE fingerprint = ?", (fingerprint,)).fetchone() is not None
+
+    def add(self, fingerprint: bytes, source: str) -> bool:
+        """
+        records `fingerprint` as written to `source`
+        returns: False if it was already in the store, True if it is new
+        """
+        if fingerprint in self:
+            return False
+        # a Bloom miss can be stale when another process rebuilt the filter, the primary key is not
+        inserted = self._db.execute(
+            "INSERT OR IGNORE INTO fingerprints VALUES (?, ?)", (fingerprint, self._source_id(source))
+        ).rowcount == 1
+        self.bloom.add(fingerprint)
+        self._count_delta += inserted
+        return inserted
+
+    def discard(self, source: str, fingerprints: Optional[Iterable[bytes]] = None):
+        """
+        forgets fingerprints recorded for `source`, e.g. lines truncated from its tail; all of them
+        when `fingerprints` is None. the Bloom filter keeps their bits, so they only cost a lookup.
+        """
+        source_id = self._source_id(source)
+        if fingerprints is None:
+            removed = self._db.execute("DELETE FROM fingerprints WHERE source_id = ?", (source_id,)).rowcount
+        else:
+            removed = self._db.executemany(
+                "DELETE FROM fingerprints WHERE fingerprint = ? AND source_id = ?",
+                ((fingerprint, source_id) for fingerprint in fingerprints)
+            ).rowcount
+        self._count_delta -= max(removed, 0)
+        self.commit()
+
+    def commit(self):
+        if self._count_delta:
+            self._db.execute("UPDATE stats SET value = value + ? WHERE key = 'count'", (self._count_delta,))
+            self._count_delta = 0
+        self._db.commit()
+
+    def __len__(self) -> int:
+        return self._db.execute("SELECT value FROM stats WHERE key = 'count'").fetchone()[0] + self._count_delta
+
+    def close(self):
+        self.commit()
+        self._db.close()
+        self.bloom.close()
+
+    def __enter__(self) -> "FingerprintStore":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,162 @@
+"""
+BM25 search over the fixture catalog and knowledge base (tool_fixtures.yaml) behind the simulated
+FindCatalogTool and KnowledgeSearchTool (utils/tool_execution.py).
+
+both corpora go into an inverted index whose postings hold each term's precomputed BM25 weight in
+each document, so a lookup only sums the postings of the query's terms. lookups are cached per
+normalized query (its set of terms), and the index warms that cache with the taxonomy seed
+questions, which is what most tool queries are built from.
+"""
+import functools
+import math
+import os
+import re
+import threading
+from typing import Any, Dict, Iterable, List, Tuple
+
+import yaml
+
+from utils.taxonomy import taxonomy_index
+
+FIXTURES_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tool_fixtures.yaml")
+# hits scoring below this share of the best hit's score are dropped
+RELATIVE_CUTOFF = 0.5
+LOOKUP_CACHE_SIZE = 1 << 16
+
+_WORD = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset("""
+a after an and any are as at be before but can do does for from get got how i if in is it its me my need not of on or our please
+should so that the their there this to up us we what when where which who why will with you your
+""".split())
+# words nearly every help-desk query uses ("I need to request...", "report an issue"); a document
+# sharing only these with a query is not about it, so they are not indexed either
+_GENERIC_TERMS = frozenset("""
+access detail form guide help info information issue new problem procedure process report request
+requesting step support want working
+""".split())
+# libyaml loader when PyYAML was built with it, the pure-Python one otherwise
+_Loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+_memo: Dict[str, Tuple[Tuple[int, int], "FixtureIndex"]] = {}
+_memo_lock = threading.Lock()
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    lowercased words without stopwords or generic help-desk words, with a plural "s" stripped so
+    "laptops" finds "laptop"
+    """
+    terms = []
+    for word in _WORD.findall(text.lower()):
+        if word in _STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        if word not in _GENERIC_TERMS:
+            terms.append(word)
+    return terms
+
+
+def normalize_query(query: str) -> Tuple[str, ...]:
+    """the cache key of a query: BM25 ignores term order, and repeated query terms are counted once"""
+    return tuple(sorted(set(tokenize(query))))
+
+
+class BM25Index:
+    """
+    inverted index of tokenized documents with Okapi BM25 scoring. each posting stores the term's
+    full weight in the document, idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / avg_length)),
+    so scoring a query is a sum over its terms' postings.
+    """
+
+    def __init__(self, documents: List[List[str]], k1: float = 1.2, b: float = 0.75):
+        self.size = len(documents)
+        avg_length = sum(len(terms) for terms in documents) / max(self.size, 1) or 1.0
+        frequencies: Dict[str, Dict[int, int]] = {}
+        for document, terms in enumerate(documents):
+            for term in terms:
+                counts = frequencies.setdefault(term, {})
+                counts[document] = counts.get(document, 0) + 1
+
+        self.postings: Dict[str, List[Tuple[int, float]]] = {}
+        for term, counts in frequencies.items():
+            idf = math.log(1 + (self.size - len(counts) + 0.5) / (len(counts) + 0.5))
+            self.postings[term] = [
+                (document, idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(documents[document]) / avg_length)))
+                for document, tf in counts.items()
+            ]
+
+    def search(self, terms: Iterable[str], limit: int = 3) -> List[Tuple[int, float]]:
+        """returns: up to `limit` (document, score) pairs, best first; documents sharing no term are left out"""
+        scores: Dict[int, float] = {}
+        for term in set(terms):
+            for document, weight in self.postings.get(term, ()):
+                scores[document] = scores.get(document, 0.0) + weight
+        ranked = sorted(scores.items(), key=lambda hit: (-hit[1], hit[0]))[:limit]
+        return [hit for hit in ranked if hit[1] >= RELATIVE_CUTOFF * ranked[0][1]] if ranked else []
+
+
+def _catalog_text(item: Dict[str, Any]) -> str:
+    # the name is repeated so a match on it outweighs one in the description
+    return " ".join([item["item_name"], item["item_name"], item.get("category", ""), item.get("description", "")] + item.get("tags", []))
+
+
+def _article_text(article: Dict[str, Any]) -> str:
+    return " ".join([article["title"], article["title"], article.get("summary", "")])
+
+
+class FixtureIndex:
+    """
+    the fixture catalog items and knowledge-base articles with a BM25 index over each. lookups
+    return the fixture dicts themselves, which callers copy rather than modify.
+    """
+
+    def __init__(self, fixtures: Dict[str, Any]):
+        self.catalog: List[Dict[str, Any]] = fixtures.get("catalog") or []
+        self.articles: List[Dict[str, Any]] = fixtures.get("knowledge_base") or []
+        self._catalog_index = BM25Index([tokenize(_catalog_text(item)) for item in self.catalog])
+        self._article_index = BM25Index([tokenize(_article_text(article)) for article in self.articles])
+        # raw query -> terms in front of terms -> hits: repeated strings skip tokenizing as well
+        self._normalize = functools.lru_cache(maxsize=LOOKUP_CACHE_SIZE)(normalize_query)
+        self._lookup = functools.lru_cache(maxsize=LOOKUP_CACHE_SIZE)(self._search)
+
+    def _search(self, corpus: str, terms: Tuple[str, ...]) -> Tuple[int, ...]:
+        index = self._catalog_index if corpus == "catalog" else self._article_index
+        return tuple(document for document, _ in index.search(terms))
+
+    def search_catalog(self, query: str) -> List[Dict[str, Any]]:
+        """catalog items matching `query`, best first (at most 3)"""
+        return [self.catalog[document] for document in self._lookup("catalog", self._normalize(query))]
+
+    def search_knowledge(self, query: str) -> List[Dict[str, Any]]:
+        """knowledge-base articles matching `query`, best first (at most 3)"""
+        return [self.articles[document] for document in self._lookup("knowledge_base", self._normalize(query))]
+
+    def warm(self, queries: Iterable[str]) -> None:
+        """precomputes the lookups of `queries` in both corpora"""
+        for query in queries:
+            terms = self._normalize(query)
+            self._lookup("catalog", terms)
+            self._lookup("knowledge_base", terms)
+
+
+def fixture_index(file_path: str = FIXTURES_FILE) -> FixtureIndex:
+    """
+    the index for a fixtures file, memoized in-process on (mtime, size) and warmed with the
+    taxonomy seed questions
+    args: file_path: fixtures yaml, syn-data/tool_fixtures.yaml by default
+    returns: FixtureIndex
+    """
+    file_path = os.path.abspath(file_path)
+    stat = os.stat(file_path)
+    key = (stat.st_mtime_ns, stat.st_size)
+
+    with _memo_lock:
+        memoized = _memo.get(file_path)
+        if memoized and memoized[0] == key:
+            return memoized[1]
+        with open(file_path, 'rb') as f:
+            index = FixtureIndex(yaml.load(f, Loader=_Loader) or {})
+        index.warm(taxonomy_index().seeds)
+        _memo[file_path] = (key, index)
+        return index
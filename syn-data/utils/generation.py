@@ -0,0 +1,326 @@
+import json
+from collections import Counter
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Type
+
+from datasets import Dataset
+from bespokelabs import curator
+from pydantic import TypeAdapter
+
+from utils.acceptance import AcceptanceTracker, stats_key
+from utils.checkpoint import ACCEPTED, IN_FLIGHT, REJECTED, RunManifest
+from utils.dedup import NearDuplicateFilter
+from utils.prompt_templates import INLINE_LAYOUT
+from utils.rate_budget import BudgetShare
+from utils.seed_scheduler import SeedScheduler
+from utils.validation import validate_assistant_turns
+from utils.writer import ConversationWriter, iter_conversations
+
+MODEL_NAME = "o3-2025-04-16"
+
+DEFAULT_BACKEND_PARAMS = {
+    "max_retries": 3,
+    "max_requests_per_minute": 60,
+    "max_tokens_per_minute": 100000
+}
+
+_TURNS = TypeAdapter(List[Any])
+
+# batch API: requests go out as uploaded files and are polled, outside the per-minute limits
+BATCH_BACKEND_PARAMS = {
+    "max_retries": 3,
+    "batch_size": 10000,
+    "batch_check_interval": 60
+}
+
+
+def build_generator(generator_cls: Type[curator.LLM], generation_params: Dict[str, Any], *backend_overrides: Optional[Dict[str, Any]], batch: bool = False) -> curator.LLM:
+    backend_params = dict(BATCH_BACKEND_PARAMS if batch else DEFAULT_BACKEND_PARAMS)
+    for overrides in backend_overrides:
+        backend_params.update(overrides or {})
+    completion_format = getattr(generator_cls, "completion_format", None)
+    if completion_format is not None:
+        # same request body curator builds for response_format
+        generation_params = dict(generation_params, response_format={
+            "type": "json_schema",
+            "json_schema": {"name": "output_schema", "schema": completion_format.model_json_schema()}
+        })
+    if batch and getattr(generator_cls, "return_completions_object", False):
+        # curator's batch processor prices the completion with litellm, which only takes message text;
+        # batch rows carry the bare content and parse() goes without the usage columns
+        generator_cls = type(generator_cls.__name__, (generator_cls,), {"return_completions_object": False})
+    return generator_cls(
+        model_name=MODEL_NAME,
+        backend="openai",
+        batch=batch,
+        backend_params=backend_params,
+        generation_params=generation_params
+    )
+
+
+def result_rows(results: Any, batch_size: int = 1000) -> Iterator[Dict]:
+    """
+    iterates the rows of a curator response lazily instead of materializing the whole batch.
+    a datasets.Dataset is read `batch_size` rows at a time as columns, which skips the per-row
+    formatting of plain iteration and is about twice as fast
+    """
+    if hasattr(results, 'dataset') and results.dataset is not None:
+        result_dataset = results.dataset
+        if hasattr(result_dataset, 'iter'):
+            for columns in result_dataset.iter(batch_size=batch_size):
+                names = list(columns)
+                for values in zip(*columns.values()):
+                    yield dict(zip(names, values))
+        elif hasattr(result_dataset, '__iter__'):
+            yield from result_dataset
+        elif hasattr(result_dataset, 'to_list'):
+            yield from result_dataset.to_list()
+
+
+def unpack_response(response: Any, response_format: Type[Any]) -> Tuple[Any, Dict[str, int]]:
+    """
+    splits what curator hands to parse() into the structured response and its prompt token usage.
+    generators set return_completions_object, so this is normally the raw chat.completion object;
+    batch runs hand over the message content as a JSON string, and an already validated instance
+    passes through, both with no usage.
+    args:
+        response: chat.completion dict, message content or response_format instance
+        response_format: pydantic model the message content is validated against
+    returns: (response_format instance, {"prompt_tokens", "cached_prompt_tokens"} or {})
+    """
+    if isinstance(response, str):
+        return response_format.model_validate_json(response), {}
+    if not isinstance(response, dict) or "choices" not in response:
+        return response, {}
+    message = response["choices"][0]["message"]
+    content = message.get("parsed") or message["content"]
+    if isinstance(content, str):
+        parsed = response_format.model_validate_json(content)
+    else:
+        parsed = response_format.model_validate(content)
+
+    usage = response.get("usage") or {}
+    details = usage.get("prompt_tokens_details") or {}
+    return parsed, {
+        "prompt_tokens": usage.get("prompt_tokens") or 0,
+        "cached_prompt_tokens": details.get("cached_tokens") or 0
+    }
+
+
+def dump_conversation(turns: List[Any]) -> str:
+    """
+    the full_conversation column of a parsed response: its turns as one JSON line, encoded by
+    pydantic's native serializer (several times faster than json.dumps over rebuilt dicts). the
+    retry loop decodes it once for validation and hands the same text to the writer.
+    args:
+        turns: ConversationTurn models, or plain {"role", "content"} dicts
+    """
+    return _TURNS.dump_json(turns).decode("utf-8")
+
+
+def load_conversation(result: Any) -> Optional[List[Dict]]:
+    if not isinstance(result, dict) or "full_conversation" not in result:
+        return None
+    try:
+        return json.loads(result["full_conversation"])
+    except (json.JSONDecodeError, TypeError):
+        if isinstance(result["full_conversation"], list):
+            return result["full_conversation"]
+    return None
+
+
+def generate_conversations(
+    generator_cls: Type[curator.LLM],
+    label: str,
+    scheduler: SeedScheduler,
+    num_conversations: int,
+    is_valid: Callable[[List[Dict]], bool],
+    generation_params: Dict[str, Any],
+    writer: ConversationWriter,
+    manifest: RunManifest,
+    rate_budget: Optional[BudgetShare] = None,
+    max_retries: int = 3,
+    confidence: float = 0.9,
+    backend_params: Optional[Dict[str, Any]] = None,
+    prompt_layout: str = INLINE_LAYOUT,
+    batch: bool = False,
+    dedup_threshold: Optional[float] = 0.8
+) -> int:
+    """
+    runs the generator until `num_conversations` conversations pass `is_valid` or the retries run out
+    args:
+        generator_cls: curator.LLM subclass reading `seed_question`, `sample_index`, `request_type` and
+            `prompt_layout` and producing `seed_question`, `sample_index`, `full_conversation` and
+            (when the backend reports usage) `prompt_tokens` / `cached_prompt_tokens` columns
+        label: human readable category name used in progress output
+        scheduler: hands out the seeds of each batch; restored from the manifest's seed history
+        num_conversations: number of conversations wanted
+        is_valid: predicate deciding whether a parsed conversation is kept; conversations it keeps must
+            also have every assistant turn match RESPONSE_SCHEMA, apart from the positions listed in the
+            generator's `string_turns`, or they are rejected as "schema"
+        generation_params: curator generation params, e.g. max_completion_tokens
+        writer: accepted conversations are appended here as soon as they are validated; a conversation
+            its fingerprint store has already seen is rejected as "seen" without filling a slot
+        manifest: checkpoint of the run; accepted items count towards the target and a batch left
+            in flight by an interrupted run is resubmitted as-is before any new work
+        rate_budget: optional share of a budget used by several generators at once; the limits are
+            re-read before every attempt so capacity released by finished categories is picked up
+        max_retries: number of curator batches before giving up
+        confidence: probability with which each batch should reach the target in one round, given the
+            acceptance rate measured for this generator in earlier rounds and runs
+        backend_params: extra curator backend params, e.g. a base_url pointing at utils/stub_server.py
+        prompt_layout: INLINE_LAYOUT or PREFIX_LAYOUT, see utils.prompt_templates.layout_template
+        batch: submit every round through the provider's batch API and poll for it instead of calling
+            the chat endpoint; results go through the same parse() and validation. rate_budget is
+            released straight away since batches do not draw on the per-minute limits
+        dedup_threshold: estimated Jaccard similarity (MinHash/LSH over user turns and final responses)
+            at which a valid conversation counts as a near duplicate of an accepted one and is rejected
+            without filling a slot; None disables the check
+    returns: number of accepted conversations, including those accepted by earlier runs
+    """
+    if batch and rate_budget:
+        rate_budget.release()
+        rate_budget = None
+    generator = None if rate_budget else build_generator(generator_cls, generation_params, backend_params, batch=batch)
+    tokens_per_request = generation_params.get("max_completion_tokens", 4096)
+
+    generator_key = generator_cls.__name__
+    string_turns = getattr(generator_cls, "string_turns", ())
+    accepted = manifest.accepted_count(generator_key)
+    pending = manifest.in_flight(generator_key)
+    retry_count = 0
+    scheduler.restore(manifest.seed_history(generator_key), manifest.seed_labels(generator_key))
+    acceptance = AcceptanceTracker(stats_key(generator_key, MODEL_NAME, (backend_params or {}).get("base_url")))
+    run_prompt_tokens = run_cached_tokens = 0
+
+    dedup = NearDuplicateFilter(dedup_threshold) if dedup_threshold else None
+    if dedup and accepted:
+        # conversations accepted by earlier runs stay in the index
+        for position, conversation in enumerate(iter_conversations(writer.path)):
+            dedup.add(("accepted", position), conversation)
+
+    if accepted or pending:
+        print(f"Resuming {label}: {accepted} accepted, {len(pending)} in flight")
+
+    try:
+        while accepted < num_conversations and retry_count < max_retries:
+            remaining_count = num_conversations - accepted
+
+            # Generate enough extra to account for filtering at the measured acceptance rate
+            predicted_rate = acceptance.rate
+            generation_count = acceptance.batch_size(remaining_count, confidence)
+
+            if rate_budget:
+                rate_budget.update(generation_count, generation_count * tokens_per_request)
+                share_params = rate_budget.backend_params()
+                generator = build_generator(generator_cls, generation_params, share_params, backend_params)
+                print(f"  [{label}] rate share: {share_params['max_requests_per_minute']} req/min, {share_params['max_tokens_per_minute']} tok/min")
+
+            if pending:
+                # Same items in the same order, so curator serves the finished part from its cache
+                items, pending = pending, []
+                print(f"Resubmitting {len(items)} in-flight {label} items (attempt {retry_count + 1}, need {remaining_count} more)...")
+            else:
+                print(f"Generating {generation_count} {label} conversations (attempt {retry_count + 1}, need {remaining_count} more)...")
+                items = []
+                for seed_question in scheduler.next_batch(generation_count):
+                    sample_index = manifest.next_sample_index(generator_key, seed_question)
+                    manifest.record(generator_key, seed_question, sample_index, IN_FLIGHT, labels=(scheduler.intent_of[seed_question], scheduler.request_type_of[seed_question]))
+                    items.append((seed_question, sample_index))
+                manifest.sync()
+
+            dataset_items = []
+            for seed_question, sample_index in items:
+                dataset_items.append({
+                    "seed_question": seed_question,
+                    "sample_index": sample_index,
+                    "request_type": scheduler.request_type_of[seed_question],
+                    "prompt_layout": prompt_layout
+                })
+
+            input_dataset = Dataset.from_list(dataset_items)
+            results = generator(input_dataset)
+
+            valid_count = 0
+            written = {}
+            invalid_seeds = []
+            prompt_tokens = cached_tokens = 0
+            duplicate_count = 0
+            seen_count = 0
+            schema_reasons = Counter()
+            for result in result_rows(results):
+                prompt_tokens += result.get("prompt_tokens") or 0
+                cached_tokens += result.get("cached_prompt_tokens") or 0
+                item = (result.get("seed_question"), result.get("sample_index"))
+                if manifest.status.get((generator_key,) + item) != IN_FLIGHT or item in written:
+                    continue
+                conversation = load_conversation(result)
+                if conversation is None or not is_valid(conversation):
+                    manifest.record(generator_key, *item, REJECTED, reason="invalid")
+                    invalid_seeds.append(item[0])
+                    continue
+                turn_errors = validate_assistant_turns(conversation, string_turns)
+                if turn_errors:
+                    manifest.record(generator_key, *item, REJECTED, reason="schema")
+                    invalid_seeds.append(item[0])
+                    schema_reasons.update(error.reason for error in turn_errors)
+                    continue
+                # Drop extras if we got more than requested
+                if accepted >= num_conversations:
+                    valid_count += 1
+                    manifest.record(generator_key, *item, REJECTED, reason="surplus")
+                    continue
+                if dedup and dedup.check(item, conversation, item[0]) is not None:
+                    manifest.record(generator_key, *item, REJECTED, reason="duplicate")
+                    invalid_seeds.append(item[0])
+                    duplicate_count += 1
+                    continue
+                # the text parse() produced is written as is rather than encoded a second time
+                serialized = result["full_conversation"] if isinstance(result["full_conversation"], str) else None
+                if not writer.write(conversation, serialized):
+                    # an exact copy of a conversation some run already wrote, e.g. a cached response;
+                    # says nothing about the seed, so it is not penalized
+                    manifest.record(generator_key, *item, REJECTED, reason="seen")
+                    seen_count += 1
+                    continue
+                if dedup:
+                    dedup.accept(item)
+                valid_count += 1
+                written[item] = None
+                accepted += 1
+            # conversations must be durable before the manifest claims them
+            writer.sync()
+            for item in written:
+                manifest.record(generator_key, *item, ACCEPTED)
+            for seed_question, sample_index in items:
+                if manifest.status.get((generator_key, seed_question, sample_index)) == IN_FLIGHT:
+                    manifest.record(generator_key, seed_question, sample_index, REJECTED, reason="no_response")
+            manifest.sync()
+            scheduler.record_rejected(invalid_seeds)
+            acceptance.record(len(items), valid_count)
+            retry_count += 1
+
+            print(f"  → Generated {valid_count} valid conversations, total: {accepted}/{num_conversations}")
+            predicted = f"{predicted_rate:.0%}" if predicted_rate is not None else "n/a"
+            print(f"  → Acceptance rate: predicted {predicted}, actual {valid_count / len(items):.0%} ({valid_count}/{len(items)})")
+            if schema_reasons:
+                top_reasons = ", ".join(f"{reason} ({count})" for reason, count in schema_reasons.most_common(3))
+                print(f"  → Assistant turns failing RESPONSE_SCHEMA: {sum(schema_reasons.values())}, most often {top_reasons}")
+            if dedup:
+                print(f"  → Near duplicates: {duplicate_count} rejected this round, {dedup.duplicate_rate():.0%} of valid conversations this run")
+            if seen_count:
+                print(f"  → Already written by an earlier run: {seen_count} rejected this round")
+            if prompt_tokens:
+                run_prompt_tokens += prompt_tokens
+                run_cached_tokens += cached_tokens
+                print(f"  → Input tokens ({prompt_layout} layout): {cached_tokens} cached, {prompt_tokens - cached_tokens} uncached ({cached_tokens / prompt_tokens:.0%} cached)")
+    finally:
+        if rate_budget:
+            rate_budget.release()
+        if dedup and dedup.duplicates:
+            print(f"  [{label}] seeds with the most near duplicates:")
+            for seed_question, duplicates, checked in dedup.worst_seeds():
+                print(f"    {duplicates}/{checked} ({duplicates / checked:.0%}) {seed_question}")
+        if run_prompt_tokens:
+            print(f"  [{label}] input tokens this run: {run_cached_tokens} cached, {run_prompt_tokens - run_cached_tokens} uncached ({run_cached_tokens / run_prompt_tokens:.0%} cached)")
+
+    return accepted
@@ -0,0 +1,182 @@
+import functools
+import json
+import os
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+from utils.writer import iter_conversations
+
+# how a turn row holds its content
+TEXT = "text"          # a plain string, in `text`
+RESPONSE = "response"  # an agent response, in `reasoning` / `tool_planning_strategy` / `tool_calls`
+JSON = "json"          # anything else (tool results, malformed responses), JSON encoded in `text`
+
+TOOL_CALL_FIELDS = ("tool", "tool_running_message", "tool_completed_message", "tool_failed_message", "args")
+_RESPONSE_KEYS = frozenset(("reasoning", "tool_planning_strategy", "tool_calls"))
+_TOOL_CALL_KEYS = frozenset(TOOL_CALL_FIELDS)
+
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("Parquet output requires pyarrow: pip install pyarrow") from e
+    return pa, pq
+
+
+@functools.lru_cache(maxsize=None)
+def conversation_schema():
+    """
+    one row per conversation: its turns, nested down to tool calls whose args are (name, JSON
+    encoded value) pairs in call order, plus a flat `tools` column with every tool called, in order, for scans
+    that should not touch the turns
+    """
+    pa, _ = _pyarrow()
+    tool_call = pa.struct([
+        ("tool", pa.string()),
+        ("tool_running_message", pa.string()),
+        ("tool_completed_message", pa.string()),
+        ("tool_failed_message", pa.string()),
+        ("args", pa.list_(pa.struct([("name", pa.string()), ("value", pa.string())]))),
+    ])
+    turn = pa.struct([
+        ("role", pa.string()),
+        ("kind", pa.string()),
+        ("text", pa.string()),
+        ("reasoning", pa.string()),
+        ("tool_planning_strategy", pa.string()),
+        ("tool_calls", pa.list_(tool_call)),
+    ])
+    return pa.schema([
+        ("num_turns", pa.int32()),
+        ("tools", pa.list_(pa.string())),
+        ("turns", pa.list_(turn)),
+    ])
+
+
+def _is_tool_call(call: Any) -> bool:
+    return (
+        isinstance(call, dict)
+        and call.keys() == _TOOL_CALL_KEYS
+        and all(isinstance(call[name], str) for name in TOOL_CALL_FIELDS[:4])
+        and isinstance(call["args"], dict)
+    )
+
+
+def _is_response(content: Any) -> bool:
+    """exactly the RESPONSE_SCHEMA fields, so the turn can be stored field by field and read back unchanged"""
+    return (
+        isinstance(content, dict)
+        and content.keys() == _RESPONSE_KEYS
+        and isinstance(content["reasoning"], str)
+        and isinstance(content["tool_planning_strategy"], str)
+        and isinstance(content["tool_calls"], list)
+        and all(_is_tool_call(call) for call in content["tool_calls"])
+    )
+
+
+def _turn_row(turn: Dict[str, Any]) -> Dict[str, Any]:
+    content = turn.get("content")
+    if isinstance(content, str):
+        return {"role": turn.get("role"), "kind": TEXT, "text": content}
+    if _is_response(content):
+        return {
+            "role": turn.get("role"),
+            "kind": RESPONSE,
+            "reasoning": content["reasoning"],
+            "tool_planning_strategy": content["tool_planning_strategy"],
+            "tool_calls": [
+                dict(call, args=[{"name": name, "value": json.dumps(value, ensure_ascii=False)} for name, value in call["args"].items()])
+                for call in content["tool_calls"]
+            ]
+        }
+    return {"role": turn.get("role"), "kind": JSON, "text": json.dumps(content, ensure_ascii=False)}
+
+
+def conversation_row(conversation: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """a conversation as a row of conversation_schema()"""
+    turns = [_turn_row(turn) for turn in conversation]
+    return {
+        "num_turns": len(turns),
+        "tools": [call["tool"] for turn in turns for call in turn.get("tool_calls") or ()],
+        "turns": turns,
+    }
+
+
+def _turn_content(turn: Dict[str, Any]) -> Any:
+    if turn["kind"] == TEXT:
+        return turn["text"]
+    if turn["kind"] == RESPONSE:
+        return {
+            "reasoning": turn["reasoning"],
+            "tool_planning_strategy": turn["tool_planning_strategy"],
+            "tool_calls": [
+                dict(call, args={arg["name"]: json.loads(arg["value"]) for arg in call["args"]})
+                for call in turn["tool_calls"]
+            ]
+        }
+    return json.loads(turn["text"])
+
+
+def row_conversation(row: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """the {"role", "content"} turns of a row read back from a Parquet export"""
+    return [{"role": turn["role"], "content": _turn_content(turn)} for turn in row["turns"]]
+
+
+def export_parquet(jsonl_path: str, parquet_path: str, row_group_size: int = 10000, compression: str = "zstd") -> int:
+    """
+    streams a JSONL file into a Parquet file of conversation_schema() rows, one row group at a time
+    args:
+        jsonl_path: source written by ConversationWriter
+        parquet_path: destination Parquet file
+        row_group_size: conversations per row group, the unit readers skip or fetch
+        compression: Parquet codec, e.g. "zstd", "snappy" or "none"
+    returns: number of conversations exported
+    """
+    pa, pq = _pyarrow()
+    schema = conversation_schema()
+    output_dir = os.path.dirname(parquet_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    count = 0
+    rows = []
+    with pq.ParquetWriter(parquet_path, schema, compression=compression) as writer:
+        for conversation in iter_conversations(jsonl_path):
+            rows.append(conversation_row(conversation))
+            if len(rows) >= row_group_size:
+                writer.write_table(pa.Table.from_pylist(rows, schema=schema), row_group_size=row_group_size)
+                count += len(rows)
+                rows = []
+        if rows:
+            writer.write_table(pa.Table.from_pylist(rows, schema=schema), row_group_size=row_group_size)
+            count += len(rows)
+    return count
+
+
+def open_parquet(parquet_path: str):
+    """
+    the export as a memory-mapped pyarrow.parquet.ParquetFile; opening reads only the footer, so it
+    takes milliseconds however many conversations the file holds
+    """
+    _, pq = _pyarrow()
+    return pq.ParquetFile(parquet_path, memory_map=True)
+
+
+def scan_column(parquet_path: str, column: str = "tools", batch_size: int = 65536) -> Iterator[Any]:
+    """yields the values of one top-level column, e.g. the tool names of each conversation, without reading the turns"""
+    for batch in open_parquet(parquet_path).iter_batches(batch_size=batch_size, columns=[column]):
+        yield from batch.column(0).to_pylist()
+
+
+def iter_parquet_conversations(parquet_path: str, row_groups: Optional[Sequence[int]] = None, batch_size: int = 1024) -> Iterator[List[Dict[str, Any]]]:
+    """
+    yields the conversations of a Parquet export one at a time, decoding `batch_size` rows at once
+    args:
+        parquet_path: file written by export_parquet
+        row_groups: only read these row groups, e.g. to split the file between workers
+        batch_size: rows decoded per batch
+    """
+    for batch in open_parquet(parquet_path).iter_batches(batch_size=batch_size, row_groups=row_groups, columns=["turns"]):
+        for row in batch.to_pylist():
+            yield row_conversation(row)
@@ -0,0 +1,107 @@
+import functools
+import hashlib
+import re
+import zlib
+from typing import Callable, Dict, List, Tuple
+
+# stands in for the seed question while a template is rendered, then marks where it is spliced in
+SEED_SLOT = "\x00seed_question\x00"
+
+
+class PromptTemplate:
+    """
+    a generator prompt rendered once for one (request_type, variant) combination.
+    the text is split on SEED_SLOT, so filling in a seed question is a single str.join, and the
+    hash identifies the exact static text a conversation was generated from.
+    """
+
+    __slots__ = ("parts", "hash")
+
+    def __init__(self, text: str):
+        self.parts = text.split(SEED_SLOT)
+        self.hash = hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+    def render(self, seed_question: str) -> str:
+        return seed_question.join(self.parts)
+
+
+def choose_variant(input_data: Dict, name: str, options: List[str]) -> str:
+    """
+    picks one of `options` for an input row, stable for a given (seed_question, sample_index)
+    so a resubmitted item renders the same prompt and its parse() can recover the template
+    """
+    key = f"{name}\x00{input_data['seed_question']}\x00{input_data.get('sample_index', 0)}"
+    return options[zlib.crc32(key.encode("utf-8")) % len(options)]
+
+
+INLINE_LAYOUT = "inline"
+PREFIX_LAYOUT = "prefix"
+PROMPT_LAYOUTS = (INLINE_LAYOUT, PREFIX_LAYOUT)
+
+# stands in for the seed question inside the cacheable part of a prefix-layout prompt
+SEED_REFERENCE = "[SEED QUESTION]"
+# last line of a prefix-layout prompt, followed by the seed question itself
+SEED_TRAILER = f"SEED QUESTION (use it wherever {SEED_REFERENCE} appears above): "
+
+# an all-caps heading at the start of a line, e.g. "TURN 2 ASSISTANT FORMAT (information gathering):",
+# but not the "TURN 3 - USER: ..." lines of a turn list, which belong to the heading above them
+_SECTION_START = re.compile(r"^(?!TURN \d+ -)(?=[A-Z][A-Z0-9 &/,.'\-]*(?:\([^)\n]*\))?:)", re.MULTILINE)
+
+
+def _sections(text: str) -> List[str]:
+    """`text` cut at each heading; the pieces keep their whitespace, so "".join gives `text` back"""
+    starts = [0] + [match.start() for match in _SECTION_START.finditer(text) if match.start()] + [len(text)]
+    return [text[start:end] for start, end in zip(starts, starts[1:])]
+
+
+@functools.lru_cache(maxsize=None)
+def split_prefix(compile_template: Callable[..., PromptTemplate], keys: Tuple[Tuple[str, ...], ...]) -> Tuple[str, Dict[Tuple[str, ...], str]]:
+    """
+    the inline prompts of `keys`, seed replaced by SEED_REFERENCE, regrouped for prompt caching.
+    sections are compared by position: the ones identical for every key are moved to the front,
+    wherever they appear in the prompt, and the ones that differ follow in order of how many
+    versions they have, so keys that agree on the first variants share a longer prefix still.
+    both groups keep the prompt's order within them, and no section is dropped or merged.
+    returns: (shared block, variant block of each key)
+    """
+    sections = {key: [section.strip() for section in _sections(SEED_REFERENCE.join(compile_template(*key).parts))] for key in keys}
+    columns = list(zip(*sections.values()))
+    if any(len(key_sections) != len(columns) for key_sections in sections.values()):
+        # the keys' sections do not line up, so nothing can be told to be shared
+        return "", {key: "\n\n".join(key_sections) for key, key_sections in sections.items()}
+    versions = [len(set(column)) for column in columns]
+    shared = [index for index, count in enumerate(versions) if count == 1]
+    variant = sorted((index for index, count in enumerate(versions) if count > 1), key=lambda index: versions[index])
+    return (
+        "\n\n".join(columns[index][0] for index in shared),
+        {key: "\n\n".join(key_sections[index] for index in variant) for key, key_sections in sections.items()},
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def _prefix_templates(compile_template: Callable[..., PromptTemplate], keys: Tuple[Tuple[str, ...], ...]) -> Dict[Tuple[str, ...], PromptTemplate]:
+    shared, variants = split_prefix(compile_template, keys)
+    return {
+        key: PromptTemplate("\n\n".join(block for block in (shared, variants[key], f"{SEED_TRAILER}{SEED_SLOT}") if block))
+        for key in keys
+    }
+
+
+def layout_template(compile_template: Callable[..., PromptTemplate], keys: List[Tuple[str, ...]], key: Tuple[str, ...], layout: str = INLINE_LAYOUT) -> PromptTemplate:
+    """
+    the template for one (request_type, *variant) key in the requested layout
+    args:
+        compile_template: the generator's cached template builder, called as compile_template(*key)
+        keys: every key the generator can produce
+        key: the key of this item
+        layout: INLINE_LAYOUT renders the prompt as written, seed near the top. PREFIX_LAYOUT renders
+            the same sections with the seed replaced by SEED_REFERENCE, the sections every key shares
+            first, then the key's own sections, then the seed once at the very end, so provider-side
+            prompt caching can reuse the shared block (see split_prefix)
+    returns: PromptTemplate
+    """
+    if layout == INLINE_LAYOUT:
+        return compile_template(*key)
+    if layout == PREFIX_LAYOUT:
+        return _prefix_templates(compile_template, tuple(keys))[key]
+    raise ValueError(f"Unknown prompt layout {layout!r}, expected one of {PROMPT_LAYOUTS}")
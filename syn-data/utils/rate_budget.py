@@ -0,0 +1,70 @@
+import threading
+from typing import Dict
+
+
+class RateBudget:
+    """
+    splits one account-wide request/token budget across generators running at the same time.
+    every generator owns a share handle and reports how much work it still has before each
+    curator batch; the budget is then divided in proportion to the outstanding work, so a
+    category that finishes early hands its headroom to the ones still running.
+    """
+
+    def __init__(self, max_requests_per_minute: int, max_tokens_per_minute: int, max_retries: int = 3):
+        self.max_requests_per_minute = max_requests_per_minute
+        self.max_tokens_per_minute = max_tokens_per_minute
+        self.max_retries = max_retries
+        self._lock = threading.Lock()
+        self._requests: Dict[str, float] = {}
+        self._tokens: Dict[str, float] = {}
+
+    def share(self, key: str) -> "BudgetShare":
+        return BudgetShare(self, key)
+
+    def update(self, key: str, requests: float, tokens: float):
+        with self._lock:
+            self._requests[key] = max(requests, 0)
+            self._tokens[key] = max(tokens, 0)
+
+    def release(self, key: str):
+        with self._lock:
+            self._requests.pop(key, None)
+            self._tokens.pop(key, None)
+
+    def backend_params(self, key: str) -> Dict[str, int]:
+        """
+        curator backend_params for the next batch of `key`
+        returns: dict with max_retries, max_requests_per_minute and max_tokens_per_minute
+        """
+        with self._lock:
+            request_fraction = self._fraction(self._requests, key)
+            token_fraction = self._fraction(self._tokens, key)
+        return {
+            "max_retries": self.max_retries,
+            "max_requests_per_minute": max(1, int(self.max_requests_per_minute * request_fraction)),
+            "max_tokens_per_minute": max(1, int(self.max_tokens_per_minute * token_fraction)),
+        }
+
+    @staticmethod
+    def _fraction(demand: Dict[str, float], key: str) -> float:
+        total = sum(demand.values())
+        if key not in demand or total <= 0:
+            return 1.0
+        return demand[key] / total
+
+
+class BudgetShare:
+    """handle a single generator uses to report its outstanding work and read its current limits"""
+
+    def __init__(self, budget: RateBudget, key: str):
+        self.budget = budget
+        self.key = key
+
+    def update(self, requests: float, tokens: float):
+        self.budget.update(self.key, requests, tokens)
+
+    def backend_params(self) -> Dict[str, int]:
+        return self.budget.backend_params(self.key)
+
+    def release(self):
+        self.budget.release(self.key)
@@ -0,0 +1,52 @@
+import re
+from typing import Any, Dict
+
+DEFAULT_REQUEST_TYPE = "general"
+
+# checked in this order; the first type with a keyword anywhere in the seed wins. these are the lists
+# ambiguity_clarification, tool_failure_retry and json_error used; single_turn and multi_turn used to
+# lack "docking", "vpn", "parental" and "travel", so seeds with those words now get the same type there
+REQUEST_TYPE_KEYWORDS = {
+    "hardware": ["laptop", "computer", "hardware", "equipment", "docking"],
+    "software": ["software", "license", "application", "tool"],
+    "access": ["access", "permission", "login", "account", "vpn"],
+    "policy": ["policy", "procedure", "rule", "guideline"],
+    "incident": ["incident", "problem", "issue", "error", "bug"],
+    "hr": ["benefit", "hr", "payroll", "vacation", "leave", "parental"],
+    "expense": ["expense", "reimburse", "cost", "budget", "travel"],
+}
+
+# every label classify_request can return
+REQUEST_TYPES = [*REQUEST_TYPE_KEYWORDS, DEFAULT_REQUEST_TYPE]
+
+_REQUEST_TYPES = list(REQUEST_TYPE_KEYWORDS)
+# one named group per type inside a lookahead, so every position is tried against all keywords
+# (matches may overlap) and the alternation order makes the higher priority type win at a position
+_KEYWORD_PATTERN = re.compile(
+    "(?=" + "|".join(
+        f"(?P<{request_type}>" + "|".join(map(re.escape, keywords)) + ")"
+        for request_type, keywords in REQUEST_TYPE_KEYWORDS.items()
+    ) + ")",
+    re.IGNORECASE
+)
+
+
+def classify_request(seed_question: str) -> str:
+    """
+    maps a seed question to the request type that selects a generator's prompt variant.
+    keywords match as substrings, case-insensitively, like the per-generator keyword scans it replaces.
+    args: seed_question: seed question from the taxonomy
+    returns: one of REQUEST_TYPE_KEYWORDS, or DEFAULT_REQUEST_TYPE when no keyword matches
+    """
+    best = len(_REQUEST_TYPES)
+    for match in _KEYWORD_PATTERN.finditer(seed_question):
+        best = min(best, _REQUEST_TYPES.index(match.lastgroup))
+        if best == 0:
+            break
+    return _REQUEST_TYPES[best] if best < len(_REQUEST_TYPES) else DEFAULT_REQUEST_TYPE
+
+
+def request_type_of(input_data: Dict[str, Any]) -> str:
+    """request type of a dataset row: the precomputed column if present, else classified on the spot"""
+    return input_data.get("request_type") or classify_request(input_data["seed_question"])
+
@@ -0,0 +1,160 @@
+import heapq
+import itertools
+import random
+from collections import defaultdict
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from utils.request_types import classify_request
+from utils.seed_sources import DEFAULT_INTENT, SeedRecord, SeedSource, YamlSeedSource, open_seed_source, shuffle_buffer
+from utils.taxonomy import TaxonomyIndex, taxonomy_index
+
+
+class SeedScheduler:
+    """
+    hands out seed questions for successive curator batches.
+    seeds are drawn round-robin across taxonomy intents so every batch covers the whole taxonomy,
+    and inside an intent the least used seed goes first: fresh seeds before repeats, and seeds
+    whose conversations were rejected are pushed back by `rejection_penalty` rounds. ties are
+    broken randomly, so every pass over an intent comes out in a new order. the intent cursor and
+    per-seed counters live on the scheduler, so retry attempts continue where the last one stopped.
+    """
+
+    def __init__(self, taxonomy: TaxonomyIndex, rejection_penalty: float = 2.0, rng: Optional[random.Random] = None):
+        self.rejection_penalty = rejection_penalty
+        self.rng = rng or random.Random()
+        self.submitted: Dict[str, int] = defaultdict(int)
+        self.rejected: Dict[str, int] = defaultdict(int)
+
+        self.intent_of = taxonomy.intent_of
+        self.request_type_of = taxonomy.request_type_of
+        self._heaps: Dict[str, List[Tuple[float, float, str]]] = {}
+        for intent, seeds in taxonomy.seeds_by_intent.items():
+            if not seeds:
+                continue
+            self._heaps[intent] = [(0.0, self.rng.random(), seed) for seed in seeds]
+            heapq.heapify(self._heaps[intent])
+
+        self._intents = list(self._heaps)
+        self.rng.shuffle(self._intents)
+        self._cursor = 0
+
+    def _score(self, seed: str) -> float:
+        return self.submitted[seed] + self.rejection_penalty * self.rejected[seed]
+
+    def restore(self, history: Dict[str, Tuple[int, int]], labels: Optional[Dict[str, Tuple[str, str]]] = None):
+        """
+        loads per-seed (submitted, rejected) counts from an earlier run
+        args:
+            history: seed question -> (times submitted, times rejected as invalid)
+            labels: seed question -> (intent, request_type); unused here, the taxonomy already has them
+        """
+        for seed, (submitted, rejected) in history.items():
+            if seed in self.intent_of:
+                self.submitted[seed] = submitted
+                self.rejected[seed] = rejected
+        for intent, heap in self._heaps.items():
+            self._heaps[intent] = [(self._score(seed), tiebreak, seed) for _, tiebreak, seed in heap]
+            heapq.heapify(self._heaps[intent])
+
+    def _pop(self, intent: str) -> str:
+        heap = self._heaps[intent]
+        while True:
+            score, _, seed = heapq.heappop(heap)
+            current = self._score(seed)
+            if current == score:
+                break
+            # a rejection arrived after this entry was pushed; requeue with the new score
+            heapq.heappush(heap, (current, self.rng.random(), seed))
+        self.submitted[seed] += 1
+        heapq.heappush(heap, (self._score(seed), self.rng.random(), seed))
+        return seed
+
+    def next_batch(self, count: int) -> List[str]:
+        batch = []
+        for _ in range(count):
+            intent = self._intents[self._cursor]
+            self._cursor = (self._cursor + 1) % len(self._intents)
+            batch.append(self._pop(intent))
+        return batch
+
+    def record_rejected(self, seeds: Iterable[str]):
+        for seed in seeds:
+            self.rejected[seed] += 1
+
+
+class StreamingSeedScheduler:
+    """
+    SeedScheduler for seed files too large to hold in memory. seeds are streamed from `source`
+    through a shuffle buffer, one pass after another; a seed is skipped in pass p while its score
+    (submitted + rejection_penalty * rejected) is above p, so fresh seeds go before repeats and
+    rejected ones sit out `rejection_penalty` passes. only seeds actually handed out are tracked,
+    so memory is bounded by the buffer and the run's own history, not by the source.
+    """
+
+    def __init__(self, source: SeedSource, rejection_penalty: float = 2.0, buffer_size: int = 10000, rng: Optional[random.Random] = None):
+        self.source = source
+        self.rejection_penalty = rejection_penalty
+        self.buffer_size = buffer_size
+        self.rng = rng or random.Random()
+        self.submitted: Dict[str, int] = {}
+        self.rejected: Dict[str, int] = {}
+        self.intent_of: Dict[str, str] = {}
+        self.request_type_of: Dict[str, str] = {}
+        self._pass = 0
+        self._stream = self._records()
+
+    def _score(self, seed: str) -> float:
+        return self.submitted.get(seed, 0) + self.rejection_penalty * self.rejected.get(seed, 0)
+
+    def _records(self) -> Iterator[SeedRecord]:
+        while True:
+            seen = False
+            for record in shuffle_buffer(self.source, self.buffer_size, self.rng):
+                seen = True
+                if self._score(record.seed_question) <= self._pass:
+                    yield record
+            if not seen:
+                raise ValueError(f"Seed source {self.source.path} has no seeds in shard {self.source.shard_index}/{self.source.num_shards}")
+            self._pass += 1
+
+    def restore(self, history: Dict[str, Tuple[int, int]], labels: Optional[Dict[str, Tuple[str, str]]] = None):
+        """
+        loads per-seed (submitted, rejected) counts from an earlier run, see SeedScheduler.restore.
+        the seeds' intent and request type come from `labels`, else from classify_request, so items
+        still in flight can be resubmitted before the stream reaches their seeds again.
+        """
+        labels = labels or {}
+        for seed, (submitted, rejected) in history.items():
+            self.submitted[seed] = submitted
+            self.rejected[seed] = rejected
+            self.intent_of[seed], self.request_type_of[seed] = labels.get(seed) or (DEFAULT_INTENT, classify_request(seed))
+
+    def next_batch(self, count: int) -> List[str]:
+        batch = []
+        for record in itertools.islice(self._stream, count):
+            seed = record.seed_question
+            self.submitted[seed] = self.submitted.get(seed, 0) + 1
+            self.intent_of[seed] = record.intent
+            self.request_type_of[seed] = record.request_type
+            batch.append(seed)
+        return batch
+
+    def record_rejected(self, seeds: Iterable[str]):
+        for seed in seeds:
+            self.rejected[seed] = self.rejected.get(seed, 0) + 1
+
+
+def scheduler_for(seed_file: Optional[str] = None, shard_index: int = 0, num_shards: int = 1):
+    """
+    the scheduler for a run: SeedScheduler over the cached taxonomy index for an unsharded yaml file,
+    StreamingSeedScheduler for jsonl / parquet seed files and sharded runs
+    args:
+        seed_file: taxonomy yaml or seed file; the bundled taxonomy if None
+        shard_index: which shard of the seed file this run draws from
+        num_shards: number of shards the seed file is split into
+    returns: SeedScheduler or StreamingSeedScheduler
+    """
+    source = open_seed_source(seed_file, shard_index, num_shards)
+    if isinstance(source, YamlSeedSource) and num_shards == 1:
+        return SeedScheduler(taxonomy_index(source.path))
+    return StreamingSeedScheduler(source)
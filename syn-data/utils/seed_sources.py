@@ -0,0 +1,160 @@
+import abc
+import json
+import os
+import random
+from typing import Iterable, Iterator, List, NamedTuple, Optional
+
+from utils.request_types import classify_request
+from utils.taxonomy import TAXONOMY_FILE, taxonomy_index
+
+DEFAULT_INTENT = "general"
+
+
+class SeedRecord(NamedTuple):
+    seed_question: str
+    intent: str
+    request_type: str
+
+
+def _record(row: dict) -> SeedRecord:
+    seed_question = row["seed_question"]
+    return SeedRecord(
+        seed_question,
+        row.get("intent") or DEFAULT_INTENT,
+        row.get("request_type") or classify_request(seed_question)
+    )
+
+
+class SeedSource(abc.ABC):
+    """
+    lazily iterated seed questions, optionally restricted to shard `shard_index` of `num_shards`.
+    every iteration starts a fresh pass from the beginning of the shard; nothing is held in memory
+    beyond the row being read.
+    """
+
+    def __init__(self, path: str, shard_index: int = 0, num_shards: int = 1):
+        if not 0 <= shard_index < num_shards:
+            raise ValueError(f"shard_index must be in [0, {num_shards}), got {shard_index}")
+        self.path = path
+        self.shard_index = shard_index
+        self.num_shards = num_shards
+
+    @abc.abstractmethod
+    def __iter__(self) -> Iterator[SeedRecord]:
+        """one pass over the shard's seed records"""
+
+
+class YamlSeedSource(SeedSource):
+    """the taxonomy yaml through the cached index; shards take every num_shards-th seed"""
+
+    def __iter__(self) -> Iterator[SeedRecord]:
+        index = taxonomy_index(self.path)
+        for position, seed in enumerate(index.intent_of):
+            if position % self.num_shards == self.shard_index:
+                yield SeedRecord(seed, index.intent_of[seed], index.request_type_of[seed])
+
+
+class JsonlSeedSource(SeedSource):
+    """
+    one {"seed_question", "intent"?, "request_type"?} object per line.
+    shards are contiguous byte ranges of the file, each line belonging to the shard its first byte
+    falls in, so a shard starts reading with a single seek.
+    """
+
+    def __iter__(self) -> Iterator[SeedRecord]:
+        size = os.path.getsize(self.path)
+        start = size * self.shard_index // self.num_shards
+        end = size * (self.shard_index + 1) // self.num_shards
+
+        with open(self.path, 'rb') as f:
+            if start:
+                # the line straddling `start` belongs to the previous shard
+                f.seek(start - 1)
+                f.readline()
+            position = f.tell()
+            while position < end:
+                line = f.readline()
+                if not line:
+                    break
+                position += len(line)
+                line = line.strip()
+                if line:
+                    yield _record(json.loads(line))
+
+
+class ParquetSeedSource(SeedSource):
+    """
+    a parquet file with a `seed_question` column and optional `intent` / `request_type` columns.
+    shards are interleaved row groups, read one record batch at a time; needs pyarrow.
+    """
+
+    def __init__(self, path: str, shard_index: int = 0, num_shards: int = 1, batch_size: int = 4096):
+        super().__init__(path, shard_index, num_shards)
+        self.batch_size = batch_size
+
+    def __iter__(self) -> Iterator[SeedRecord]:
+        try:
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Reading parquet seed files requires pyarrow: pip install pyarrow") from e
+
+        parquet_file = pq.ParquetFile(self.path)
+        columns = [name for name in ("seed_question", "intent", "request_type") if name in parquet_file.schema_arrow.names]
+        row_groups = list(range(self.shard_index, parquet_file.num_row_groups, self.num_shards))
+        if not row_groups:
+            return
+        for batch in parquet_file.iter_batches(batch_size=self.batch_size, row_groups=row_groups, columns=columns):
+            for row in batch.to_pylist():
+                yield _record(row)
+
+
+def open_seed_source(path: Optional[str] = None, shard_index: int = 0, num_shards: int = 1) -> SeedSource:
+    """
+    picks the seed source for a file by extension
+    args:
+        path: .yaml/.yml taxonomy, .jsonl seed file or .parquet seed file; the bundled taxonomy if None
+        shard_index: which shard this process reads
+        num_shards: number of shards the file is split into
+    returns: SeedSource
+    """
+    path = path or TAXONOMY_FILE
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".yaml", ".yml"):
+        return YamlSeedSource(path, shard_index, num_shards)
+    if extension in (".jsonl", ".ndjson"):
+        return JsonlSeedSource(path, shard_index, num_shards)
+    if extension in (".parquet", ".pq"):
+        return ParquetSeedSource(path, shard_index, num_shards)
+    raise ValueError(f"Unsupported seed file {path}: expected .yaml, .jsonl or .parquet")
+
+
+def shuffle_buffer(records: Iterable[SeedRecord], buffer_size: int, rng: random.Random) -> Iterator[SeedRecord]:
+    """
+    streaming shuffle: keeps `buffer_size` records and emits a random one as each new record arrives.
+    items move at most about buffer_size positions earlier, so a buffer of a few percent of the
+    source mixes well while memory stays O(buffer_size).
+    """
+    buffer: List[SeedRecord] = []
+    for record in records:
+        if len(buffer) < buffer_size:
+            buffer.append(record)
+            continue
+        position = rng.randrange(buffer_size)
+        yield buffer[position]
+        buffer[position] = record
+    rng.shuffle(buffer)
+    yield from buffer
+
+
+def reservoir_sample(records: Iterable[SeedRecord], count: int, rng: random.Random) -> List[SeedRecord]:
+    """uniform sample of `count` records in one pass and O(count) memory (algorithm R)"""
+    sample: List[SeedRecord] = []
+    for seen, record in enumerate(records):
+        if seen < count:
+            sample.append(record)
+        else:
+            position = rng.randint(0, seen)
+            if position < count:
+                sample[position] = record
+    rng.shuffle(sample)
+    return sample
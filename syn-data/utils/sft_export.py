@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+pre-tokenized, sequence-packed SFT export.
+
+renders every conversation behind the agent system prompt (utils.prompts.build_system_prompt) in a
+ChatML layout, tokenizes it once with a loss mask over the assistant turns, and packs the
+conversations into fixed-length sequences with first-fit decreasing, so training jobs read ready
+token arrays instead of re-tokenizing and padding each conversation to the context length.
+
+run it from the syn-data directory:
+
+    python -m utils.sft_export data/single_turn/conversations.jsonl data/multi_turn/conversations.jsonl --output data/sft/packed --seq-len 4096
+
+it writes, for the `--output` prefix:
+
+    <prefix>.tokens.npy     (sequences, seq_len) token ids, padded with pad_id
+    <prefix>.loss_mask.npy  (sequences, seq_len) uint8, 1 on the tokens to train on
+    <prefix>.index.npy      (documents, 4) int64 rows of sequence, offset, length, conversation
+    <prefix>.json           seq_len, tokenizer, pad_id, inputs and packing statistics
+
+the arrays open memory-mapped with numpy.load(..., mmap_mode="r"), see open_packed. a sequence's
+index rows give its document boundaries, e.g. for a block-diagonal attention mask.
+"""
+import argparse
+import functools
+import json
+import os
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config import TOOLS
+from utils.prompts import build_system_prompt
+from utils.writer import iter_conversations
+
+DEFAULT_TOKENIZER = "cl100k_base"
+BYTE_TOKENIZER = "bytes"
+TURN_START = "<|im_start|>{role}\n"
+TURN_END = "<|im_end|>\n"
+# sequence, offset in the sequence, length, conversation number across the inputs
+INDEX_COLUMNS = ("sequence", "offset", "length", "conversation")
+
+
+@functools.lru_cache(maxsize=None)
+def load_tokenizer(tokenizer: str = DEFAULT_TOKENIZER) -> Tuple[Callable[[str], List[int]], int]:
+    """
+    args:
+        tokenizer: a tiktoken encoding name, a Hugging Face tokenizer.json path, or "bytes" (UTF-8
+            bytes as ids, no dependency)
+    returns: (encode(text) -> token ids, vocabulary size)
+    """
+    if tokenizer == BYTE_TOKENIZER:
+        return (lambda text: list(text.encode("utf-8"))), 256
+    if tokenizer.endswith(".json"):
+        try:
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise ImportError("tokenizer.json files require tokenizers: pip install tokenizers") from e
+        hf_tokenizer = Tokenizer.from_file(tokenizer)
+        return (lambda text: hf_tokenizer.encode(text, add_special_tokens=False).ids), hf_tokenizer.get_vocab_size()
+    try:
+        import tiktoken
+    except ImportError as e:
+        raise ImportError("tiktoken encodings require tiktoken: pip install tiktoken") from e
+    encoding = tiktoken.get_encoding(tokenizer)
+    return (lambda text: encoding.encode(text, disallowed_special=())), encoding.n_vocab
+
+
+def _turn_text(content: Any) -> str:
+    return content if isinstance(content, str) else json.dumps(content, ensure_ascii=False)
+
+
+class ConversationTokenizer:
+    """
+    tokenizes rendered conversations: the system block and each role header are encoded once and
+    reused, turn bodies are encoded as they come. the loss mask covers each assistant turn's body
+    and closing marker, nothing else.
+    """
+
+    def __init__(self, tokenizer: str = DEFAULT_TOKENIZER, tools: Optional[Sequence[str]] = None):
+        self.encode, self.vocab_size = load_tokenizer(tokenizer)
+        system = TURN_START.format(role="system") + build_system_prompt(list(tools or TOOLS)) + TURN_END
+        self.system_ids = self.encode(system)
+        self.end_ids = self.encode(TURN_END)
+        self._headers: Dict[str, List[int]] = {}
+
+    def _header(self, role: str) -> List[int]:
+        if role not in self._headers:
+            self._headers[role] = self.encode(TURN_START.format(role=role))
+        return self._headers[role]
+
+    def __call__(self, conversation: List[Dict[str, Any]]) -> Tuple[List[int], List[int]]:
+        """returns: (token ids, loss mask of 0/1 per token)"""
+        ids = list(self.system_ids)
+        mask = [0] * len(ids)
+        for turn in conversation:
+            header = self._header(turn["role"])
+            body = self.encode(_turn_text(turn["content"])) + self.end_ids
+            trained = 1 if turn["role"] == "assistant" else 0
+            ids += header
+            ids += body
+            mask += [0] * len(header)
+            mask += [trained] * len(body)
+        return ids, mask
+
+
+def first_fit_decreasing(lengths: Sequence[int], capacity: int) -> Tuple[List[int], List[int], int]:
+    """
+    packs items into bins of `capacity`: longest first, each into the first bin it fits. a max
+    segment tree over the bins' free space finds that bin in O(log n), so packing millions of
+    conversations stays fast.
+    args:
+        lengths: item sizes, each at most `capacity`
+    returns: (bin of each item, offset of each item in its bin, number of bins)
+    """
+    count = len(lengths)
+    size = 1
+    while size < max(count, 1):
+        size *= 2
+    free = [capacity] * (2 * size)
+    bins = [0] * count
+    offsets = [0] * count
+    used = 0
+    for item in sorted(range(count), key=lengths.__getitem__, reverse=True):
+        length = lengths[item]
+        node = 1
+        while node < size:
+            node = 2 * node if free[2 * node] >= length else 2 * node + 1
+        bins[item] = node - size
+        offsets[item] = capacity - free[node]
+        used = max(used, node - size + 1)
+        free[node] -= length
+        node //= 2
+        while node:
+            free[node] = max(free[2 * node], free[2 * node + 1])
+            node //= 2
+    return bins, offsets, used
+
+
+def _iter_input(path: str) -> Iterator[List[Dict[str, Any]]]:
+    if path.endswith(".parquet"):
+        from utils.parquet_output import iter_parquet_conversations
+        yield from iter_parquet_conversations(path)
+    elif path.endswith(".json"):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        # a `{"conversations": [...]}` export or a bare list of conversations
+        yield from data if isinstance(data, list) else data["conversations"]
+    else:
+        yield from iter_conversations(path)
+
+
+def export_packed(input_paths: Sequence[str], output_prefix: str, seq_len: int = 4096, tokenizer: str = DEFAULT_TOKENIZER, tools: Optional[Sequence[str]] = None, pad_id: int = 0) -> Dict[str, Any]:
+    """
+    tokenizes the conversations of `input_paths` (.jsonl, .json or .parquet) and writes them packed
+    into `seq_len` sequences under `output_prefix` (see the module docstring). token streams go to
+    temporary files first, so memory holds one conversation's tokens plus four ints per conversation.
+    conversations longer than `seq_len` are left out and counted.
+    returns: the metadata written to <prefix>.json
+    """
+    encode_conversation = ConversationTokenizer(tokenizer, tools)
+    dtype = np.uint16 if encode_conversation.vocab_size <= np.iinfo(np.uint16).max + 1 else np.uint32
+    output_dir = os.path.dirname(output_prefix)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    staged_tokens = f"{output_prefix}.tokens.tmp"
+    staged_mask = f"{output_prefix}.loss_mask.tmp"
+    lengths: List[int] = []
+    starts: List[int] = []
+    conversations: List[int] = []
+    number = -1
+    too_long = 0
+    position = 0
+    try:
+        with open(staged_tokens, 'wb') as tokens_file, open(staged_mask, 'wb') as mask_file:
+            for path in input_paths:
+                for number, conversation in enumerate(_iter_input(path), number + 1):
+                    ids, mask = encode_conversation(conversation)
+                    if len(ids) > seq_len:
+                        too_long += 1
+                        continue
+                    np.asarray(ids, dtype=dtype).tofile(tokens_file)
+                    np.asarray(mask, dtype=np.uint8).tofile(mask_file)
+                    lengths.append(len(ids))
+                    starts.append(position)
+                    conversations.append(number)
+                    position += len(ids)
+
+        bins, offsets, num_sequences = first_fit_decreasing(lengths, seq_len)
+        tokens = np.lib.format.open_memmap(f"{output_prefix}.tokens.npy", mode="w+", dtype=dtype, shape=(num_sequences, seq_len))
+        loss_mask = np.lib.format.open_memmap(f"{output_prefix}.loss_mask.npy", mode="w+", dtype=np.uint8, shape=(num_sequences, seq_len))
+        tokens[:] = pad_id
+        loss_mask[:] = 0
+        index = np.empty((len(lengths), len(INDEX_COLUMNS)), dtype=np.int64)
+        if lengths:
+            staged = np.memmap(staged_tokens, dtype=dtype, mode="r")
+            staged_loss = np.memmap(staged_mask, dtype=np.uint8, mode="r")
+            # in file order, so the staged streams are read front to back
+            for document, (start, length) in enumerate(zip(starts, lengths)):
+                sequence, offset = bins[document], offsets[document]
+                tokens[sequence, offset:offset + length] = staged[start:start + length]
+                loss_mask[sequence, offset:offset + length] = staged_loss[start:start + length]
+                index[document] = (sequence, offset, length, conversations[document])
+            del staged, staged_loss
+        index = index[np.lexsort((index[:, 1], index[:, 0]))]
+        np.save(f"{output_prefix}.index.npy", index)
+        trained_tokens = int(loss_mask.sum(dtype=np.int64))
+        tokens.flush()
+        loss_mask.flush()
+        del tokens, loss_mask
+    finally:
+        for path in (staged_tokens, staged_mask):
+            if os.path.exists(path):
+                os.remove(path)
+
+    total_tokens = sum(lengths)
+    metadata = {
+        "seq_len": seq_len,
+        "tokenizer": tokenizer,
+        "dtype": np.dtype(dtype).name,
+        "pad_id": pad_id,
+        "inputs": list(input_paths),
+        "index_columns": list(INDEX_COLUMNS),
+        "conversations": len(lengths),
+        "too_long": too_long,
+        "sequences": num_sequences,
+        "tokens": total_tokens,
+        "trained_tokens": trained_tokens,
+        # share of padding when every conversation gets its own padded sequence, and once packed
+        "padding_unpacked": 1 - total_tokens / (len(lengths) * seq_len) if lengths else 0.0,
+        "padding_packed": 1 - total_tokens / (num_sequences * seq_len) if num_sequences else 0.0,
+    }
+    with open(f"{output_prefix}.json", 'w') as f:
+        json.dump(metadata, f, indent=2)
+    return metadata
+
+
+def open_packed(output_prefix: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray, Dict[str, Any]]:
+    """
+    returns: (tokens, loss_mask, index, metadata) of an export_packed output, the arrays
+    memory-mapped read-only
+    """
+    with open(f"{output_prefix}.json", 'r') as f:
+        metadata = json.load(f)
+    return (
+        np.load(f"{output_prefix}.tokens.npy", mmap_mode="r"),
+        np.load(f"{output_prefix}.loss_mask.npy", mmap_mode="r"),
+        np.load(f"{output_prefix}.index.npy", mmap_mode="r"),
+        metadata,
+    )
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Tokenize generated conversations once and pack them into fixed-length sequences")
+    parser.add_argument("inputs", nargs="+", help="Conversation files (.jsonl, .json or .parquet)")
+    parser.add_argument("--output", default="data/sft/packed", help="Prefix of the output files")
+    parser.add_argument("--seq-len", type=int, default=4096, help="Tokens per packed sequence")
+    parser.add_argument("--tokenizer", default=DEFAULT_TOKENIZER, help=f"tiktoken encoding, tokenizer.json path, or '{BYTE_TOKENIZER}'")
+    parser.add_argument("--pad-id", type=int, default=0, help="Token id filling the unused tail of each sequence")
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    metadata = export_packed(args.inputs, args.output, seq_len=args.seq_len, tokenizer=args.tokenizer, pad_id=args.pad_id)
+    print(f"Packed {metadata['conversations']} conversations into {metadata['sequences']} sequences of {metadata['seq_len']} tokens")
+    print(f"Padding: {metadata['padding_unpacked']:.1%} unpacked, {metadata['padding_packed']:.1%} packed")
+    if metadata["too_long"]:
+        print(f"Left out {metadata['too_long']} conversations longer than {metadata['seq_len']} tokens")
@@ -0,0 +1,462 @@
+#!/usr/bin/env python3
+"""
+offline stand-in for the OpenAI chat-completions endpoint.
+
+answers every edge-case generator prompt with a schema-valid `FullConversation` payload, so the
+curator pipeline (scheduling, rate limiting, parsing, validation, writing) can be exercised and
+timed without network access or API spend. the role sequence of the returned conversation is read
+from the "EXACT format" block of the prompt, so every generator gets a conversation it accepts.
+
+run it from the syn-data directory:
+
+    python -m utils.stub_server --port 8765 --latency lognormal:0.5,0.4 --rate-429 0.02
+
+and point a generator at it with backend_params {"base_url": "http://127.0.0.1:8765/v1", "api_key": "stub"}
+(`--base-url http://127.0.0.1:8765/v1` on the edge-case scripts). GET /stats returns the counters.
+
+the batch API is served as well (/v1/files, /v1/batches), so `--batch` runs work offline too: a batch
+is answered line by line with the same payloads and reported completed `--batch-delay` seconds after
+it was created.
+"""
+import argparse
+import email.parser
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+from tool_response_formats import TOOL_RESPONSE_FORMATS
+from utils.prompt_templates import SEED_REFERENCE, SEED_TRAILER
+
+CONVERSATION_BLOCK = '"conversation": ['
+TURN_PATTERN = re.compile(r'\{"role": "(\w+)", "content": ("(?:[^"\\]|\\.)*"|\{[A-Z0-9_]+\})\}')
+PLACEHOLDER_PATTERN = re.compile(r'^\{?[A-Z0-9_]+\}?$')
+
+INFO_TOOLS = ["KnowledgeSearchTool", "FindCatalogTool"]
+
+# provider prompt caching as documented by OpenAI: prefixes of 1024+ tokens, in 128 token steps,
+# at roughly 4 characters per token
+CACHE_MIN_CHARS = 1024 * 4
+CACHE_STEP_CHARS = 128 * 4
+
+
+class LatencyModel:
+    """
+    response delay in seconds, parsed from `constant:S`, `uniform:A,B` or `lognormal:MEDIAN,SIGMA`
+    """
+
+    def __init__(self, spec: str):
+        kind, _, params = spec.partition(":")
+        self.kind = kind
+        self.params = [float(value) for value in params.split(",")] if params else []
+        if kind not in ("constant", "uniform", "lognormal"):
+            raise ValueError(f"Unknown latency distribution: {spec}")
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "constant":
+            return self.params[0] if self.params else 0.0
+        if self.kind == "uniform":
+            return rng.uniform(self.params[0], self.params[1])
+        median, sigma = self.params
+        return rng.lognormvariate(math.log(median), sigma)
+
+
+def _agent_response(tools: List[str], seed_question: str, rng: random.Random) -> Dict[str, Any]:
+    tool_calls = []
+    for tool in tools:
+        if tool == "RespondToUserTool":
+            args = {"success": True, "response": f"Here is what I found about: {seed_question}"}
+        elif tool in ("MyRequestsTool", "MyPendingApprovalsTool"):
+            args = {"status": ["open", "pending"]}
+        else:
+            args = {"queries": [seed_question, f"{seed_question} policy", f"{seed_question} form"][:rng.randint(2, 3)]}
+        tool_calls.append({
+            "tool": tool,
+            "tool_running_message": f"Running {tool}...",
+            "tool_completed_message": f"{tool} completed!",
+            "tool_failed_message": f"{tool} failed.",
+            "args": args
+        })
+    return {
+        "reasoning": f"The user asked: {seed_question}. I need to gather the relevant information and respond.",
+        "tool_planning_strategy": f"Use {', '.join(tools)} to address the request.",
+        "tool_calls": tool_calls
+    }
+
+
+def _tool_results(previous: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    calls = previous["tool_calls"] if isinstance(previous, dict) else [{"tool": tool, "args": {}} for tool in INFO_TOOLS]
+    results = []
+    for call in calls:
+        if call["tool"] == "RespondToUserTool":
+            continue
+        response_format = TOOL_RESPONSE_FORMATS.get(call["tool"])
+        results.append({
+            "tool_name": call["tool"],
+            "tool_args": call["args"],
+            "tool_result": response_format() if response_format else {"execution_status": "success"}
+        })
+    return results
+
+
+def build_conversation(prompt: str, rng: random.Random) -> List[Dict[str, Any]]:
+    """
+    fills in the role sequence requested by an edge-case prompt
+    args:
+        prompt: rendered generator prompt
+        rng: random source for choosing between alternative formats and tool sets
+    returns: list of {"role", "content"} turns
+    """
+    blocks = [block for block in prompt.split(CONVERSATION_BLOCK)[1:] if TURN_PATTERN.search(block)]
+    turns: List[Tuple[str, str]] = []
+    if blocks:
+        block = rng.choice(blocks)
+        turns = TURN_PATTERN.findall(block[:block.find("\n    ]")] if "\n    ]" in block else block)
+    if not turns:
+        turns = [("user", '"Hello"'), ("assistant", "{RESPOND_TO_USER_TOOL_ONLY}")]
+
+    seed_question = json.loads(turns[0][1]) if turns[0][1].startswith('"') else "Hello"
+    if seed_question == SEED_REFERENCE:
+        # prefix layout: the format block refers to the seed, which only follows at the very end
+        seed_question = prompt.rsplit(SEED_TRAILER, 1)[-1].strip()
+    conversation = []
+    previous_assistant = None
+    for position, (role, raw) in enumerate(turns):
+        quoted = raw.startswith('"')
+        literal = json.loads(raw) if quoted else None
+        is_placeholder = not quoted or PLACEHOLDER_PATTERN.match(literal or "")
+        last_turn = position == len(turns) - 1
+
+        if role == "assistant" and quoted:
+            # a placeholder in quotes asks for a string, e.g. the faulty JSON of json_error
+            content: Any = '{"reasoning": "Looking into it", "tool_calls": [{"tool": "KnowledgeSearchTool",}]}'
+        elif role == "assistant":
+            respond_only = last_turn or "RESPOND" in raw or "RESPONSE" in raw or "CLARIFICATION" in raw
+            if respond_only:
+                tools = ["RespondToUserTool"]
+            else:
+                tools = INFO_TOOLS + rng.sample(["MyRequestsTool", "MyPendingApprovalsTool"], rng.randint(0, 1))
+            content = _agent_response(tools, seed_question, rng)
+            previous_assistant = content
+        elif role == "tool":
+            content = _tool_results(previous_assistant)
+        elif is_placeholder:
+            content = "ValidationError: Missing required field 'tool_planning_strategy'" if "ERROR" in literal else f"Can you tell me more about {seed_question.lower()}"
+        else:
+            content = seed_question if literal == SEED_REFERENCE else literal
+        conversation.append({"role": role, "content": content})
+    return conversation
+
+
+class StubState:
+    def __init__(self, args: argparse.Namespace):
+        self.latency = LatencyModel(args.latency)
+        self.rate_429 = args.rate_429
+        self.rate_500 = args.rate_500
+        self.prompt_tokens = args.prompt_tokens
+        self.completion_tokens = args.completion_tokens
+        self.cached_fraction = args.cached_fraction
+        self.prefix_cache = args.prefix_cache
+        self.seen_prefixes = set()
+        self.rng = random.Random(args.seed)
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.batch_delay = args.batch_delay
+        self.files: Dict[str, Tuple[Dict[str, Any], bytes]] = {}
+        self.batches: Dict[str, Dict[str, Any]] = {}
+        self.stats = {"requests": 0, "ok": 0, "rate_limited": 0, "server_errors": 0, "prompt_tokens": 0, "completion_tokens": 0, "batches": 0}
+
+    def count(self, **increments: int):
+        with self.lock:
+            for key, value in increments.items():
+                self.stats[key] += value
+
+    def cached_prefix_chars(self, prompt: str) -> int:
+        """length of the longest cacheable prefix of `prompt` sent before; remembers this prompt's prefixes"""
+        cached = 0
+        with self.lock:
+            for end in range(CACHE_MIN_CHARS, len(prompt) + 1, CACHE_STEP_CHARS):
+                prefix = hash(prompt[:end])
+                if prefix in self.seen_prefixes:
+                    cached = end
+                else:
+                    self.seen_prefixes.add(prefix)
+        return cached
+
+    def add_file(self, filename: str, purpose: str, content: bytes) -> Dict[str, Any]:
+        file_object = {
+            "id": f"file-stub-{uuid.uuid4().hex[:24]}",
+            "object": "file",
+            "bytes": len(content),
+            "created_at": int(time.time()),
+            "filename": filename,
+            "purpose": purpose,
+            "status": "processed"
+        }
+        with self.lock:
+            self.files[file_object["id"]] = (file_object, content)
+        return file_object
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            elapsed = time.time() - self.started
+            return dict(self.stats, elapsed_seconds=round(elapsed, 3), requests_per_second=round(self.stats["ok"] / elapsed, 3) if elapsed else 0.0)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    server_version = "SynDataStub/1.0"
+    state: StubState
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _not_found(self):
+        self._send_json(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+
+    def _route(self) -> List[str]:
+        """path segments after /v1, e.g. ["batches", "batch_123", "cancel"]"""
+        parts = [part for part in self.path.split("?")[0].split("/") if part]
+        return parts[parts.index("v1") + 1:] if "v1" in parts else parts
+
+    def do_GET(self):
+        route = self._route()
+        if route == ["stats"]:
+            self._send_json(200, self.state.snapshot())
+        elif route == ["batches"]:
+            with self.state.lock:
+                batches = [batch_status(batch, self.state) for batch in self.state.batches.values()]
+            self._send_json(200, {"object": "list", "data": batches, "has_more": False})
+        elif len(route) == 2 and route[0] == "batches" and route[1] in self.state.batches:
+            self._send_json(200, batch_status(self.state.batches[route[1]], self.state))
+        elif len(route) == 2 and route[0] == "files" and route[1] in self.state.files:
+            self._send_json(200, self.state.files[route[1]][0])
+        elif len(route) == 3 and route[0] == "files" and route[2] == "content" and route[1] in self.state.files:
+            content = self.state.files[route[1]][1]
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+        else:
+            self._not_found()
+
+    def do_DELETE(self):
+        route = self._route()
+        if len(route) == 2 and route[0] == "files":
+            with self.state.lock:
+                deleted = self.state.files.pop(route[1], None) is not None
+            self._send_json(200, {"id": route[1], "object": "file", "deleted": deleted})
+        else:
+            self._not_found()
+
+    def do_POST(self):
+        route = self._route()
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+
+        if route == ["files"]:
+            self._upload_file(body)
+            return
+        request = json.loads(body or b"{}")
+        if route == ["chat", "completions"]:
+            self._chat_completion(request)
+        elif route == ["batches"]:
+            self._create_batch(request)
+        elif len(route) == 3 and route[0] == "batches" and route[2] == "cancel" and route[1] in self.state.batches:
+            batch = self.state.batches[route[1]]
+            batch["cancelled_at"] = batch["cancelled_at"] or int(time.time())
+            self._send_json(200, batch_status(batch, self.state))
+        else:
+            self._not_found()
+
+    def _upload_file(self, body: bytes):
+        # multipart/form-data with a "purpose" field and a "file" part
+        message = email.parser.BytesParser().parsebytes(
+            b"Content-Type: " + self.headers.get("Content-Type", "").encode() + b"\r\n\r\n" + body
+        )
+        fields = {}
+        for part in message.get_payload() if message.is_multipart() else []:
+            name = part.get_param("name", header="content-disposition")
+            fields[name] = (part.get_filename(), part.get_payload(decode=True))
+        if "file" not in fields:
+            self._send_json(400, {"error": {"message": "Missing file", "type": "invalid_request_error"}})
+            return
+        filename, content = fields["file"]
+        purpose = fields.get("purpose", (None, b"batch"))[1].decode()
+        self._send_json(200, self.state.add_file(filename or "upload.jsonl", purpose, content))
+
+    def _create_batch(self, request: Dict[str, Any]):
+        state = self.state
+        input_file = state.files.get(request.get("input_file_id"))
+        if input_file is None:
+            self._send_json(404, {"error": {"message": "No such input file", "type": "invalid_request_error"}})
+            return
+
+        outputs, errors = [], []
+        for line in input_file[1].decode().splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            with state.lock:
+                roll = state.rng.random()
+                seed = state.rng.getrandbits(32)
+            state.count(requests=1)
+            result = {"id": f"batch_req_{uuid.uuid4().hex[:24]}", "custom_id": item["custom_id"]}
+            if roll < state.rate_429 + state.rate_500:
+                state.count(server_errors=1)
+                errors.append(dict(result, response=None, error={"code": "server_error", "message": "Request failed (stub)"}))
+            else:
+                body = completion_payload(item["body"], state, random.Random(seed))
+                outputs.append(dict(result, response={"status_code": 200, "request_id": uuid.uuid4().hex, "body": body}, error=None))
+
+        def jsonl(lines: List[Dict[str, Any]]) -> bytes:
+            return "".join(json.dumps(line) + "\n" for line in lines).encode()
+
+        created = int(time.time())
+        batch = {
+            "id": f"batch_stub_{uuid.uuid4().hex[:24]}",
+            "object": "batch",
+            "endpoint": request.get("endpoint", "/v1/chat/completions"),
+            "errors": None,
+            "input_file_id": request["input_file_id"],
+            "completion_window": request.get("completion_window", "24h"),
+            "output_file_id": state.add_file("batch_output.jsonl", "batch_output", jsonl(outputs))["id"],
+            "error_file_id": state.add_file("batch_errors.jsonl", "batch_output", jsonl(errors))["id"] if errors else None,
+            "created_at": created,
+            "expires_at": created + 24 * 3600,
+            "cancelled_at": None,
+            "request_counts": {"total": len(outputs) + len(errors), "completed": len(outputs), "failed": len(errors)},
+            "metadata": request.get("metadata")
+        }
+        with state.lock:
+            state.batches[batch["id"]] = batch
+        state.count(batches=1)
+        self._send_json(200, batch_status(batch, state))
+
+    def _chat_completion(self, request: Dict[str, Any]):
+        state = self.state
+        with state.lock:
+            roll = state.rng.random()
+            delay = state.latency.sample(state.rng)
+            seed = state.rng.getrandbits(32)
+        state.count(requests=1)
+        time.sleep(delay)
+
+        if roll < state.rate_429:
+            state.count(rate_limited=1)
+            self._send_json(429, {"error": {"message": "Rate limit reached (stub)", "type": "rate_limit_error"}}, {"Retry-After": "1"})
+            return
+        if roll < state.rate_429 + state.rate_500:
+            state.count(server_errors=1)
+            self._send_json(500, {"error": {"message": "Internal server error (stub)", "type": "server_error"}})
+            return
+
+        self._send_json(200, completion_payload(request, state, random.Random(seed)))
+
+
+def completion_payload(request: Dict[str, Any], state: StubState, rng: random.Random) -> Dict[str, Any]:
+    """OpenAI chat.completion object answering `request`"""
+    messages = request.get("messages", [])
+    prompt = messages[-1]["content"] if messages else ""
+    if isinstance(prompt, list):
+        prompt = "".join(part.get("text", "") for part in prompt)
+    content = json.dumps({"conversation": build_conversation(prompt, rng)})
+
+    prompt_tokens = state.prompt_tokens or max(1, len(prompt) // 4)
+    completion_tokens = state.completion_tokens or max(1, len(content) // 4)
+    if state.prefix_cache:
+        cached_tokens = min(prompt_tokens, state.cached_prefix_chars(prompt) // 4)
+    else:
+        cached_tokens = int(prompt_tokens * state.cached_fraction)
+    state.count(ok=1, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+    return {
+        "id": f"chatcmpl-stub-{uuid.uuid4().hex[:24]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": request.get("model", "stub"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content, "refusal": None},
+            "finish_reason": "stop"
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": cached_tokens}
+        }
+    }
+
+
+def batch_status(batch: Dict[str, Any], state: StubState) -> Dict[str, Any]:
+    """batch object as OpenAI reports it at this moment: in_progress until batch_delay has passed"""
+    done_at = batch["created_at"] + state.batch_delay
+    finished = time.time() >= done_at
+    if batch["cancelled_at"] and not finished:
+        status = "cancelled"
+    else:
+        status = "completed" if finished else "in_progress"
+    counts = batch["request_counts"]
+    return dict(
+        batch,
+        status=status,
+        in_progress_at=batch["created_at"],
+        finalizing_at=int(done_at) if finished else None,
+        completed_at=int(done_at) if status == "completed" else None,
+        failed_at=None,
+        expired_at=None,
+        cancelling_at=batch["cancelled_at"],
+        output_file_id=batch["output_file_id"] if status == "completed" else None,
+        error_file_id=batch["error_file_id"] if status == "completed" else None,
+        request_counts=counts if finished else {"total": counts["total"], "completed": 0, "failed": 0}
+    )
+
+
+def make_server(args: argparse.Namespace) -> ThreadingHTTPServer:
+    handler = type("BoundStubHandler", (StubHandler,), {"state": StubState(args)})
+    server = ThreadingHTTPServer((args.host, args.port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Offline OpenAI-compatible stand-in for throughput testing")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to bind")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on")
+    parser.add_argument("--latency", default="constant:0", help="constant:S, uniform:A,B or lognormal:MEDIAN,SIGMA (seconds)")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--rate-500", type=float, default=0.0, help="Fraction of requests answered with 500")
+    parser.add_argument("--prompt-tokens", type=int, default=0, help="Reported prompt tokens (default: characters / 4)")
+    parser.add_argument("--completion-tokens", type=int, default=0, help="Reported completion tokens (default: characters / 4)")
+    parser.add_argument("--cached-fraction", type=float, default=0.0, help="Share of prompt tokens reported as cached")
+    parser.add_argument("--prefix-cache", action="store_true", help="Report cached tokens for prompt prefixes seen before instead of --cached-fraction")
+    parser.add_argument("--batch-delay", type=float, default=0.0, help="Seconds before a submitted batch reports completed")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for reproducible runs")
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    server = make_server(args)
+    print(f"Stub OpenAI backend listening on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
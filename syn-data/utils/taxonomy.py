@@ -0,0 +1,119 @@
+import hashlib
+import json
+import os
+import pickle
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import yaml
+
+from utils.request_types import DEFAULT_REQUEST_TYPE, REQUEST_TYPE_KEYWORDS, classify_request
+
+TAXONOMY_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "taxonomy.yaml")
+TAXONOMY_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "syn-data", "taxonomy")
+# bump when TaxonomyIndex changes shape so stale pickles are rebuilt
+INDEX_VERSION = 1
+# the index stores classify_request labels, so a pickle built with other keywords is stale too
+_CACHE_VERSION = (INDEX_VERSION, hashlib.sha1(json.dumps([REQUEST_TYPE_KEYWORDS, DEFAULT_REQUEST_TYPE]).encode("utf-8")).hexdigest())
+
+# libyaml loader when PyYAML was built with it, the pure-Python one otherwise
+_Loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+_memo: Dict[str, Tuple[Tuple[int, int], "TaxonomyIndex"]] = {}
+_memo_lock = threading.Lock()
+
+
+class TaxonomyIndex:
+    """
+    taxonomy.yaml parsed once, with the lookups the generators need precomputed:
+    intent -> seeds, seed -> intent, seed -> request type and seed -> stable seed id.
+    a seed listed under several intents belongs to the first one.
+    """
+
+    def __init__(self, intents: List[Dict[str, Any]], content_hash: str):
+        self.intents = intents
+        self.content_hash = content_hash
+        self.seeds_by_intent: Dict[str, List[str]] = {}
+        self.intent_of: Dict[str, str] = {}
+        self.request_type_of: Dict[str, str] = {}
+        self.seed_ids: Dict[str, str] = {}
+
+        for intent in intents:
+            seeds = self.seeds_by_intent.setdefault(intent["intent"], [])
+            for seed in intent["seed_questions"]:
+                if seed in self.intent_of:
+                    continue
+                seeds.append(seed)
+                self.intent_of[seed] = intent["intent"]
+                self.request_type_of[seed] = classify_request(seed)
+                self.seed_ids[seed] = hashlib.sha1(seed.encode("utf-8")).hexdigest()[:12]
+
+    @property
+    def seeds(self) -> List[str]:
+        return list(self.intent_of)
+
+
+def _cache_path(file_path: str) -> str:
+    name = hashlib.sha1(file_path.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(TAXONOMY_CACHE_DIR, f"{name}.pickle")
+
+
+def _read_cache(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, 'rb') as f:
+            cached = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        return None
+    return cached if isinstance(cached, dict) and cached.get("version") == _CACHE_VERSION else None
+
+
+def _write_cache(path: str, mtime_ns: int, index: TaxonomyIndex):
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({"version": _CACHE_VERSION, "mtime_ns": mtime_ns, "index": index}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except OSError:
+        # a read-only home only costs a re-parse next time
+        pass
+
+
+def taxonomy_index(file_path: str = TAXONOMY_FILE) -> TaxonomyIndex:
+    """
+    the index for a taxonomy file, memoized in-process on (mtime, size) and cached on disk.
+    the disk cache is trusted while the file's mtime is unchanged; after a touch the content hash
+    decides whether the yaml has to be parsed again.
+    args: file_path: taxonomy yaml, syn-data/taxonomy.yaml by default
+    returns: TaxonomyIndex
+    """
+    file_path = os.path.abspath(file_path)
+    stat = os.stat(file_path)
+    key = (stat.st_mtime_ns, stat.st_size)
+
+    with _memo_lock:
+        memoized = _memo.get(file_path)
+        if memoized and memoized[0] == key:
+            return memoized[1]
+
+        cache_path = _cache_path(file_path)
+        cached = _read_cache(cache_path)
+        if cached and cached["mtime_ns"] == stat.st_mtime_ns:
+            index = cached["index"]
+        else:
+            with open(file_path, 'rb') as f:
+                content = f.read()
+            content_hash = hashlib.sha256(content).hexdigest()
+            if cached and cached["index"].content_hash == content_hash:
+                index = cached["index"]
+            else:
+                index = TaxonomyIndex(yaml.load(content, Loader=_Loader), content_hash)
+            _write_cache(cache_path, stat.st_mtime_ns, index)
+
+        _memo[file_path] = (key, index)
+        return index
+
+
+def load_taxonomy(file_path: str = TAXONOMY_FILE) -> List[Dict[str, Any]]:
+    """the parsed taxonomy: [{"intent", "seed_questions", ...}, ...]"""
+    return taxonomy_index(file_path).intents
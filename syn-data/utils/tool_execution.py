@@ -0,0 +1,326 @@
+"""
+offline post-processor filling in the tool results of already generated conversations. it is not
+part of generation: the generators have the model write whole conversations, tool results included,
+and this runs over their output files afterwards.
+
+every assistant turn's tool_calls are run against simulated tools built on TOOL_RESPONSE_FORMATS.
+by default only results the model left out are filled in: a call with no result in the following
+"tool" turn gets one, and a tool turn is added where the model went straight to the next assistant
+turn. results are shaped by the call's arguments so they match what the assistant asked for:
+FindCatalogTool and KnowledgeSearchTool look the queries up in the fixture catalog and knowledge
+base (utils/fixture_search.py), the other tools fill in their format.
+
+with --replace-uncited, results the model did write are replaced as well unless a later assistant
+turn cites them (see is_cited). those turns were written from the model's own results and the check
+is lexical, so a follow-up can disagree with a replaced result; spot-check the output before
+training on it.
+
+run it over an existing JSONL file from the syn-data directory:
+
+    python -m utils.tool_execution data/single_turn/conversations.jsonl --output data/single_turn/executed.jsonl
+"""
+import argparse
+import json
+import random
+import re
+from collections import Counter
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set
+
+from tool_response_formats import TOOL_RESPONSE_FORMATS, ToolResponseFormats
+from utils.fixture_search import fixture_index
+from utils.writer import ConversationWriter, iter_conversations
+
+# the tool that ends a turn; it answers the user rather than returning data to the assistant
+FINAL_TOOL = "RespondToUserTool"
+FAILED_STATUSES = frozenset(("failed", "failure", "error", "timeout"))
+_QUERY_KEYS = ("queries", "query", "search_query", "question", "search_term", "keywords", "url", "urls")
+_WORD = re.compile(r"[A-Za-z0-9]+")
+_TERM = re.compile(r"[a-z0-9]+(?:-[a-z0-9]+)*")
+
+# simulated tool: (tool args, rng) -> tool_result
+SimulatedTool = Callable[[Dict[str, Any], random.Random], Dict[str, Any]]
+
+
+def tool_queries(args: Any) -> List[str]:
+    """the search strings of a call's args: `queries` or the first other query-like field, else the first string value"""
+    if not isinstance(args, dict):
+        return []
+    for key in _QUERY_KEYS:
+        value = args.get(key)
+        if isinstance(value, str) and value:
+            return [value]
+        if isinstance(value, list):
+            strings = [item for item in value if isinstance(item, str) and item]
+            if strings:
+                return strings
+    return [value for value in args.values() if isinstance(value, str) and value][:1]
+
+
+def _title(query: str) -> str:
+    return " ".join(word.capitalize() for word in _WORD.findall(query)[:6]) or "General Information"
+
+
+def _knowledge_search(args: Dict[str, Any], rng: random.Random) -> Dict[str, Any]:
+    result = ToolResponseFormats.knowledge_search_tool_response(rng)
+    template = result["results"]["topic_responses"][0]
+    index = fixture_index()
+    responses = []
+    seen = set()
+    for query in tool_queries(args)[:3] or [""]:
+        articles = index.search_knowledge(query)
+        if articles:
+            # each query answers with its best article, once per result
+            if articles[0]["title"] not in seen:
+                seen.add(articles[0]["title"])
+                responses.append({
+                    "answer": {"summary": articles[0]["summary"], "title": articles[0]["title"]},
+                    "chunks": [{"title": articles[0]["file"], "url": ""}]
+                })
+            continue
+        # nothing in the fixture knowledge base: the format's answer, titled after the query
+        title = _title(query)
+        responses.append({
+            "answer": {
+                "summary": f"{title}: {template['answer']['summary']}" if query else template["answer"]["summary"],
+                "title": title
+            },
+            "chunks": [{"title": f"{title.replace(' ', '_')}_{rng.randint(1, 100)}.pdf", "url": ""}]
+        })
+    result["results"]["topic_responses"] = responses
+    return result
+
+
+def _catalog_item(item: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "item_id": item["item_id"],
+        "workspace_id": "8",
+        "item_name": item["item_name"],
+        "category": item.get("category", ""),
+        "category_type": "UNKNOWN",
+        "preamble": f"We've found the {item['item_name']} in our catalog, would you like to raise a request to access it?",
+        "description": item.get("description", ""),
+        "llm_description": f"The {item['item_name']} catalog item: {item.get('description', '')}. Raise a request from the catalog to get it.",
+        "tags": list(item.get("tags", []))
+    }
+
+
+def _find_catalog(args: Dict[str, Any], rng: random.Random) -> Dict[str, Any]:
+    queries = tool_queries(args)
+    index = fixture_index()
+    items: Dict[str, Dict[str, Any]] = {}
+    for query in queries[:3]:
+        for item in index.search_catalog(query):
+            items.setdefault(item["item_id"], item)
+    if items:
+        return {"results": [_catalog_item(item) for item in list(items.values())[:3]]}
+
+    # nothing in the fixture catalog: the format's item, named after the query
+    result = ToolResponseFormats.find_catalog_tool_response(rng)
+    if queries:
+        item = result["results"][0]
+        item_name = _title(queries[0])
+        item["item_name"] = item_name
+        item["preamble"] = f"We've found the {item_name} in our catalog, would you like to raise a request to access it?"
+        item["description"] = f"Service for {item_name.lower()} with secure access and support"
+        item["llm_description"] = f"The {item_name} service provides secure access and support. This service ensures reliable connectivity and proper setup for your needs."
+        item["tags"] = [word.lower() for word in _WORD.findall(queries[0])[:4]] or item["tags"]
+    return result
+
+
+def _request_list(format_fn: Callable[..., Dict[str, Any]]) -> SimulatedTool:
+    def simulate(args: Dict[str, Any], rng: random.Random) -> Dict[str, Any]:
+        result = format_fn(rng)
+        response = result["response"]
+        queries = tool_queries(args)
+        if queries:
+            for row in response["data"]:
+                row["subject"] = _title(queries[0])
+        response["total_count"] = len(response["data"])
+        return result
+    return simulate
+
+
+def _respond_to_user(args: Dict[str, Any], rng: random.Random) -> Dict[str, Any]:
+    result = ToolResponseFormats.respond_to_user_tool_response(rng)
+    if isinstance(args, dict) and isinstance(args.get("response"), str):
+        result["results"]["response"] = args["response"]
+    return result
+
+
+def _web_search(args: Dict[str, Any], rng: random.Random) -> Dict[str, Any]:
+    result = ToolResponseFormats.tavily_tool_response(rng)
+    queries = tool_queries(args)
+    if queries:
+        result["search_results"] = [
+            {"url": f"https://support.apple.com/help/{'-'.join(_WORD.findall(query.lower())[:6])}", "text": f"Detailed information about {query}"}
+            for query in queries[:3]
+        ]
+    return result
+
+
+def _browser(args: Dict[str, Any], rng: random.Random) -> Dict[str, Any]:
+    result = ToolResponseFormats.browser_tool_response(rng)
+    queries = tool_queries(args)
+    if queries:
+        lines = [f"{n}. URL: {query if query.startswith('http') else 'https://example.com/help'} Data from the website: Helpful information about {query}" for n, query in enumerate(queries[:3], 1)]
+        result["results"] = "Data from various websites: \n" + "\n".join(lines) + "\n"
+    return result
+
+
+SIMULATED_TOOLS: Dict[str, SimulatedTool] = {
+    "KnowledgeSearchTool": _knowledge_search,
+    "FindCatalogTool": _find_catalog,
+    "MyRequestsTool": _request_list(ToolResponseFormats.my_requests_tool_response),
+    "MyPendingApprovalsTool": _request_list(ToolResponseFormats.my_pending_approvals_tool_response),
+    "RespondToUserTool": _respond_to_user,
+    "TavilyTool": _web_search,
+    "BrowserTool": _browser,
+}
+# the remaining formats take no arguments into account
+for _tool, _format in TOOL_RESPONSE_FORMATS.items():
+    SIMULATED_TOOLS.setdefault(_tool, lambda args, rng, _format=_format: _format(rng))
+
+
+def run_tool_call(tool: str, args: Any, rng: random.Random) -> Dict[str, Any]:
+    """result of one call; tools without a simulator (and without a response format) just report success"""
+    simulate = SIMULATED_TOOLS.get(tool)
+    if simulate is None:
+        return {"execution_status": "success"}
+    return simulate(args if isinstance(args, dict) else {}, rng)
+
+
+def is_failure(result: Any) -> bool:
+    """whether a tool_result reports a failed call, e.g. the timeouts of tool_failure_retry"""
+    if not isinstance(result, dict):
+        return False
+    status = result.get("execution_status", result.get("status"))
+    return "error" in result or result.get("success") is False or (isinstance(status, str) and status.lower() in FAILED_STATUSES)
+
+
+def _string_values(value: Any) -> Iterator[str]:
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from _string_values(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from _string_values(item)
+
+
+def _terms(text: str) -> Set[str]:
+    return set(_TERM.findall(text.lower()))
+
+
+def _turn_text(turn: Dict[str, Any]) -> str:
+    content = turn.get("content")
+    return content if isinstance(content, str) else json.dumps(content, ensure_ascii=False)
+
+
+def is_cited(result: Any, context_terms: Set[str], later_terms: Set[str]) -> bool:
+    """
+    whether later turns may rely on `result`: a distinctive term of its values (five or more
+    characters, or with a digit, e.g. "hr-104") that the conversation before it does not contain
+    shows up in a later assistant turn. a result with no such term at all, e.g. an empty request
+    list, counts as cited too, since a later turn can rely on what it did not return.
+    """
+    distinctive = {term for text in _string_values(result) for term in _terms(text)
+                   if len(term) >= 5 or any(char.isdigit() for char in term)} - context_terms
+    return not distinctive or not distinctive.isdisjoint(later_terms)
+
+
+def _executed_results(tool_calls: List[Any], previous: Any, rng: random.Random, replace_uncited: bool, keep_failures: bool,
+                      context_terms: Set[str], later_terms: Set[str], stats: Counter) -> List[Dict[str, Any]]:
+    results = []
+    calls = [call for call in tool_calls if isinstance(call, dict) and call.get("tool") != FINAL_TOOL]
+    for position, call in enumerate(calls):
+        earlier = previous[position] if isinstance(previous, list) and position < len(previous) else None
+        if isinstance(earlier, dict) and earlier.get("tool_name") == call.get("tool"):
+            if not replace_uncited:
+                stats["kept_written"] += 1
+                results.append(earlier)
+                continue
+            if keep_failures and is_failure(earlier.get("tool_result")):
+                stats["kept_failed"] += 1
+                results.append(earlier)
+                continue
+            if is_cited(earlier.get("tool_result"), context_terms, later_terms):
+                # the model already answered from this result; replacing it would contradict the answer
+                stats["kept_cited"] += 1
+                results.append(earlier)
+                continue
+        stats["simulated"] += 1
+        args = call.get("args", {})
+        results.append({"tool_name": call.get("tool"), "tool_args": args, "tool_result": run_tool_call(call.get("tool"), args, rng)})
+    return results
+
+
+def execute_tool_calls(conversation: List[Dict[str, Any]], rng: Optional[random.Random] = None, replace_uncited: bool = False,
+                       keep_failures: bool = True, stats: Optional[Counter] = None) -> List[Dict[str, Any]]:
+    """
+    fills in the tool results a generated conversation is missing with simulated ones
+    args:
+        conversation: list of {"role", "content"} turns; not modified
+        rng: random source for the simulated ids and file names, e.g. seeded per conversation so a
+            rerun writes the same results
+        replace_uncited: also replace results the model wrote, unless a later assistant turn cites
+            them (see is_cited). the later turns were written from the model's results, so a
+            replaced result can still contradict them
+        keep_failures: with replace_uncited, keep results the model wrote as failures (see
+            is_failure), which the failure/retry conversations are built around
+        stats: Counter to add "simulated", "kept_written", "kept_cited" and "kept_failed" result counts to
+    returns: the conversation with each tool turn after an assistant turn's tool_calls holding that
+        call list's results; a tool turn is added where an assistant turn with calls is followed
+        directly by another assistant turn. tool turns with plain string content are left alone.
+    """
+    rng = rng or random.Random()
+    stats = stats if stats is not None else Counter()
+    texts = [_turn_text(turn) for turn in conversation]
+    # terms of the assistant turns from each position on
+    later_terms: List[Set[str]] = [set() for _ in range(len(conversation) + 1)]
+    for position in range(len(conversation) - 1, -1, -1):
+        later_terms[position] = later_terms[position + 1]
+        if conversation[position].get("role") == "assistant":
+            later_terms[position] = later_terms[position] | _terms(texts[position])
+
+    executed = []
+    context_terms: Set[str] = set()
+    for position, turn in enumerate(conversation):
+        previous = executed[-1] if executed else None
+        content = turn.get("content")
+        if (turn.get("role") == "tool" and previous is not None and previous.get("role") == "assistant"
+                and isinstance(previous.get("content"), dict) and not isinstance(content, str)):
+            results = _executed_results(previous["content"].get("tool_calls") or [], content, rng, replace_uncited, keep_failures,
+                                        context_terms, later_terms[position + 1], stats)
+            executed.append(dict(turn, content=results) if results else turn)
+        else:
+            if (turn.get("role") == "assistant" and previous is not None and previous.get("role") == "assistant"
+                    and isinstance(previous.get("content"), dict)):
+                results = _executed_results(previous["content"].get("tool_calls") or [], None, rng, replace_uncited, keep_failures,
+                                            context_terms, later_terms[position], stats)
+                if results:
+                    executed.append({"role": "tool", "content": results})
+            executed.append(turn)
+        context_terms |= _terms(texts[position])
+    return executed
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Fill in the tool results missing from generated conversations with locally simulated ones")
+    parser.add_argument("input", help="Conversation JSONL file")
+    parser.add_argument("--output", required=True, help="JSONL file to write")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the simulated ids and file names")
+    parser.add_argument("--replace-uncited", action="store_true", help="Also replace model-written results no later assistant turn cites; may contradict those turns")
+    parser.add_argument("--replace-failures", action="store_true", help="With --replace-uncited, also replace results the model wrote as failures")
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    rng = random.Random(args.seed)
+    stats = Counter()
+    with ConversationWriter(args.output, fsync_every=1000) as writer:
+        for conversation in iter_conversations(args.input):
+            writer.write(execute_tool_calls(conversation, rng, replace_uncited=args.replace_uncited, keep_failures=not args.replace_failures, stats=stats))
+    print(f"Executed the tool calls of {writer.count} conversations")
+    print(f"Tool results: {stats['simulated']} simulated, {stats['kept_written']} kept as written, {stats['kept_cited']} kept as cited by later turns, {stats['kept_failed']} failures kept")
@@ -0,0 +1,177 @@
+import re
+from typing import Any, Callable, Collection, Dict, Iterable, List, NamedTuple, Optional
+
+from utils.schema import RESPONSE_SCHEMA
+
+# returns None for a valid value, otherwise the path below the value and what is wrong with it,
+# e.g. ".tool_calls[0].args: expected object"
+Check = Callable[[Any], Optional[str]]
+
+_TYPES = {
+    "object": (dict,),
+    "array": (list,),
+    "string": (str,),
+    "integer": (int,),
+    "number": (int, float),
+    "boolean": (bool,),
+    "null": (type(None),),
+}
+_ANNOTATIONS = {"description", "title", "examples", "default", "$comment"}
+_SUPPORTED = {"type", "properties", "required", "additionalProperties", "items", "minItems", "maxItems", "minLength", "enum"}
+_INDEX = re.compile(r"\[\d+\]")
+
+
+def _type_check(expected: Any) -> Check:
+    names = [expected] if isinstance(expected, str) else list(expected)
+    types = tuple(t for name in names for t in _TYPES[name])
+    # bool is an int subclass but never a JSON number
+    allow_bool = "boolean" in names
+    message = f": expected {' or '.join(names)}"
+
+    def check(value):
+        if not isinstance(value, types) or (isinstance(value, bool) and not allow_bool):
+            return message
+    return check
+
+
+def _properties_check(properties: Dict[str, Check]) -> Check:
+    items = list(properties.items())
+
+    def check(value):
+        if isinstance(value, dict):
+            for name, check_property in items:
+                if name in value:
+                    error = check_property(value[name])
+                    if error:
+                        return f".{name}{error}"
+    return check
+
+
+def _required_check(required: List[str]) -> Check:
+    def check(value):
+        if isinstance(value, dict):
+            for name in required:
+                if name not in value:
+                    return f": missing {name}"
+    return check
+
+
+def _additional_check(allowed: Collection[str]) -> Check:
+    allowed = frozenset(allowed)
+
+    def check(value):
+        if isinstance(value, dict):
+            for name in value:
+                if name not in allowed:
+                    return f": unexpected {name}"
+    return check
+
+
+def _items_check(check_item: Check) -> Check:
+    def check(value):
+        if isinstance(value, list):
+            for index, item in enumerate(value):
+                error = check_item(item)
+                if error:
+                    return f"[{index}]{error}"
+    return check
+
+
+def _length_check(minimum: Optional[int], maximum: Optional[int], kind: type, noun: str) -> Check:
+    def check(value):
+        if isinstance(value, kind):
+            if minimum is not None and len(value) < minimum:
+                return f": fewer than {minimum} {noun}"
+            if maximum is not None and len(value) > maximum:
+                return f": more than {maximum} {noun}"
+    return check
+
+
+def compile_schema(schema: Dict[str, Any]) -> Check:
+    """
+    turns a JSON schema into a plain Python predicate, so validating a value is a handful of
+    isinstance calls instead of a walk over the schema dict. covers the keywords the agent output
+    schemas use (type, properties, required, additionalProperties: false, items, minItems, maxItems,
+    minLength, enum) and refuses anything else rather than silently ignoring it.
+    args:
+        schema: JSON schema dict, e.g. utils.schema.RESPONSE_SCHEMA
+    returns: check(value) -> None when valid, else "<path>: <problem>" relative to the value
+    """
+    unsupported = set(schema) - _SUPPORTED - _ANNOTATIONS
+    if unsupported:
+        raise ValueError(f"compile_schema does not support {sorted(unsupported)}")
+    additional = schema.get("additionalProperties", True)
+    if not isinstance(additional, bool):
+        raise ValueError("compile_schema only supports a boolean additionalProperties")
+
+    checks = []
+    if "type" in schema:
+        checks.append(_type_check(schema["type"]))
+    if "enum" in schema:
+        allowed = list(schema["enum"])
+        checks.append(lambda value: None if value in allowed else f": not one of {allowed}")
+    if "required" in schema:
+        checks.append(_required_check(list(schema["required"])))
+    if not additional:
+        checks.append(_additional_check(schema.get("properties", {})))
+    if "properties" in schema:
+        checks.append(_properties_check({name: compile_schema(sub) for name, sub in schema["properties"].items()}))
+    if "minItems" in schema or "maxItems" in schema:
+        checks.append(_length_check(schema.get("minItems"), schema.get("maxItems"), list, "items"))
+    if "minLength" in schema:
+        checks.append(_length_check(schema["minLength"], None, str, "characters"))
+    if "items" in schema:
+        checks.append(_items_check(compile_schema(schema["items"])))
+
+    if not checks:
+        return lambda value: None
+    if len(checks) == 1:
+        return checks[0]
+
+    def check_all(value):
+        for check in checks:
+            error = check(value)
+            if error:
+                return error
+    return check_all
+
+
+check_response = compile_schema(RESPONSE_SCHEMA)
+
+
+class TurnError(NamedTuple):
+    turn: int
+    error: str
+
+    @property
+    def reason(self) -> str:
+        """the error without list positions, so the same mistake in different turns counts as one reason"""
+        return _INDEX.sub("[]", self.error)
+
+
+def validate_assistant_turns(conversation: List[Dict[str, Any]], string_turns: Collection[int] = ()) -> List[TurnError]:
+    """
+    checks every assistant turn of a conversation against RESPONSE_SCHEMA
+    args:
+        conversation: list of {"role", "content"} turns
+        string_turns: positions of assistant turns that are plain strings on purpose, e.g. the faulty
+            JSON the assistant repairs in json_error; they are only checked to be strings
+    returns: one TurnError per failing turn, empty if the conversation is valid
+    """
+    errors = []
+    for position, turn in enumerate(conversation):
+        if turn.get("role") != "assistant":
+            continue
+        content = turn.get("content")
+        if position in string_turns:
+            error = None if isinstance(content, str) else ": expected string"
+        else:
+            error = check_response(content)
+        if error:
+            errors.append(TurnError(position, "$" + error))
+    return errors
+
+
+def validate_conversations(conversations: Iterable[List[Dict[str, Any]]], string_turns: Collection[int] = ()) -> List[List[TurnError]]:
+    """validate_assistant_turns over a batch of conversations of the same generator"""
+    return [validate_assistant_turns(conversation, string_turns) for conversation in conversations]
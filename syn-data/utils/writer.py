@@ -0,0 +1,128 @@
+import json
+import os
+from typing import Any, Dict, Iterator, List, Optional
+
+from utils.fingerprints import FingerprintStore, conversation_fingerprint
+
+
+def jsonl_path_for(output_file: str) -> str:
+    """path of the incremental JSONL file that backs a JSON output file"""
+    return os.path.splitext(output_file)[0] + ".jsonl"
+
+
+class ConversationWriter:
+    """
+    append-only JSONL writer, one conversation per line.
+    lines are flushed and fsynced every `fsync_every` conversations so a crash loses at most one
+    batch, and nothing is kept in memory apart from running counters.
+    with a `fingerprints` store, conversations any writer has written before are skipped; the writer
+    takes ownership of the store and commits it whenever the file is synced.
+    """
+
+    def __init__(self, path: str, fsync_every: int = 50, append: bool = False, fingerprints: Optional[FingerprintStore] = None):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fingerprints = fingerprints
+        self.count = 0
+        self.total_turns = 0
+        self._pending = 0
+
+        output_dir = os.path.dirname(path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        self._file = open(path, 'a' if append else 'w', encoding='utf-8')
+
+    def write(self, conversation: List[Dict[str, Any]], serialized: Optional[str] = None) -> bool:
+        """
+        appends `conversation`
+        args:
+            conversation: list of {"role", "content"} turns
+            serialized: the same conversation already encoded as a single JSON line, written as is
+        returns: False, without writing, if the fingerprint store has already seen the conversation
+        """
+        if self.fingerprints is not None and not self.fingerprints.add(conversation_fingerprint(conversation), self.path):
+            return False
+        self._file.write(serialized if serialized is not None else json.dumps(conversation, ensure_ascii=False))
+        self._file.write("\n")
+        self.count += 1
+        self.total_turns += len(conversation)
+        self._pending += 1
+        if self._pending >= self.fsync_every:
+            self.sync()
+        return True
+
+    def sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = 0
+        # after the lines, so a fingerprint never outlives a conversation lost in a crash
+        if self.fingerprints is not None:
+            self.fingerprints.commit()
+
+    def close(self):
+        if not self._file.closed:
+            self.sync()
+            self._file.close()
+            if self.fingerprints is not None:
+                self.fingerprints.close()
+
+    def __enter__(self) -> "ConversationWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def iter_conversations(path: str) -> Iterator[List[Dict[str, Any]]]:
+    """yields conversations from a JSONL file one at a time, skipping a torn trailing line"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                # a partially written last line after a crash
+                continue
+
+
+def export_json(jsonl_path: str, json_path: str, key: Optional[str] = "conversations") -> int:
+    """
+    streams a JSONL file into the pretty-printed `{"conversations": [...]}` layout
+    args:
+        jsonl_path: source written by ConversationWriter
+        json_path: destination JSON file
+        key: top-level key wrapping the list, or None to write a bare list
+    returns: number of conversations exported
+    """
+    output_dir = os.path.dirname(json_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    # same bytes json.dump(..., indent=2) would produce, written one conversation at a time
+    item_indent = "    " if key else "  "
+    count = 0
+    with open(json_path, 'w') as f:
+        f.write('{\n  "%s": [' % key if key else '[')
+        for conversation in iter_conversations(jsonl_path):
+            f.write(",\n" if count else "\n")
+            text = json.dumps(conversation, indent=2)
+            f.write(item_indent + text.replace("\n", "\n" + item_indent))
+            count += 1
+        if count:
+            f.write("\n" + item_indent[:-2])
+        f.write(']\n}' if key else ']')
+    return count
+
+
+def export_output(jsonl_path: str, output_path: str, key: Optional[str] = "conversations") -> int:
+    """
+    exports a JSONL file in the format `output_path` names: Parquet for .parquet (see
+    utils.parquet_output), the JSON layout of export_json otherwise
+    returns: number of conversations exported
+    """
+    if output_path.endswith(".parquet"):
+        from utils.parquet_output import export_parquet
+        return export_parquet(jsonl_path, output_path)
+    return export_json(jsonl_path, output_path, key=key)